@@ -3,18 +3,24 @@ from django.utils import timezone
 from import_export.admin import ExportActionModelAdmin
 from import_export.formats import base_formats
 
+from bot.exports import export_activity_xlsx, stream_activity_csv
 from bot.models import (
     Achievement,
+    ActivityRollup,
     Company,
+    CurrencyDaily,
+    CurrencyLatest,
     CurrencyRate,
     DailyStatistics,
     DailytTips,
     LevelTitle,
     Quote,
+    ScheduledJob,
     Season,
     SeasonRank,
     SiteStatistics,
     Tag,
+    UserAchievementCounter,
     UserActivity,
 )
 from bot.resources import UserActivityResource
@@ -43,6 +49,8 @@ class UserActivityAdmin(ExportActionModelAdmin):
     list_filter = ("username", "join_time")
     search_fields = ("username", "company__name")
     readonly_fields = ("get_spent_time", )
+    list_select_related = ("company",)
+    actions = ("export_csv_stream", "export_xlsx_stream")
 
     @admin.display(description="Общее время")
     def get_spent_time(self, obj):
@@ -53,6 +61,14 @@ class UserActivityAdmin(ExportActionModelAdmin):
         formats = (base_formats.XLS, base_formats.XLSX)
         return [f for f in formats if f().can_export()]
 
+    @admin.action(description="Выгрузить в CSV (потоково)")
+    def export_csv_stream(self, request, queryset):
+        return stream_activity_csv(queryset)
+
+    @admin.action(description="Выгрузить в XLSX")
+    def export_xlsx_stream(self, request, queryset):
+        return export_activity_xlsx(queryset)
+
     @admin.display(description="Пометить как покинувших организацию")
     def mark_as_left(self, request, queryset):
         queryset.update(leave_time=timezone.now())
@@ -87,6 +103,22 @@ class AchievementAdmin(admin.ModelAdmin):
     ordering = ("-achieved_at",)
 
 
+@admin.register(ScheduledJob)
+class ScheduledJobAdmin(admin.ModelAdmin):
+    list_display = ("job_id", "hour", "minute", "args",
+                    "last_run_at", "updated_at")
+    ordering = ("hour", "minute")
+
+
+@admin.register(UserAchievementCounter)
+class UserAchievementCounterAdmin(admin.ModelAdmin):
+    list_display = ("user_id", "username", "achievement_name",
+                    "count", "first_at", "last_at")
+    list_filter = ("achievement_name",)
+    search_fields = ("username", "achievement_name")
+    ordering = ("-last_at",)
+
+
 @admin.register(DailyStatistics)
 class DailyStatisticsAdmin(admin.ModelAdmin):
     list_display = ("id", "user_id", "username",
@@ -96,6 +128,16 @@ class DailyStatisticsAdmin(admin.ModelAdmin):
     ordering = ("-date",)
 
 
+@admin.register(ActivityRollup)
+class ActivityRollupAdmin(admin.ModelAdmin):
+    list_display = ("date", "user_id", "username", "company",
+                    "trips", "total_seconds", "experience")
+    list_filter = ("date",)
+    search_fields = ("username", "company__name")
+    ordering = ("-date",)
+    list_select_related = ("company",)
+
+
 @admin.register(Quote)
 class QuoteAdmin(admin.ModelAdmin):
     list_display = ("id", "author", "source",
@@ -226,6 +268,23 @@ class SeasonAdmin(admin.ModelAdmin):
         return "-"
 
 
+@admin.register(CurrencyLatest)
+class CurrencyLatestAdmin(admin.ModelAdmin):
+    list_display = ("currency", "rate", "date",
+                    "previous_rate", "previous_date")
+    ordering = ("currency",)
+
+
+@admin.register(CurrencyDaily)
+class CurrencyDailyAdmin(admin.ModelAdmin):
+    list_display = ("currency", "date", "open", "high", "low",
+                    "close", "samples")
+    list_filter = ("currency",)
+    ordering = ("-date", "currency")
+    date_hierarchy = "date"
+    list_per_page = 50
+
+
 @admin.register(CurrencyRate)
 class CurrencyRateAdmin(admin.ModelAdmin):
     list_display = ("currency", "get_currency_display_name", "rate", "date")
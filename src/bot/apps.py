@@ -7,3 +7,6 @@ class BotConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "bot"
     verbose_name = BOT_APP_VERBOSE
+
+    def ready(self):
+        from bot import signals
@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from bot.models import UserActivity
+
+
+class Command(BaseCommand):
+    help = ("Заполняет UserActivity.join_date (дата прибытия по МСК) "
+            "для записей, созданных до появления этого поля")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=5000,
+            help="Сколько записей обновлять за один bulk_update"
+        )
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Пересчитать join_date для всех записей, а не только пустых"
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        activities = UserActivity.objects.only("id", "join_time")
+        if not options["all"]:
+            activities = activities.filter(join_date__isnull=True)
+
+        total = activities.count()
+        if not total:
+            self.stdout.write(self.style.SUCCESS("Нечего заполнять."))
+            return
+
+        updated = 0
+        last_pk = 0
+        while True:
+            # Пачки по pk, а не iterator(): SQLite не изолирует чтение
+            # курсора от записи в ту же таблицу в рамках соединения.
+            batch = list(
+                activities.filter(pk__gt=last_pk).order_by("pk")[:chunk_size]
+            )
+            if not batch:
+                break
+            for activity in batch:
+                activity.join_date = timezone.localdate(activity.join_time)
+            updated += self._flush(batch)
+            last_pk = batch[-1].pk
+            self.stdout.write(f"Обновлено {updated}/{total}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово: join_date заполнен для {updated} записей."
+        ))
+
+    @staticmethod
+    def _flush(batch):
+        with transaction.atomic():
+            UserActivity.objects.bulk_update(batch, ["join_date"])
+        return len(batch)
@@ -0,0 +1,207 @@
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from datetime import timezone as dt_timezone
+from zoneinfo import ZoneInfo
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+from django.db.utils import ConnectionHandler
+
+from bot.models import Company, UserActivity
+
+MOSCOW_TZ = ZoneInfo("Europe/Moscow")
+DT_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+TABLE = UserActivity._meta.db_table
+
+CAST_DATE = "django_datetime_cast_date({}, 'Europe/Moscow', 'UTC')"
+
+
+def _utc(dt: datetime) -> str:
+    return dt.astimezone(dt_timezone.utc).strftime(DT_FORMAT)
+
+
+class Command(BaseCommand):
+    help = ("Сравнивает планы и время горячих запросов UserActivity "
+            "до и после индексов/join_date на синтетической таблице")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1_000_000)
+        parser.add_argument("--users", type=int, default=50)
+        parser.add_argument("--companies", type=int, default=500)
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        random.seed(options["seed"])
+        fd, path = tempfile.mkstemp(suffix=".sqlite3")
+        os.close(fd)
+        connection = ConnectionHandler({DEFAULT_DB_ALIAS: {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": path,
+        }})[DEFAULT_DB_ALIAS]
+        try:
+            connection.ensure_connection()
+            connection.connection.execute("PRAGMA journal_mode=WAL")
+            self._create_tables(connection)
+            today = self._populate(connection.connection, options)
+            self._run(connection, today, options["repeat"])
+        finally:
+            connection.close()
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+
+    @staticmethod
+    def _create_tables(connection):
+        """
+        Таблицы строятся по моделям, индексы Meta.indexes снимаются:
+        замер "до" идёт без них, "после" - с ними (см. _run).
+
+        atomic=False: transaction.atomic() ищет соединение по алиасу
+        в глобальном django.db.connections, то есть в рабочей базе.
+        """
+        with connection.schema_editor(atomic=False) as editor:
+            editor.create_model(Company)
+            editor.create_model(UserActivity)
+        with connection.schema_editor(atomic=False) as editor:
+            for index in UserActivity._meta.indexes:
+                editor.remove_index(UserActivity, index)
+
+    def _populate(self, conn, options) -> date:
+        rows, users = options["rows"], options["users"]
+        companies = options["companies"]
+        now = datetime.now(MOSCOW_TZ).replace(microsecond=0)
+        days = max(1, rows // (users * 4))
+        self.stdout.write(
+            f"Генерация {rows} строк ({users} пользователей, "
+            f"{days} дней истории)..."
+        )
+        started = time.perf_counter()
+        conn.execute("BEGIN")
+        conn.executemany(
+            f"INSERT INTO {Company._meta.db_table} (id, name) VALUES (?, ?)",
+            [(pk, f"Организация {pk}") for pk in range(1, companies + 1)],
+        )
+        batch = []
+        for _ in range(rows):
+            join = now - timedelta(
+                days=random.randrange(days),
+                minutes=random.randrange(8 * 60, 20 * 60))
+            leave = join + timedelta(minutes=random.randrange(5, 240))
+            batch.append((
+                random.randrange(users) + 1,
+                random.randrange(companies) + 1,
+                _utc(join),
+                _utc(leave),
+                join.date().isoformat(),
+            ))
+            if len(batch) >= 50_000:
+                self._insert(conn, batch)
+                batch = []
+        if batch:
+            self._insert(conn, batch)
+        for user_id in range(1, users + 1, 7):
+            self._insert(conn, [(user_id, 1, _utc(now), None,
+                                 now.date().isoformat())])
+        conn.execute("COMMIT")
+        self.stdout.write(
+            f"Готово за {time.perf_counter() - started:.1f} с.\n")
+        return now.date()
+
+    @staticmethod
+    def _insert(conn, batch):
+        conn.executemany(
+            f"INSERT INTO {TABLE} (user_id, company_id, join_time, "
+            "leave_time, join_date, edited, edit_count, experience_gained) "
+            "VALUES (?, ?, ?, ?, ?, 0, 0, 0)",
+            batch,
+        )
+
+    def _queries(self, today: date):
+        day_start = datetime.combine(today, datetime.min.time(), MOSCOW_TZ)
+        day_end = day_start + timedelta(days=1)
+        today_str = today.isoformat()
+        return [
+            (
+                "Открытая сессия пользователя",
+                f"SELECT id FROM {TABLE} "
+                "WHERE user_id = ? AND leave_time IS NULL",
+                (8,),
+                f"SELECT id FROM {TABLE} "
+                "WHERE user_id = ? AND leave_time IS NULL",
+                (8,),
+            ),
+            (
+                "Выезды за сегодня",
+                f"SELECT COUNT(*) FROM {TABLE} "
+                f"WHERE {CAST_DATE.format('join_time')} = ?",
+                (today_str,),
+                f"SELECT COUNT(*) FROM {TABLE} WHERE join_date = ?",
+                (today_str,),
+            ),
+            (
+                "Организация + день",
+                f"SELECT COUNT(*) FROM {TABLE} WHERE company_id = ? "
+                f"AND {CAST_DATE.format('join_time')} = ?",
+                (1, today_str),
+                f"SELECT COUNT(*) FROM {TABLE} "
+                "WHERE company_id = ? AND join_date = ?",
+                (1, today_str),
+            ),
+            (
+                "Пользователь + день",
+                f"SELECT COUNT(*) FROM {TABLE} WHERE user_id = ? "
+                f"AND {CAST_DATE.format('join_time')} = ?",
+                (1, today_str),
+                f"SELECT COUNT(*) FROM {TABLE} "
+                "WHERE user_id = ? AND join_date = ?",
+                (1, today_str),
+            ),
+            (
+                "Убывшие за сегодня",
+                f"SELECT SUM(id) FROM {TABLE} "
+                f"WHERE {CAST_DATE.format('leave_time')} = ?",
+                (today_str,),
+                f"SELECT SUM(id) FROM {TABLE} "
+                "WHERE leave_time >= ? AND leave_time < ?",
+                (_utc(day_start), _utc(day_end)),
+            ),
+        ]
+
+    def _run(self, connection, today: date, repeat: int):
+        conn = connection.connection
+        queries = self._queries(today)
+        before = [self._measure(conn, q[1], q[2], repeat) for q in queries]
+
+        self.stdout.write("Создание индексов...")
+        with connection.schema_editor(atomic=False) as editor:
+            for index in UserActivity._meta.indexes:
+                editor.add_index(UserActivity, index)
+        conn.execute("ANALYZE")
+        after = [self._measure(conn, q[3], q[4], repeat) for q in queries]
+
+        for (title, *_), old, new in zip(queries, before, after):
+            speedup = old[0] / new[0] if new[0] else float("inf")
+            self.stdout.write(self.style.MIGRATE_HEADING(f"\n{title}"))
+            self.stdout.write(f"  до:    {old[0]:9.2f} мс | {old[1]}")
+            self.stdout.write(f"  после: {new[0]:9.2f} мс | {new[1]}")
+            self.stdout.write(self.style.SUCCESS(
+                f"  ускорение: x{speedup:.1f}"))
+
+    @staticmethod
+    def _measure(conn, sql, params, repeat):
+        plan = "; ".join(
+            row[-1] for row in conn.execute(
+                f"EXPLAIN QUERY PLAN {sql}", params)
+        )
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            conn.execute(sql, params).fetchall()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings), plan
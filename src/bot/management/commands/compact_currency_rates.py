@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from bot.management.core.currency_utils import compact_currency_rates
+
+
+class Command(BaseCommand):
+    help = ("Сворачивает курсы CurrencyRate в дневные бары CurrencyDaily "
+            "(open/high/low/close) и удаляет старые сырые записи")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=30,
+            help="Хранить сырые курсы за последние N дней"
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=5000,
+            help="Размер пачки при записи баров и удалении курсов"
+        )
+
+    def handle(self, *args, **options):
+        if options["days"] < 1:
+            raise CommandError("--days должно быть положительным.")
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size должно быть положительным.")
+        written, deleted = compact_currency_rates(
+            keep_days=options["days"], chunk_size=options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Записано дневных баров: {written}, "
+            f"удалено сырых курсов: {deleted}."))
@@ -283,11 +283,8 @@ class Command(BaseCommand):
                     f"(Уровень {admin.level})"
                 )
 
-                await sync_to_async(Achievement.objects.create)(
-                    user_id=admin.user_id,
-                    username=username,
-                    achievement_name=achievement_name
-                )
+                await Achievement.create_achievement(
+                    admin.user_id, username, achievement_name)
 
             logger.info(
                 f"Награждены топ-3 выездных системных "
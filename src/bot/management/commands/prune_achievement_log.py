@@ -0,0 +1,36 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from bot.management.core.achievements import prune_achievement_log
+
+
+class Command(BaseCommand):
+    help = ("Удаляет старые строки журнала достижений. Счётчики "
+            "не меняются, но simulate_xp не увидит бонусов за удалённый "
+            "период, а rebuild_season_ranks откажется без --force")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=365,
+            help="Оставить журнал за последние N дней"
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=5000,
+            help="Сколько строк удалять за один запрос"
+        )
+
+    def handle(self, *args, **options):
+        if options["days"] < 1:
+            raise CommandError("--days должно быть положительным.")
+        before = timezone.now() - timedelta(days=options["days"])
+        deleted = prune_achievement_log(
+            before, chunk_size=options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Удалено строк журнала достижений до "
+            f"{timezone.localdate(before)}: {deleted}."))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from bot.management.core.achievements import (
+    IncompleteAchievementLog,
+    rebuild_achievement_counters,
+)
+
+
+class Command(BaseCommand):
+    help = ("Пересобирает счётчики достижений по журналу Achievement. "
+            "Отказывается, если журнал неполный (выключен или почищен "
+            "prune_achievement_log)")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help=("Пересобрать по неполному журналу, потеряв "
+                  "недостающие выдачи")
+        )
+
+    def handle(self, *args, **options):
+        try:
+            created = rebuild_achievement_counters(force=options["force"])
+        except IncompleteAchievementLog as e:
+            raise CommandError(
+                f"{e}. Пересборка потеряет эти выдачи; "
+                "запустите с --force, если это ожидаемо.")
+        self.stdout.write(self.style.SUCCESS(
+            f"Счётчики достижений пересобраны: {created} записей."))
@@ -0,0 +1,74 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+
+from bot.management.core.statistics import rebuild_activity_rollups
+from bot.models import UserActivity
+
+
+class Command(BaseCommand):
+    help = ("Заполняет или пересобирает сводку ActivityRollup "
+            "(день x пользователь x организация) за диапазон дат")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--from",
+            dest="date_from",
+            help="Начальная дата в формате YYYY-MM-DD"
+        )
+        parser.add_argument(
+            "--to",
+            dest="date_to",
+            help="Конечная дата включительно в формате YYYY-MM-DD"
+        )
+        parser.add_argument(
+            "--days",
+            type=int,
+            help="Пересобрать последние N дней, включая сегодня"
+        )
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Пересобрать всю историю выездов"
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=2000,
+            help="Размер пачки для iterator() и bulk_create"
+        )
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        date_to = self._parse(options["date_to"]) or today
+        if options["all"]:
+            date_from = UserActivity.objects.aggregate(
+                first=Min("join_date"))["first"] or date_to
+        elif options["days"]:
+            date_from = date_to - timedelta(days=options["days"] - 1)
+        else:
+            date_from = self._parse(options["date_from"]) or date_to
+        if date_from > date_to:
+            raise CommandError("Начальная дата позже конечной.")
+
+        self.stdout.write(f"Сводка за {date_from} - {date_to}...")
+        processed, created = rebuild_activity_rollups(
+            date_from,
+            date_to,
+            chunk_size=options["chunk_size"],
+            progress=lambda n: self.stdout.write(f"Прочитано выездов: {n}"),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово: {processed} выездов свёрнуто в {created} строк."
+        ))
+
+    @staticmethod
+    def _parse(value):
+        if not value:
+            return None
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            raise CommandError(f"Неверный формат даты: {value}")
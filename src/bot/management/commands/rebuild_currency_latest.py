@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from bot.management.core.currency_utils import rebuild_currency_latest
+
+
+class Command(BaseCommand):
+    help = ("Заполняет таблицу последних курсов (CurrencyLatest) "
+            "по истории CurrencyRate")
+
+    def handle(self, *args, **options):
+        count = rebuild_currency_latest()
+        self.stdout.write(self.style.SUCCESS(
+            f"Последние курсы пересобраны: {count} валют."))
@@ -0,0 +1,53 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from bot.management.core.statistics import rebuild_daily_statistics
+
+
+class Command(BaseCommand):
+    help = ("Пересобирает дневную статистику по завершённым выездам "
+            "за диапазон дат (по умолчанию - за сегодня)")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--from",
+            dest="date_from",
+            help="Начальная дата в формате YYYY-MM-DD"
+        )
+        parser.add_argument(
+            "--to",
+            dest="date_to",
+            help="Конечная дата включительно в формате YYYY-MM-DD"
+        )
+        parser.add_argument(
+            "--days",
+            type=int,
+            help="Пересобрать последние N дней, включая сегодня"
+        )
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        date_to = self._parse(options["date_to"]) or today
+        if options["days"]:
+            date_from = date_to - timedelta(days=options["days"] - 1)
+        else:
+            date_from = self._parse(options["date_from"]) or date_to
+        if date_from > date_to:
+            raise CommandError("Начальная дата позже конечной.")
+
+        created = rebuild_daily_statistics(date_from, date_to)
+        self.stdout.write(self.style.SUCCESS(
+            f"Статистика за {date_from} - {date_to} пересобрана: "
+            f"{created} записей."
+        ))
+
+    @staticmethod
+    def _parse(value):
+        if not value:
+            return None
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            raise CommandError(f"Неверный формат даты: {value}")
@@ -0,0 +1,129 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from bot.management.core.achievements import achievement_log_problem
+from bot.management.core.experience import replay_season_experience
+from bot.management.core.reference import get_level_ladder
+from bot.models import Season, SeasonRank
+
+RANK_FIELDS = ["username", "experience", "level", "level_title",
+               "total_time", "visits_count"]
+
+
+class Command(BaseCommand):
+    help = ("Пересчитывает SeasonRank сезона по истории UserActivity: "
+            "опыт, время, выезды и уровни (по умолчанию - активный сезон)")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--season",
+            type=int,
+            help="ID сезона (по умолчанию - активный)"
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только показать расхождения, ничего не записывая"
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=2000,
+            help="Размер пачки при чтении истории"
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help=("Записать ранги по неполному журналу достижений, "
+                  "занизив бонусы за недостающие выдачи")
+        )
+
+    def handle(self, *args, **options):
+        season = self._get_season(options["season"])
+        self.stdout.write(f"Сезон: {season} ({season.start_date} - "
+                          f"{season.end_date or 'сейчас'})")
+        problem = achievement_log_problem()
+        if problem and not (options["dry_run"] or options["force"]):
+            raise CommandError(
+                f"{problem}. Бонусы за достижения будут занижены; "
+                "запустите с --force, если это ожидаемо.")
+        if problem:
+            self.stdout.write(self.style.WARNING(
+                f"{problem}: бонусы за достижения будут занижены."))
+
+        totals = replay_season_experience(
+            season,
+            chunk_size=options["chunk_size"],
+            progress=lambda n: self.stdout.write(
+                f"Обработано выездов: {n}"),
+        )
+        ladder = get_level_ladder()
+        ranks = {r.user_id: r for r in SeasonRank.objects.filter(
+            season=season)}
+
+        changed, created = [], []
+        for user_id in sorted(set(ranks) | set(totals)):
+            result = totals.get(user_id)
+            rank = ranks.get(user_id)
+            if rank is None:
+                rank = SeasonRank(user_id=user_id, season=season)
+                created.append(rank)
+            before = self._snapshot(rank)
+
+            experience = result.experience if result else 0
+            title = ladder.for_experience(experience) or ladder.first()
+            if result and result.username:
+                rank.username = result.username
+            rank.experience = experience
+            rank.total_time = result.total_time if result else timedelta()
+            rank.visits_count = result.visits_count if result else 0
+            rank.level = title.level if title else 1
+            rank.level_title = title
+
+            after = self._snapshot(rank)
+            if before != after:
+                self._print_diff(rank, before, after)
+                if rank.pk:
+                    changed.append(rank)
+
+        if options["dry_run"]:
+            self.stdout.write(self.style.WARNING(
+                f"Пробный запуск: изменится {len(changed)}, "
+                f"будет создано {len(created)} рангов. Ничего не записано."
+            ))
+            return
+
+        with transaction.atomic():
+            SeasonRank.objects.bulk_update(
+                changed, RANK_FIELDS, batch_size=options["chunk_size"])
+            SeasonRank.objects.bulk_create(created)
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово: обновлено {len(changed)}, создано {len(created)} "
+            f"рангов из {len(ranks) + len(created)}."
+        ))
+
+    @staticmethod
+    def _get_season(season_id):
+        seasons = Season.objects.all()
+        season = (seasons.filter(pk=season_id).first() if season_id
+                  else seasons.filter(is_active=True).first())
+        if season is None:
+            raise CommandError("Сезон не найден.")
+        return season
+
+    @staticmethod
+    def _snapshot(rank):
+        return (rank.experience, rank.level, rank.total_time,
+                rank.visits_count)
+
+    def _print_diff(self, rank, before, after):
+        labels = ("опыт", "уровень", "время", "выезды")
+        changes = ", ".join(
+            f"{label} {old} -> {new}"
+            for label, old, new in zip(labels, before, after)
+            if old != new
+        )
+        name = f"@{rank.username}" if rank.username else rank.user_id
+        self.stdout.write(f"  {name}: {changes}")
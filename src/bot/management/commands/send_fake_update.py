@@ -0,0 +1,61 @@
+import json
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from bot.management.core.bot_constants import BotWebhookCfg
+from bot.webhook import make_fake_update
+
+
+class Command(BaseCommand):
+    help = ("Отправляет фейковое обновление Telegram на локальный webhook "
+            "(проверка режима webhook без Telegram)")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "text",
+            nargs="?",
+            default="/help",
+            help="Текст сообщения, по умолчанию /help"
+        )
+        parser.add_argument(
+            "--url",
+            default="http://127.0.0.1:8000" + BotWebhookCfg.PATH,
+            help="Адрес webhook"
+        )
+        parser.add_argument("--user-id", type=int, default=1)
+        parser.add_argument("--chat-id", type=int, default=1)
+        parser.add_argument("--update-id", type=int, default=1)
+        parser.add_argument(
+            "--secret",
+            default=None,
+            help="Секретный токен, по умолчанию TELEGRAM_WEBHOOK_SECRET"
+        )
+
+    def handle(self, *args, **options):
+        payload = make_fake_update(
+            options["text"],
+            update_id=options["update_id"],
+            user_id=options["user_id"],
+            chat_id=options["chat_id"],
+        )
+        secret = options["secret"]
+        if secret is None:
+            secret = settings.TELEGRAM_WEBHOOK_SECRET
+        try:
+            response = requests.post(
+                options["url"],
+                data=json.dumps(payload),
+                headers={
+                    "Content-Type": "application/json",
+                    "X-Telegram-Bot-Api-Secret-Token": secret,
+                },
+                timeout=10,
+            )
+        except requests.RequestException as e:
+            raise CommandError(f"Webhook недоступен: {e}")
+        if response.status_code != 200:
+            raise CommandError(f"Webhook ответил {response.status_code}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Обновление {options['update_id']} принято."))
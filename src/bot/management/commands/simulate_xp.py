@@ -0,0 +1,211 @@
+import json
+from collections import Counter
+from datetime import date
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+
+from bot.management.core.achievements import achievement_log_problem
+from bot.management.core.experience import (
+    ACHIEVEMENT_BONUSES,
+    REPLAYED_BONUSES,
+    iter_activity_history,
+)
+from bot.management.core.reference import get_active_season, get_level_ladder
+from bot.management.core.xp_vectorized import (
+    XPCurve,
+    bonus_vector,
+    calculate_experience_vectorized,
+)
+from bot.models import Season, UserActivity
+
+BASELINE = "current"
+# Бонусы, которые начисляются не при уходе (см. REPLAYED_BONUSES).
+NOT_REPLAYED = set(ACHIEVEMENT_BONUSES).difference(REPLAYED_BONUSES)
+
+
+class Command(BaseCommand):
+    help = ("Считает опыт по истории выездов (по умолчанию - активного "
+            "сезона) для альтернативных кривых и таблиц бонусов и "
+            "показывает распределение уровней")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--variants",
+            help=("JSON-файл со списком вариантов: "
+                  '[{"name": ..., "curve": {...}, "bonuses": {...}}]')
+        )
+        parser.add_argument(
+            "--season",
+            type=int,
+            help=("Ограничить историю датами сезона с этим ID "
+                  "(по умолчанию - активный сезон)")
+        )
+        parser.add_argument(
+            "--from",
+            dest="date_from",
+            help="Начальная дата в формате YYYY-MM-DD"
+        )
+        parser.add_argument(
+            "--to",
+            dest="date_to",
+            help="Конечная дата включительно в формате YYYY-MM-DD"
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=2000,
+            help="Размер пачки при чтении истории"
+        )
+
+    def handle(self, *args, **options):
+        variants = [(BASELINE, XPCurve())]
+        variants += self._load_variants(options["variants"])
+        bonus_names = self._bonus_names(variants)
+        date_from, date_to = self._get_range(options)
+        problem = achievement_log_problem()
+        if problem:
+            self.stdout.write(self.style.WARNING(
+                f"{problem}: бонусы за достижения будут занижены."))
+
+        history = self._load_history(
+            date_from, date_to, bonus_names, options["chunk_size"])
+        if history is None:
+            self.stdout.write(self.style.WARNING(
+                f"За {date_from} - {date_to} нет завершённых выездов."))
+            return
+        minutes, visits, users, earned = history
+        self.stdout.write(f"Выездов: {len(minutes)}, "
+                          f"пользователей: {users.max() + 1} "
+                          f"({date_from} - {date_to})")
+
+        ladder = get_level_ladder()
+        for name, curve in variants:
+            bonus_sums = earned @ bonus_vector(bonus_names, curve)
+            experience = calculate_experience_vectorized(
+                minutes, visits, bonus_sums, curve)
+            per_user = np.bincount(users, weights=experience)
+            self._report(name, experience, per_user.astype(np.int64), ladder)
+
+    @staticmethod
+    def _bonus_names(variants) -> list[str]:
+        """
+        Столбцы матрицы достижений: REPLAYED_BONUSES и все достижения,
+        которым варианты назначают бонус.
+        """
+        names = list(REPLAYED_BONUSES)
+        for _, curve in variants:
+            names += [name for name in curve.bonuses
+                      if name not in names and name not in NOT_REPLAYED]
+        return names
+
+    def _load_history(self, date_from, date_to, bonus_names, chunk_size):
+        """
+        Читает историю в плоские массивы: минуты, номер выезда за день,
+        индекс пользователя и матрицу (выезд x достижение) из bonus_names.
+        """
+        column = {name: i for i, name in enumerate(bonus_names)}
+        user_index: dict[int, int] = {}
+        minutes, visits, users, earned_rows = [], [], [], []
+        history = iter_activity_history(
+            date_from, date_to, chunk_size=chunk_size,
+            achievement_names=bonus_names)
+        for activity, earned, day_visits in history:
+            duration = activity.leave_time - activity.join_time
+            minutes.append(duration.total_seconds() / 60)
+            visits.append(day_visits)
+            users.append(user_index.setdefault(
+                activity.user_id, len(user_index)))
+            earned_rows.append([column[name] for name in earned])
+        if not minutes:
+            return None
+
+        earned = np.zeros((len(minutes), len(bonus_names)))
+        for row, columns in enumerate(earned_rows):
+            for col in columns:
+                earned[row, col] += 1
+        return (np.array(minutes), np.array(visits),
+                np.array(users, dtype=np.int64), earned)
+
+    def _report(self, name, experience, per_user, ladder):
+        levels = Counter()
+        for total in per_user.tolist():
+            title = ladder.for_experience(total) or ladder.first()
+            levels[title.level if title else 1] += 1
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f"\nВариант: {name}"))
+        self.stdout.write(
+            f"  Опыт: всего {int(experience.sum())}, "
+            f"за выезд в среднем {experience.mean():.1f}, "
+            f"на пользователя в среднем {per_user.mean():.1f}, "
+            f"медиана {np.median(per_user):.0f}, "
+            f"максимум {per_user.max()}"
+        )
+        self.stdout.write("  Уровень | Пользователей | Доля")
+        for level in sorted(levels):
+            share = levels[level] / len(per_user) * 100
+            self.stdout.write(
+                f"  {level:>7} | {levels[level]:>13} | {share:5.1f}%")
+
+    def _load_variants(self, path):
+        if not path:
+            return []
+        try:
+            with open(path, encoding="utf-8") as f:
+                raw = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Не удалось прочитать варианты: {e}")
+
+        variants = []
+        for i, item in enumerate(raw, start=1):
+            curve = dict(item.get("curve") or {})
+            if "segments" in curve:
+                curve["segments"] = tuple(
+                    tuple(segment) for segment in curve["segments"])
+            bonuses = item.get("bonuses") or {}
+            skipped = NOT_REPLAYED.intersection(bonuses)
+            if skipped:
+                raise CommandError(
+                    f"Вариант #{i}: бонусы {', '.join(sorted(skipped))} "
+                    "начисляются не при уходе и не моделируются.")
+            try:
+                variant = XPCurve().with_overrides(curve, bonuses)
+            except TypeError as e:
+                raise CommandError(f"Вариант #{i}: {e}")
+            variants.append((item.get("name") or f"variant-{i}", variant))
+        return variants
+
+    def _get_range(self, options):
+        if options["season"]:
+            try:
+                season = Season.objects.get(pk=options["season"])
+            except Season.DoesNotExist:
+                raise CommandError(f"Сезон {options['season']} не найден.")
+            return season.start_date, season.end_date or timezone.localdate()
+
+        if not options["date_from"] and not options["date_to"]:
+            season = get_active_season()
+            if season is None:
+                raise CommandError(
+                    "Нет активного сезона: укажите --season или --from/--to.")
+            return season.start_date, season.end_date or timezone.localdate()
+
+        date_to = self._parse(options["date_to"]) or timezone.localdate()
+        date_from = self._parse(options["date_from"]) or (
+            UserActivity.objects.aggregate(first=Min("join_date"))["first"]
+            or date_to
+        )
+        if date_from > date_to:
+            raise CommandError("Начальная дата позже конечной.")
+        return date_from, date_to
+
+    @staticmethod
+    def _parse(value):
+        if not value:
+            return None
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            raise CommandError(f"Неверный формат даты: {value}")
@@ -1,72 +1,96 @@
+import asyncio
 import logging
 import os
 import random
 import re
-import traceback
 from datetime import datetime, timedelta
 from datetime import timezone as dt_timezone
 from difflib import get_close_matches
+from typing import Optional
 from zoneinfo import ZoneInfo
 
-import aiohttp
 import pytz
 import telegram
-from apscheduler.jobstores.base import JobLookupError
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from asgiref.sync import sync_to_async
-from django.core.management.base import BaseCommand
-from django.db.models import Avg, F
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
 from django.utils import timezone
 from dotenv import load_dotenv
 from telegram import (
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
     KeyboardButton,
     ReplyKeyboardMarkup,
     ReplyKeyboardRemove,
     Update,
 )
 from telegram.ext import (
+    CallbackQueryHandler,
     CommandHandler,
     ContextTypes,
     ConversationHandler,
     MessageHandler,
     filters,
 )
+from telegram.helpers import escape_markdown
 
+from bot.management.core.achievements import announce_achievements
 from bot.management.core.bot_constants import (
-    BotAchievementsCfg,
+    BotCurrencyChartCfg,
     BotMessages,
     BotRemidersCfg,
     SiteCfg,
 )
 from bot.management.core.bot_instance import get_bot_application
+from bot.management.core.company_index import company_index
+from bot.management.core.currency_chart import send_currency_chart
 from bot.management.core.currency_utils import (
+    CURRENCY_CONFIG,
+    PERIOD_DAYS,
+    compact_currency_rates,
     fetch_currency_rates,
     save_currency_rates,
     send_currency_report,
 )
-from bot.management.core.experience import calculate_experience, get_level_info
+from bot.management.core.experience import get_level_info_many
+from bot.management.core.http import http_client
+from bot.management.core.leaderboard import season_leaderboard
+from bot.management.core.outbox import outbox, retry_after_seconds
+from bot.management.core.reference import get_active_season
+from bot.management.core.scheduler import (
+    clear_jobs,
+    register_job,
+    restore_jobs,
+    schedule_job,
+    scheduler,
+    unschedule_job,
+)
+from bot.management.core.sessions import active_sessions
 from bot.management.core.statistics import (
     get_daily_statistics,
     get_daily_statistics_message,
     has_any_trips_on_date,
-    update_daily_statistics,
 )
 from bot.management.core.utils import (
     create_progress_bar,
     get_time_declension,
-    normalize_duration_to_seconds,
     truncate_markdown_safe,
 )
-from bot.management.core.weather import get_weather
+from bot.management.core.weather import get_weather, weather_cache
 from bot.models import (
-    Achievement,
     Company,
     DailytTips,
-    LevelTitle,
-    Season,
     SeasonRank,
+    UserAchievementCounter,
     UserActivity,
 )
+from bot.services import (
+    FIRST_BLOOD,
+    ActiveSessionExists,
+    JoinService,
+    LeaveResult,
+    LeaveService,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -80,9 +104,9 @@ logging.basicConfig(
 JOIN_CO, SELECT_CO = range(2)
 
 VALID_COMPANY_NAME_PATTERN = re.compile(r"^[А-Яа-яЁёA-Za-z0-9\s\-]+$")
-
-
-scheduler = AsyncIOScheduler(timezone=ZoneInfo("Europe/Moscow"))
+LEAVE_CALLBACK_PREFIX = "leave:"
+TOP_DEFAULT = 10
+TOP_MAX = 50
 
 
 async def help(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -105,200 +129,6 @@ async def site(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         )
 
 
-async def check_achievements(
-    user_id: int,
-    username: str,
-    activity: UserActivity,
-    context: ContextTypes.DEFAULT_TYPE
-) -> list:
-    """Проверка и выдача достижений с оптимизированными запросами."""
-    try:
-        today = timezone.now().date()
-        join_time = timezone.localtime(activity.join_time)
-        leave_time = timezone.localtime(activity.leave_time)
-        duration = (leave_time - join_time).total_seconds()
-        new_achievements = []
-        formatted_achievements = []
-
-        user_stats = await sync_to_async(
-            lambda: {
-                "company_visits": UserActivity.objects.filter(
-                    user_id=user_id,
-                    company=activity.company
-                ).count(),
-
-                "same_day_users": UserActivity.objects.filter(
-                    company__name__iexact=activity.company.name,
-                    join_time__date=join_time.date()
-                ).values("user_id").distinct().count(),
-
-                "same_company_today": UserActivity.objects.filter(
-                    user_id=user_id,
-                    company=activity.company,
-                    join_time__date=today
-                ).count(),
-
-                "today_trips": UserActivity.objects.filter(
-                    user_id=user_id,
-                    join_time__date=today
-                ).count(),
-
-                "weekly_trips": UserActivity.objects.filter(
-                    user_id=user_id,
-                    join_time__gte=today - timedelta(days=today.weekday())
-                ).count(),
-
-                "avg_duration": UserActivity.objects.filter(
-                    user_id=user_id
-                ).annotate(
-                    duration=F("leave_time") - F("join_time")
-                ).aggregate(avg=Avg("duration"))["avg"]
-            }
-        )()
-
-        if user_stats["company_visits"] == 1:
-            first_visit_achievements = [
-                "🏕️ Я здесь впервые, правда же?",
-                "🌱 Первый визит в компанию!",
-                "👣 Следы первого посещения",
-                "🎯 Дебют в компании состоялся!",
-                "🆕 Новенький в этих краях",
-                "🚩 Первая вылазка в данную локацию",
-                "📌 Точка отсчета моего пути здесь"
-            ]
-            new_achievements.append(random.choice(first_visit_achievements))
-
-        if user_stats["same_company_today"] > 1:
-            revisit_achievements = [
-                "🔄 Дежавю: Снова здесь!",
-                "♻️ Экономлю на пропуске",
-                "📌 Постоянный клиент дня",
-                "🏃 Реверс-раунд: Туда и обратно",
-                "🔄 Повторение - мать учения"
-            ]
-            new_achievements.append(random.choice(revisit_achievements))
-
-        if user_stats["same_day_users"] >= 2:
-            new_achievements.append("👥 Командный игрок")
-
-        if user_stats["today_trips"] > 3:
-            new_achievements.append("🔁 А можно мне ещё выезд?")
-
-        if user_stats["weekly_trips"] > 16:
-            new_achievements.append("🏆 Лучший сотрудник")
-
-        weekday = join_time.weekday()
-        if weekday in [5, 6]:
-            day_name = "субботу" if weekday == 5 else "воскресенье"
-            new_achievements.append(
-                f"📅 Я люблю свою работу, я приду сюда в {day_name}"
-            )
-        if 18 <= join_time.hour < 24:
-            night_achievements = [
-                "🌚 Ночная смена? Или просто забыл уйти?",
-                "🦇 Бэтмен бы позавидовал моему графику",
-                "☕ Кофеиновая капельница подключена",
-                "🌙 'Утро вечера мудренее' — а я ещё тут",
-                "🌃 Ночной досмотр",
-                "🌙 Сова компании",
-                "🦉 Полуночный админ",
-                "🌌 Лунатик"
-            ]
-            new_achievements.append(random.choice(night_achievements))
-
-        if 0 <= join_time.hour < 9:
-            morning_achievements = [
-                "⏰ Проснулся раньше будильника... ха-ха, шутка",
-                "💤 'Я бодр!' *спит*",
-                "🌚 Ночь. Улица. Фонарь. Сервер.",
-                "☕ Кофе? Ещё кофе! И лампочку в зубы...",
-                "📉 Мой мозг сейчас в beta-тестировании",
-                "☕ Кофеиновый марафонец",
-                "🌇 Первый луч и на работе"
-            ]
-            new_achievements.append(random.choice(morning_achievements))
-
-        duration_achievements = BotAchievementsCfg.DURATION_ACHIEVEMENTS
-
-        for (min_val, max_val), achievements in duration_achievements.items():
-            if min_val <= duration < max_val and achievements:
-                new_achievements.append(random.choice(achievements))
-                break
-
-        avg_seconds = normalize_duration_to_seconds(user_stats["avg_duration"])
-        if avg_seconds > 9000:
-            new_achievements.append("🐢 Поспешишь - людей насмешишь")
-
-        edit_achievements = {
-            (1, 2): None,
-            (2, 4): "🕰️ Читер: Часовщик II уровня",
-            (4, float('inf')): "🕰️ Читер: Часовщик III уровня"
-        }
-
-        if activity.edited:
-            new_achievements.append("🕵️♂️ Читер: Часовщик")
-            for (min_edit, max_edit), achievement in edit_achievements.items():
-                if min_edit <= activity.edit_count < max_edit and achievement:
-                    new_achievements.append(achievement)
-
-        if new_achievements:
-            achievements_count = {}
-            for ach in new_achievements:
-                achievements_count[ach] = achievements_count.get(ach, 0) + 1
-
-            formatted_achievements = [
-                f"• {ach} x{count}" if count > 1 else f"• {ach}"
-                for ach, count in achievements_count.items()
-            ]
-
-            achievements_to_create = [
-                Achievement(
-                    user_id=user_id,
-                    username=username,
-                    achievement_name=ach.split(
-                        " ", 1)[1] if " " in ach else ach
-                ) for ach in new_achievements
-            ]
-        else:
-            achievements_to_create = []
-            formatted_achievements = ["• Пока ничего 🐱"]
-        if achievements_to_create:
-            await sync_to_async(
-                Achievement.objects.bulk_create)(achievements_to_create)
-
-        group_chat_id = os.getenv("TELEGRAM_GROUP_CHAT_ID")
-        formatted_achievements_text = "\n".join(formatted_achievements)
-        if group_chat_id:
-            await context.bot.send_message(
-                chat_id=group_chat_id,
-                text=(
-                    "🏆 *Новое достижение!*\n"
-                    f"Сотрудник: @{username}\n"
-                    f"Заслуги:\n{formatted_achievements_text}\n"
-                    "Поздравляем! 🎉"
-                ),
-                parse_mode="Markdown"
-            )
-        else:
-            logging.warning("TELEGRAM_GROUP_CHAT_ID не установлен, "
-                            "уведомление о достижениях не отправлено.")
-        achievement_names = []
-        for ach in new_achievements:
-            if " " in ach:
-                achievement_names.append(ach.split(" ", 1)[1])
-            else:
-                achievement_names.append(ach)
-        return achievement_names
-
-    except Exception as e:
-        logging.error(
-            f"Ошибка при проверке достижений для {username}: {str(e)}\n"
-            f"Детали: {traceback.format_exc()}",
-            exc_info=True
-        )
-        return []
-
-
 async def get_chat_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not update.effective_chat or not update.effective_message:
         return
@@ -328,34 +158,42 @@ async def get_chat_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def send_weather_to_group(bot):
     """Асинхронная функция для отправки погоды в группу."""
+    group_chat_id = os.getenv("TELEGRAM_GROUP_CHAT_ID")
     try:
-        weather_message = await get_weather()
-        group_chat_id = os.getenv("TELEGRAM_GROUP_CHAT_ID")
-
-        await bot.send_message(
-            chat_id=group_chat_id,
-            text=weather_message,
-            parse_mode="HTML"
-        )
+        # Плановая рассылка не берёт данные из кэша, даже свежие.
+        weather_message = await get_weather(fresh=True)
+        outbox.enqueue(group_chat_id, weather_message, parse_mode="HTML")
     except Exception as e:
         logging.error(f"Ошибка при отправке погоды: {e}")
-        group_chat_id = os.getenv("TELEGRAM_GROUP_CHAT_ID")
         if group_chat_id:
-            await bot.send_message(
-                chat_id=group_chat_id,
-                text="🚨 Не удалось отправить погоду. 🚨",
+            outbox.enqueue(
+                group_chat_id,
+                "🚨 Не удалось отправить погоду. 🚨",
                 parse_mode="HTML"
             )
 
 
+async def weather(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Погода по запросу: /weather. Отвечает из кэша погоды."""
+    message = update.effective_message
+    if not message:
+        return
+    try:
+        weather_message = await get_weather()
+    except Exception as e:
+        logger.error(f"Ошибка при получении погоды: {e}", exc_info=True)
+        weather_message = "🚨 Не удалось получить погоду. 🚨"
+    await message.reply_text(weather_message, parse_mode="HTML")
+
+
 async def stop_scheduler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Остановка планировщика."""
     if not update.effective_chat or not update.effective_message:
         return
-    if scheduler.running:
-        scheduler.shutdown(wait=False)
+    was_running = scheduler.running
+    if await clear_jobs() or was_running:
         await update.effective_message.reply_text(
-            "🛑 Планировщик погоды остановлен. 🌧️"
+            "🛑 Планировщик остановлен, все задания удалены. 🌧️"
         )
     else:
         await update.effective_message.reply_text(
@@ -363,18 +201,38 @@ async def stop_scheduler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
 
-async def get_similar_companies(company_name):
+def get_similar_companies(company_name):
     """
-    Searches for companies with names similar to the given company_name.
+    Ищет до двух организаций с похожим названием по триграммному индексу.
     """
-    similar_companies = await sync_to_async(list)(
-        Company.objects.filter(
-            name__icontains=company_name
-        ).values_list("name", flat=True)
-    )
-    return get_close_matches(
-        company_name, similar_companies, n=2, cutoff=0.6
+    return company_index.suggest(company_name, limit=2)
+
+
+async def _join_company(message, user_id, username, company_name,
+                        arrival_text):
+    """
+    Общий путь прибытия для join/select_company/add_new_company.
+    arrival_text - текст ответа с подстановкой {time}.
+    """
+    try:
+        result = await JoinService.ajoin(user_id, username, company_name)
+    except ActiveSessionExists as e:
+        active_sessions.add(e.activity)
+        await message.reply_text(
+            "❌ *Ошибка!* ❌\n"
+            "Вы ещё не покинули предыдущую организацию.",
+            parse_mode="Markdown",
+            reply_markup=ReplyKeyboardRemove())
+        return
+    active_sessions.add(result.activity)
+    local_time = timezone.localtime(result.activity.join_time)
+    await message.reply_text(
+        arrival_text.format(time=local_time.strftime('%H:%M')),
+        parse_mode="Markdown",
+        reply_markup=ReplyKeyboardRemove()
     )
+    if result.first_of_day:
+        announce_achievements(username, [FIRST_BLOOD])
 
 
 async def join(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -400,10 +258,7 @@ async def join(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
             parse_mode="Markdown")
         return ConversationHandler.END
 
-    active_activity = await sync_to_async(UserActivity.objects.filter(
-        user_id=user_id, leave_time__isnull=True).exists)()
-
-    if active_activity:
+    if await active_sessions.ais_active(user_id):
         await message.reply_text(
             "❌ *Ошибка!* ❌\n"
             "Вы ещё не покинули предыдущую организацию.",
@@ -414,44 +269,14 @@ async def join(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         company = await sync_to_async(
             Company.objects.filter(name=company_name).first)()
         if company:
-            local_time = timezone.localtime(timezone.now())
-            await message.reply_text(
+            await _join_company(
+                message, user_id, username, company_name,
                 f"🐱‍💻 *Вы прибыли в организацию `{company_name}`* 🐱‍💻\n"
-                f"⏳ Время прибытия: {local_time.strftime('%H:%M')}.",
-                parse_mode="Markdown"
-            )
-            await sync_to_async(UserActivity.objects.create)(
-                user_id=user_id,
-                username=username,
-                company=company
+                "⏳ Время прибытия: {time}."
             )
-
-            today = timezone.now().date()
-            total_today = await sync_to_async(
-                UserActivity.objects.filter(join_time__date=today).count
-            )()
-            if total_today == 1:
-                achievement = Achievement(
-                    user_id=user_id,
-                    username=username,
-                    achievement_name="🩸 Первая кровь"
-                )
-                await sync_to_async(achievement.save)()
-                group_chat_id = os.getenv("TELEGRAM_GROUP_CHAT_ID")
-                if group_chat_id:
-                    await context.bot.send_message(
-                        chat_id=group_chat_id,
-                        text=(
-                            "🏆 *Новое достижение!*\n"
-                            f"Сотрудник: @{username}\n"
-                            f"Заслуги: 🩸 Первая кровь!\n"
-                            "Поздравляем! 🎉"
-                        ),
-                        parse_mode="Markdown"
-                    )
             return ConversationHandler.END
         else:
-            similar_companies = await get_similar_companies(company_name)
+            similar_companies = get_similar_companies(company_name)
             if similar_companies:
                 similar_companies_text = "\n".join(
                     [f"{i + 1}. {company}" for i, company in enumerate(
@@ -470,45 +295,11 @@ async def join(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
                 )
                 return SELECT_CO
             else:
-                company, created = await sync_to_async(
-                    Company.objects.get_or_create)(name=company_name)
-                local_time = timezone.localtime(timezone.now())
-                await message.reply_text(
+                await _join_company(
+                    message, user_id, username, company_name,
                     f"🐱‍💻 *Вы прибыли в организацию {company_name}* 🐱‍💻\n"
-                    f"Время прибытия: {local_time.strftime('%H:%M')}.",
-                    parse_mode="Markdown"
-                )
-                await sync_to_async(UserActivity.objects.create)(
-                    user_id=user_id,
-                    username=username,
-                    company=company
+                    "Время прибытия: {time}."
                 )
-
-                today = timezone.now().date()
-                total_today = await sync_to_async(
-                    UserActivity.objects.filter(
-                        join_time__date=today).count
-                )()
-                if total_today == 1:
-                    achievement = Achievement(
-                        user_id=user_id,
-                        username=username,
-                        achievement_name="🩸 Первая кровь"
-                    )
-                    await sync_to_async(achievement.save)()
-                    group_chat_id = os.getenv("TELEGRAM_GROUP_CHAT_ID")
-                    if group_chat_id:
-                        await context.bot.send_message(
-                            chat_id=group_chat_id,
-                            text=(
-                                "🏆 *Новое достижение!*\n"
-                                f"Сотрудник: @{username}\n"
-                                f"Заслуги: 🩸 Первая кровь!\n"
-                                "Поздравляем! 🎉"
-                            ),
-                            parse_mode="Markdown"
-                        )
-
                 return ConversationHandler.END
     except Exception:
         await message.reply_text(
@@ -544,66 +335,58 @@ async def select_company(
         )
         return JOIN_CO
 
-    active_activity = await sync_to_async(UserActivity.objects.filter(
-        user_id=user_id, leave_time__isnull=True).exists)()
-
-    if active_activity:
+    if await active_sessions.ais_active(user_id):
         await message.reply_text(
             "❌ *Ошибка!* ❌\n"
             "Вы ещё не покинули предыдущую организацию.",
             parse_mode="Markdown")
         return ConversationHandler.END
 
-    company, created = await sync_to_async(
-        Company.objects.get_or_create)(name=selected_company)
-    local_time = timezone.localtime(timezone.now())
-    await message.reply_text(
+    await _join_company(
+        message, user_id, username, selected_company,
         f"🐱‍💻 *Вы прибыли в организацию {selected_company}* 🐱‍💻\n"
-        f"Время прибытия: {local_time.strftime('%H:%M')}.",
-        parse_mode="Markdown",
-        reply_markup=ReplyKeyboardRemove()
-    )
-    await sync_to_async(UserActivity.objects.create)(
-        user_id=user_id,
-        username=username,
-        company=company
+        "Время прибытия: {time}."
     )
     return ConversationHandler.END
 
 
-async def _validate_and_update_time(
+async def _validate_edit_time(
     update: Update,
     context: ContextTypes.DEFAULT_TYPE,
     time_field: str,
     error_message_prefix: str,
-    success_message: str,
-) -> tuple[bool, object]:
-    """Вспомогательная функция для валидации и обновления времени."""
+) -> tuple[Optional[UserActivity], Optional[datetime]]:
+    """
+    Проверяет аргумент /edit_start или /edit_end. Возвращает открытую
+    активность и новое время либо (None, None), ответив пользователю.
+    """
     user = update.effective_user
     message = update.effective_message
     if not user or not message:
-        return False, None
+        return None, None
     user_id = user.id
 
-    active_activity = await sync_to_async(
-        UserActivity.objects.filter(
-            user_id=user_id,
-            leave_time__isnull=True
-        ).select_related('company').first
-    )()
-
-    if not active_activity:
-        msg = await message.reply_text(
+    active_activity = await (
+        UserActivity.objects.select_related("company")
+        .filter(user_id=user_id, leave_time__isnull=True)
+        .order_by("-join_time")
+        .afirst()
+    )
+    if active_activity:
+        active_sessions.add(active_activity)
+    else:
+        active_sessions.remove(user_id)
+        await message.reply_text(
             f"🚨 *Ошибка!* 🚨\n"
             f"У вас нет активной организации, для "
             f"которой можно изменить {error_message_prefix}.",
             parse_mode="Markdown"
         )
-        return False, msg
+        return None, None
 
     args = context.args
     if not args or len(args) != 1:
-        msg = await message.reply_text(
+        await message.reply_text(
             f"🚨 *Ошибка!* 🚨\n"
             f"⭕️ *Внимание! Неверный формат ввода*\n\n"
             f"🕒 Пожалуйста, укажите {error_message_prefix} "
@@ -613,28 +396,28 @@ async def _validate_and_update_time(
             f"используйте команду /help",
             parse_mode="Markdown"
         )
-        return False, msg
+        return None, None
 
     try:
         new_time = datetime.strptime(args[0], '%H:%M').time()
     except ValueError:
-        msg = await message.reply_text(
+        await message.reply_text(
             "❌ *Ошибка!* ❌\n"
             "Неверный формат времени. Пожалуйста, "
             "укажите время в формате *ЧЧ:ММ* (например, 09:15).",
             parse_mode="Markdown"
         )
-        return False, msg
+        return None, None
 
     current_time = timezone.localtime(timezone.now()).time()
     if new_time > current_time:
-        msg = await message.reply_text(
+        await message.reply_text(
             "❌ *Ошибка!* ❌\n"
             "Вы не можете выбрать время, которое больше текущего. "
             "Пожалуйста, укажите время, которое меньше или равно текущему.",
             parse_mode="Markdown"
         )
-        return False, msg
+        return None, None
 
     current_tz = timezone.get_current_timezone()
     now = timezone.localtime(timezone.now())
@@ -644,42 +427,16 @@ async def _validate_and_update_time(
                                     ).astimezone(dt_timezone.utc)
 
     if time_field == "leave_time" and new_datetime < active_activity.join_time:
-        msg = await message.reply_text(
+        await message.reply_text(
             "❌ *Ошибка!* ❌\n"
             "Время убытия не может быть раньше времени прибытия. "
             "Ваше время прибытия: "
             f"{active_activity.join_time.strftime('%H:%M')}.",
             parse_mode="Markdown"
         )
-        return False, msg
+        return None, None
 
-    if (time_field == "join_time"
-        and active_activity.leave_time
-            and new_datetime > active_activity.leave_time):
-        msg = await message.reply_text(
-            "❌ *Ошибка!* ❌\n"
-            "Время прибытия не может быть позже времени убытия. "
-            "Ваше время убытия: "
-            f"{active_activity.leave_time.strftime('%H:%M')}.",
-            parse_mode="Markdown"
-        )
-        return False, msg
-
-    setattr(active_activity, time_field, new_datetime)
-    active_activity.edited = True
-    active_activity.edit_count += 1
-    await sync_to_async(active_activity.save)()
-
-    company_name = active_activity.company.name
-    local_time = timezone.localtime(new_datetime).strftime('%H:%M')
-
-    msg = await message.reply_text(
-        f"😻 *Успешно!* 😻\n"
-        f"{success_message.format(
-            company_name=company_name, time=local_time)}.",
-        parse_mode="Markdown"
-    )
-    return True, msg
+    return active_activity, new_datetime
 
 
 async def edit(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -695,105 +452,83 @@ async def edit_arrival_time(update: Update,
                             context: ContextTypes.DEFAULT_TYPE) -> None:
     """Команда для изменения времени прибытия в организацию."""
     user = update.effective_user
-    if not user:
+    message = update.effective_message
+    if not user or not message:
         return
-    await _validate_and_update_time(
-        update,
-        context,
+    activity, new_datetime = await _validate_edit_time(
+        update, context,
         time_field="join_time",
         error_message_prefix="время прибытия",
-        success_message=("Время прибытия в организацию {company_name} "
-                         "успешно изменено на {time}"),
     )
-    user_id = user.id
-    username = user.username
-    await update_daily_statistics(user_id, username)
+    if activity is None:
+        return
+    activity.join_time = new_datetime
+    activity.edited = True
+    activity.edit_count += 1
+    await sync_to_async(activity.save)()
+    active_sessions.update_join_time(user.id, new_datetime)
+    local_time = timezone.localtime(new_datetime).strftime('%H:%M')
+    await message.reply_text(
+        f"😻 *Успешно!* 😻\n"
+        f"Время прибытия в организацию {activity.company.name} "
+        f"успешно изменено на {local_time}.",
+        parse_mode="Markdown"
+    )
 
 
 async def edit_departure_time(update: Update,
                               context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Команда для изменения времени убытия: закрывает сессию с указанным
+    временем и начисляет опыт одной транзакцией LeaveService.
+    """
     user = update.effective_user
     message = update.effective_message
     if not user or not message:
         return
     user_id = user.id
     username = user.username or f"User_{user_id}"
-
-    success, _ = await _validate_and_update_time(
-        update,
-        context,
+    activity, new_datetime = await _validate_edit_time(
+        update, context,
         time_field="leave_time",
         error_message_prefix="время убытия",
-        success_message=("Время убытия из организации {company_name} "
-                         "успешно изменено на {time}"),
     )
-
-    if success:
-        try:
-            activity = await sync_to_async(
-                UserActivity.objects.select_related("company").filter(
-                    user_id=user_id,
-                    leave_time__isnull=False).latest)("leave_time")
-
-            if activity:
-                achievements_list = await check_achievements(
-                    user_id, username, activity, context)
-                today = timezone.now().date()
-                daily_visits_count = await sync_to_async(
-                    UserActivity.objects.filter(
-                        user_id=user_id,
-                        join_time__date=today
-                    ).count)()
-                exp_earned = calculate_experience(
-                    activity, achievements_list, daily_visits_count)
-                activity.experience_gained = exp_earned
-                if not activity.leave_time:
-                    logging.error(f"Activity {activity.pk} has no leave_time")
-                    return
-                time_spent = activity.leave_time - activity.join_time
-                rank, level_up, new_level = await update_season_rank(
-                    user_id, exp_earned, time_spent, username)
-                await sync_to_async(activity.save)()
-                await update_daily_statistics(user_id, username)
-                company_name = activity.company.name
-                spent_time = activity.get_spent_time
-
-                msg_text = (
-                    f"⌛ *Обновленные данные о посещении* ⌛\n"
-                    f"🏭 Организация: *{company_name}*\n"
-                    f"⏳ Новое затраченное время: {spent_time}.\n"
-                    f"🔰 Получено опыта: {exp_earned}"
-                )
-                if level_up and rank:
-                    level_info = await get_level_info(rank)
-                    progress_bar = create_progress_bar(level_info["progress"])
-                    msg_text += (
-                        "\n\n🎉 *Поздравляем с повышением уровня!* 🎉\n"
-                        f"🏆 Новый уровень: *{new_level} lvl - "
-                        f"{level_info['title']}*\n"
-                        f"📚 Категория: *{level_info['category']}*"
-                        f"📊 Прогресс: {progress_bar} *{int(level_info['progress'])}%*\n"
-                        f"✨ Опыт: *{level_info['current_exp']}/{level_info['next_level_exp']}*"
-                    )
-
-                await message.reply_text(
-                    msg_text, parse_mode="Markdown"
-                )
-            else:
-                logging.warning(
-                    f"Активность не найдена для пользователя {user_id}")
-                await message.reply_text(
-                    "⚠️ *Предупреждение:* "
-                    + "Не удалось найти данные о посещении.",
-                    parse_mode="Markdown"
-                )
-
-        except Exception as e:
-            logging.error(f"Ошибка при выполнении команды /edit_end: {e}")
-            await message.reply_text(
-                "🚨 *Произошла ошибка при обработке команды.* 🚨",
-                parse_mode="Markdown"
-            )
+    if activity is None:
+        return
+    try:
+        result = await LeaveService.aclose_session(
+            user_id, username, activity.pk, leave_time=new_datetime)
+    except UserActivity.DoesNotExist:
+        active_sessions.remove(user_id)
+        logging.warning(
+            f"Активность не найдена для пользователя {user_id}")
+        await message.reply_text(
+            "⚠️ *Предупреждение:* "
+            + "Не удалось найти данные о посещении.",
+            parse_mode="Markdown"
+        )
+        return
+    except Exception as e:
+        logging.error(f"Ошибка при выполнении команды /edit_end: {e}")
+        await message.reply_text(
+            "🚨 *Произошла ошибка при обработке команды.* 🚨",
+            parse_mode="Markdown"
+        )
+        return
+    active_sessions.remove(user_id)
+    announce_achievements(username, result.achievements)
+    local_time = timezone.localtime(new_datetime).strftime('%H:%M')
+    await message.reply_text(
+        f"😻 *Успешно!* 😻\n"
+        f"Время убытия из организации {result.activity.company.name} "
+        f"успешно изменено на {local_time}.\n\n"
+        f"⌛ *Обновленные данные о посещении* ⌛\n"
+        "⏳ Новое затраченное время: "
+        f"{result.activity.get_spent_time}.\n"
+        f"🔰 Получено опыта: {result.exp_earned}"
+        f"{_format_level_up(result)}",
+        parse_mode="Markdown"
+    )
 
 
 async def add_new_company(
@@ -807,10 +542,7 @@ async def add_new_company(
     username = user.username
     company_name = message.text
 
-    active_activity = await sync_to_async(UserActivity.objects.filter(
-        user_id=user_id, leave_time__isnull=True).exists)()
-
-    if active_activity:
+    if await active_sessions.ais_active(user_id):
         await message.reply_text(
             "❌ *Ошибка!* ❌\n"
             "Вы ещё не покинули предыдущую организацию.",
@@ -824,23 +556,42 @@ async def add_new_company(
             " буквы русского или английского алфавита и цифры",
             parse_mode="Markdown")
         return ConversationHandler.END
-    local_time = timezone.localtime(timezone.now())
-    company, created = await sync_to_async(
-        Company.objects.get_or_create)(name=company_name)
-    await message.reply_text(
+    await _join_company(
+        message, user_id, username, company_name,
         f"🐱‍💻 *Вы прибыли к новой организации {company_name}* 🐱‍💻\n"
-        f"Время прибытия: {local_time.strftime('%H:%M')}.\n ",
-        parse_mode="Markdown",
-        reply_markup=ReplyKeyboardRemove()
-    )
-    await sync_to_async(UserActivity.objects.create)(
-        user_id=user_id,
-        username=username,
-        company=company
+        "Время прибытия: {time}.\n "
     )
     return ConversationHandler.END
 
 
+def _format_level_up(result: LeaveResult) -> str:
+    """Блок сообщения о повышении уровня (пустой, если его не было)."""
+    if not result.level_up or not result.level_info:
+        return ""
+    level_info = result.level_info
+    progress_bar = create_progress_bar(level_info["progress"])
+    return (
+        "\n\n🎉 *Поздравляем с повышением уровня!* 🎉\n"
+        f"🏆 Новый уровень: *{result.new_level} lvl - "
+        f"{level_info['title']}*\n"
+        f"📚 Категория: *{level_info['category']}*"
+        f"📊 Прогресс: {progress_bar} *{int(level_info['progress'])}%*\n"
+        f"✨ Опыт: *{level_info['current_exp']}/{level_info['next_level_exp']}*"
+    )
+
+
+def _format_leave_message(result: LeaveResult) -> str:
+    local_time = timezone.localtime(result.activity.leave_time)
+    return (
+        "🐾👋 *Вы покинули организацию "
+        f"{result.activity.company.name}* 🐾👋\n"
+        f"⌛️ Время ухода: {local_time.strftime('%H:%M')}.\n"
+        f"⏳ Затраченное время: {result.activity.get_spent_time}.\n"
+        f"🔰 Получено опыта: {result.exp_earned}"
+        f"{_format_level_up(result)}"
+    )
+
+
 async def leave(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Callback для ухода из организации."""
     user = update.effective_user
@@ -850,58 +601,18 @@ async def leave(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = user.id
     username = user.username or f"User_{user_id}"
     try:
-        activity = await sync_to_async(UserActivity.objects.select_related(
-            "company").filter(
-                user_id=user_id,
-                leave_time__isnull=True).latest)("join_time")
-        achievements_list = await check_achievements(
-            user_id, username, activity, context)
-        today = timezone.now().date()
-        daily_visits_count = await sync_to_async(UserActivity.objects.filter(
-            user_id=user_id,
-            join_time__date=today,
-        ).count)()
-        current_time = timezone.now()
-        activity.leave_time = current_time
-        exp_earned = calculate_experience(activity, achievements_list,
-                                          daily_visits_count)
-        activity.experience_gained = exp_earned
-        join_time_val = activity.join_time
-        if join_time_val is None:
-            logging.error(f"Activity {activity.pk} has no join_time")
-            return
-        time_spent = current_time - join_time_val
-        rank, level_up, new_level = await update_season_rank(
-            user_id, exp_earned, time_spent, username)
-        await sync_to_async(activity.save)()
-
-        await update_daily_statistics(user_id, username)
-
-        company_name = activity.company.name
-        spent_time = activity.get_spent_time
-        local_time = timezone.localtime(timezone.now())
-
-        msg_text = (
-            f"🐾👋 *Вы покинули организацию {company_name}* 🐾👋\n"
-            f"⌛️ Время ухода: {local_time.strftime('%H:%M')}.\n"
-            f"⏳ Затраченное время: {spent_time}.\n"
-            f"🔰 Получено опыта: {exp_earned}"
-        )
-
-        if level_up and rank:
-            level_info = await get_level_info(rank)
-            progress_bar = create_progress_bar(level_info["progress"])
-            msg_text += (
-                "\n\n🎉 *Поздравляем с повышением уровня!* 🎉\n"
-                f"🏆 Новый уровень: *{new_level} lvl - "
-                f"{level_info['title']}*\n"
-                f"📚 Категория: *{level_info['category']}*"
-                f"📊 Прогресс: {progress_bar} *{int(level_info['progress'])}%*\n"
-                f"✨ Опыт: *{level_info['current_exp']}/{level_info['next_level_exp']}*"
-            )
-        await message.reply_text(msg_text, parse_mode="Markdown")
+        session = await active_sessions.aget(user_id)
+        if not session:
+            raise UserActivity.DoesNotExist
+        result = await LeaveService.aclose_session(
+            user_id, username, session.activity_id)
+        active_sessions.remove(user_id)
+        announce_achievements(username, result.achievements)
+        await message.reply_text(
+            _format_leave_message(result), parse_mode="Markdown")
 
     except UserActivity.DoesNotExist:
+        active_sessions.remove(user_id)
         await message.reply_text(
             "❌ *Ошибка!* ❌\n"
             "Вы не прибыли ни к одной организации.", parse_mode="Markdown")
@@ -912,29 +623,92 @@ async def leave(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             parse_mode="Markdown")
 
 
-async def remind_to_leave(bot):
-    """Функция для напоминания пользователям о необходимости /leave."""
+def _reminder_user_line(activity):
+    username = (
+        f"@{activity.username}"
+        if activity.username
+        else f"ID: {activity.user_id}")
+    return f"{username} ({activity.company.name})"
+
+
+async def _send_leave_dm(bot, activity, semaphore) -> bool:
+    """
+    Личное напоминание с кнопкой закрытия сессии.
+    Возвращает False, если написать пользователю не удалось
+    (например, он ни разу не запускал бота).
+    """
+    join_time = timezone.localtime(activity.join_time).strftime("%H:%M")
+    keyboard = InlineKeyboardMarkup([[InlineKeyboardButton(
+        f"🚪 Покинуть {activity.company.name}",
+        callback_data=f"{LEAVE_CALLBACK_PREFIX}{activity.pk}",
+    )]])
+    text = (
+        "⚠️ *Напоминание* ⚠️\n\n"
+        f"Вы всё ещё числитесь в организации *{activity.company.name}* "
+        f"с {join_time}.\n"
+        "Если вы уже ушли — нажмите кнопку ниже или используйте "
+        "/edit\\_end <ЧЧ:ММ>."
+    )
+    async with semaphore:
+        for attempt in range(2):
+            try:
+                await bot.send_message(
+                    chat_id=activity.user_id,
+                    text=text,
+                    parse_mode="Markdown",
+                    reply_markup=keyboard,
+                )
+                return True
+            except telegram.error.RetryAfter as e:
+                if attempt:
+                    break
+                await asyncio.sleep(retry_after_seconds(e))
+            except telegram.error.TelegramError as e:
+                logging.warning(
+                    f"Не удалось отправить напоминание "
+                    f"{activity.user_id} в личку: {e}")
+                break
+    return False
+
+
+async def remind_to_leave(bot, direct=False):
+    """
+    Функция для напоминания пользователям о необходимости /leave.
+
+    direct=True - каждому пользователю уходит личное сообщение
+    с кнопкой закрытия сессии (не более BotRemidersCfg.DM_CONCURRENCY
+    отправок одновременно); в группу попадают только те,
+    кому написать не удалось.
+    """
     try:
         group_chat_id = os.getenv("TELEGRAM_GROUP_CHAT_ID")
         if not group_chat_id:
             logging.error("TELEGRAM_GROUP_CHAT_ID не установлен в .env")
             return
-        active_activities = await sync_to_async(
-            lambda: list(UserActivity.objects.filter(leave_time__isnull=True))
-        )()
+        active_activities = await sync_to_async(list)(
+            UserActivity.objects.filter(leave_time__isnull=True)
+            .select_related("company")
+            .order_by("join_time")
+        )
+
+        if direct and active_activities:
+            semaphore = asyncio.Semaphore(BotRemidersCfg.DM_CONCURRENCY)
+            delivered = await asyncio.gather(*(
+                _send_leave_dm(bot, activity, semaphore)
+                for activity in active_activities
+            ))
+            logging.info(
+                f"Личных напоминаний отправлено: {sum(delivered)}"
+                f"/{len(active_activities)}")
+            active_activities = [
+                activity for activity, ok
+                in zip(active_activities, delivered) if not ok
+            ]
 
         if not active_activities:
             return
 
-        users = []
-        for activity in active_activities:
-            username = (
-                f"@{activity.username}"
-                if activity.username
-                else f"ID: {activity.user_id}")
-            company_name = await sync_to_async(
-                lambda: activity.company.name)()
-            users.append(f"{username} ({company_name})")
+        users = [_reminder_user_line(a) for a in active_activities]
         message = (
             "⚠️ *Внимание!* ⚠️\n\n"
             "Следующие сотрудники всё ещё находятся в организациях:\n"
@@ -956,30 +730,46 @@ async def remind_to_leave(bot):
             "(где вы сейчас числитесь программно)\n"
             "— Формат времени: 09:00, 14:30 (24-часовой)"
         )
-        try:
-            await bot.send_message(
-                chat_id=group_chat_id,
-                text=message,
-                parse_mode="Markdown",
-                disable_notification=False)
-            logging.info(f"Напоминание отправлено в группу {group_chat_id}")
-        except telegram.error.BadRequest as e:
-            logging.error(f"Ошибка отправки в группу: {e.message}")
-            if "chat not found" in str(e).lower():
-                logging.critical(
-                    "Бот не добавлен в группу или chat_id неверный!")
-        except telegram.error.Forbidden as e:
-            logging.error(f"Нет прав на отправку: {e.message}")
-            if "bot was blocked" in str(e).lower():
-                logging.critical("Бот заблокирован в группе!")
-        except Exception as e:
-            logging.error(f"Неизвестная ошибка: {str(e)}", exc_info=True)
-
+        outbox.enqueue(
+            group_chat_id,
+            message,
+            parse_mode="Markdown",
+            disable_notification=False
+        )
+        logging.info(f"Напоминание поставлено в очередь для {group_chat_id}")
     except Exception as e:
         logging.error(
             f"Критическая ошибка в remind_to_leave: {e}", exc_info=True)
 
 
+async def leave_button(update: Update,
+                       context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Кнопка «Покинуть» из личного напоминания."""
+    query = update.callback_query
+    user = update.effective_user
+    if not query or not user or not query.data:
+        return
+    activity_id = int(query.data.removeprefix(LEAVE_CALLBACK_PREFIX))
+    username = user.username or f"User_{user.id}"
+    try:
+        result = await LeaveService.aclose_session(
+            user.id, username, activity_id)
+    except UserActivity.DoesNotExist:
+        active_sessions.remove(user.id)
+        await query.answer("Сессия уже закрыта.")
+        await query.edit_message_reply_markup(reply_markup=None)
+        return
+    except Exception as e:
+        logging.error(f"Ошибка при закрытии сессии по кнопке: {e}")
+        await query.answer("🚨 Ошибка, попробуйте /leave.")
+        return
+    active_sessions.remove(user.id)
+    announce_achievements(username, result.achievements)
+    await query.answer()
+    await query.edit_message_text(
+        _format_leave_message(result), parse_mode="Markdown")
+
+
 def _last_day_of_month(today):
     if today.month == 12:
         return (
@@ -1021,19 +811,17 @@ async def check_and_send_transport_reminder(bot):
             f"{body}"
         )
 
-        await bot.send_message(
-            chat_id=group_chat_id,
-            text=message_text,
+        outbox.enqueue(
+            group_chat_id,
+            message_text,
             parse_mode="HTML",
             disable_web_page_preview=True,
         )
         logger.info(
-            "Отправлено напоминание о транспорте. Осталось дней: %s",
+            "Напоминание о транспорте в очереди. Осталось дней: %s",
             days_left,
         )
 
-    except telegram.error.BadRequest as e:
-        logger.error("Ошибка отправки сообщения: %s", str(e))
     except Exception:
         logger.exception("Неожиданная ошибка в transport_reminder")
 
@@ -1042,25 +830,24 @@ async def mew(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Отправляет случайное фото котика."""
     url = "https://api.thecatapi.com/v1/images/search"
 
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.get(url) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    cat_photo_url = data[0]["url"]
-                    if update.effective_message:
-                        await update.effective_message.reply_photo(
-                            photo=cat_photo_url
-                        )
-                else:
-                    if update.effective_message:
-                        await update.effective_message.reply_text(
-                            "😿 Не удалось получить фото котика. 😿")
-        except Exception as e:
-            logging.error(f"Ошибка при запросе к API котиков: {e}")
-            if update.effective_message:
-                await update.effective_message.reply_text(
-                    "😿 Произошла ошибка при получении фото котика. 😿")
+    try:
+        async with http_client.session().get(url) as response:
+            if response.status == 200:
+                data = await response.json()
+                cat_photo_url = data[0]["url"]
+                if update.effective_message:
+                    await update.effective_message.reply_photo(
+                        photo=cat_photo_url
+                    )
+            else:
+                if update.effective_message:
+                    await update.effective_message.reply_text(
+                        "😿 Не удалось получить фото котика. 😿")
+    except Exception as e:
+        logging.error(f"Ошибка при запросе к API котиков: {e}")
+        if update.effective_message:
+            await update.effective_message.reply_text(
+                "😿 Произошла ошибка при получении фото котика. 😿")
 
 
 async def send_daily_statistics_to_group(bot):
@@ -1085,57 +872,14 @@ async def send_daily_statistics_to_group(bot):
         if not group_chat_id:
             logging.error("TELEGRAM_GROUP_CHAT_ID не установлен в .env")
             return
-        await bot.send_message(chat_id=group_chat_id,
-                               text=message,
-                               parse_mode="Markdown")
-        logging.info(f"Статистика за {today_date} успешно отправлена.")
+        outbox.enqueue(group_chat_id, message, parse_mode="Markdown")
+        logging.info(f"Статистика за {today_date} поставлена в очередь.")
     except Exception as e:
         logging.error(f"Ошибка отправки статистики: {str(e)}", exc_info=True)
 
 
 async def get_current_season():
-    try:
-        return await sync_to_async(Season.objects.get)(is_active=True)
-    except Season.DoesNotExist:
-        return None
-
-
-async def update_season_rank(userid: int, expearned: int,
-                             timespent: timedelta, username: str):
-    season = await get_current_season()
-    if not season:
-        return None, False, 0
-
-    rank, created = await sync_to_async(SeasonRank.objects.get_or_create)(
-        user_id=userid,
-        season=season,
-        defaults={
-            "username": username,
-            "experience": expearned,
-            "total_time": timespent,
-            "visits_count": 1,
-        }
-    )
-
-    old_level = rank.level
-    if not created:
-        rank.experience += expearned
-        rank.total_time += timespent
-        rank.visits_count += 1
-    else:
-        rank.username = username  # на всякий случай
-
-    correct = await sync_to_async(
-        lambda: LevelTitle.objects.filter(min_experience__lte=rank.experience).order_by("-level").first()
-    )()
-
-    if correct and correct.level != rank.level:
-        rank.level = correct.level
-        rank.level_title = correct
-
-    levelup = rank.level > old_level
-    await sync_to_async(rank.save)()
-    return rank, levelup, rank.level
+    return await sync_to_async(get_active_season)()
 
 
 async def profile(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -1155,12 +899,10 @@ async def profile(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             )
             return
 
-        rank = await sync_to_async(
-            SeasonRank.objects.select_related("level_title")
-            .get
-        )(user_id=user_id, season=season)
+        rank = await sync_to_async(SeasonRank.objects.get)(
+            user_id=user_id, season=season)
 
-        level_info = await get_level_info(rank)
+        [level_info] = await get_level_info_many([rank])
 
         total_hours = int(rank.total_time.total_seconds() // 3600)
         total_minutes = int((rank.total_time.total_seconds() % 3600) // 60)
@@ -1173,6 +915,31 @@ async def profile(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             days_left = 0
         progress_bar = create_progress_bar(level_info["progress"])
         theme_name = getattr(season, "get_theme_display")()
+        await sync_to_async(season_leaderboard.ensure)(season)
+        position = season_leaderboard.position(user_id)
+        standing = ""
+        if position:
+            percentile = season_leaderboard.percentile(user_id)
+            standing = (
+                f"🏅 Место в сезоне: *{position}* "
+                f"из {len(season_leaderboard)}\n"
+                f"📈 Опережаете *{percentile:.0f}%* участников\n"
+            )
+        counters = await sync_to_async(list)(
+            UserAchievementCounter.objects.filter(user_id=user_id)
+            .order_by("-count", "achievement_name")
+            .values_list("achievement_name", "count")
+        )
+        achievements_text = ""
+        if counters:
+            favourite = ", ".join(
+                escape_markdown(name) + (f" x{count}" if count > 1 else "")
+                for name, count in counters[:3])
+            achievements_text = (
+                f"🏆 Достижений: *{sum(c for _, c in counters)}* "
+                f"(разных: {len(counters)})\n"
+                f"⭐ Чаще всего: {favourite}\n"
+            )
         msg_text = (
             f"🏆 *Текущий сезон: {season.name}*\n"
             f"⏳ До конца сезона: *{days_left} дней*\n\n"
@@ -1184,7 +951,9 @@ async def profile(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             f"{level_info['next_level_exp']}*\n"
             f"📊 Прогресс: {progress_bar} {int(level_info['progress'])}%\n"
             f"⏱ Всего времени в организациях: *{time_str}*\n"
-            f"🚗 Всего выездов: *{rank.visits_count}*\n\n"
+            f"🚗 Всего выездов: *{rank.visits_count}*\n"
+            f"{standing}"
+            f"{achievements_text}\n"
             f"{theme_name} продолжается! "
             "Успейте достичь новых высот!"
         )
@@ -1196,6 +965,49 @@ async def profile(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     await message.reply_text(msg_text, parse_mode="Markdown")
 
 
+async def top(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Таблица лидеров текущего сезона: /top [N]."""
+    message = update.effective_message
+    if not message:
+        return
+    limit = TOP_DEFAULT
+    if context.args:
+        try:
+            limit = int(context.args[0])
+        except ValueError:
+            await message.reply_text(
+                "❌ Укажите число участников, например: /top 5")
+            return
+    limit = max(1, min(limit, TOP_MAX))
+
+    season = await get_current_season()
+    if not season:
+        await message.reply_text(
+            "ℹ️ В данный момент сезон не активен. "
+            "Ожидайте начала нового сезона!",
+            parse_mode="Markdown"
+        )
+        return
+    await sync_to_async(season_leaderboard.ensure)(season)
+    entries = season_leaderboard.top(limit)
+    if not entries:
+        await message.reply_text(
+            "🏁 В этом сезоне ещё никто не набрал опыта.")
+        return
+
+    medals = {1: "🥇", 2: "🥈", 3: "🥉"}
+    lines = [f"🏆 *Топ-{len(entries)} сезона «{season.name}»*\n"]
+    for entry in entries:
+        position = season_leaderboard.position(entry.user_id)
+        name = (f"@{entry.username}" if entry.username
+                else f"ID: {entry.user_id}")
+        lines.append(
+            f"{medals.get(position, f'{position}.')} {name} — "
+            f"*{entry.experience}* опыта, ур. {entry.level}"
+        )
+    await message.reply_text("\n".join(lines), parse_mode="Markdown")
+
+
 async def start_weather(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Запуск ежедневной отправки погоды в указанное время"""
     message = update.effective_message
@@ -1218,22 +1030,7 @@ async def start_weather(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await message.reply_text("❌ Некорректное время")
         return
 
-    try:
-        scheduler.remove_job("weather_job")
-    except JobLookupError:
-        pass
-
-    scheduler.add_job(
-        send_weather_to_group,
-        trigger="cron",
-        hour=hour,
-        minute=minute,
-        args=[context.bot],
-        id="weather_job"
-    )
-
-    if not scheduler.running:
-        scheduler.start()
+    await schedule_job("weather_job", context.bot, hour, minute)
 
     await message.reply_text(
         f"⛅ Задание для отправки погоды установлено на {hour:02}:{minute:02}"
@@ -1262,22 +1059,7 @@ async def start_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await message.reply_text("❌ Некорректное время")
         return
 
-    try:
-        scheduler.remove_job("stats_job")
-    except JobLookupError:
-        pass
-
-    scheduler.add_job(
-        send_daily_statistics_to_group,
-        trigger="cron",
-        hour=hour,
-        minute=minute,
-        args=[context.bot],
-        id="stats_job"
-    )
-
-    if not scheduler.running:
-        scheduler.start()
+    await schedule_job("stats_job", context.bot, hour, minute)
 
     await message.reply_text(
         f"📊 Задание для отправки "
@@ -1293,7 +1075,8 @@ async def start_reminder(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not context.args:
         await message.reply_text(
             "❌ Укажите время в формате ЧЧ:ММ "
-            "(например: /start_reminder 19:45)"
+            "(например: /start_reminder 19:45, "
+            "/start_reminder 19:45 dm - напоминать в личку)"
         )
         return
 
@@ -1308,37 +1091,16 @@ async def start_reminder(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await message.reply_text("❌ Некорректное время")
         return
 
-    for job_id in ["reminder_job", "transport_reminder"]:
-        try:
-            scheduler.remove_job(job_id)
-        except JobLookupError:
-            pass
-
-    scheduler.add_job(
-        remind_to_leave,
-        trigger="cron",
-        hour=hour,
-        minute=minute,
-        args=[context.bot],
-        id="reminder_job"
-    )
-
-    scheduler.add_job(
-        check_and_send_transport_reminder,
-        trigger="cron",
-        hour=9,
-        minute=0,
-        args=[context.bot],
-        id="transport_reminder",
-        timezone=ZoneInfo("Europe/Moscow"))
-
-    if not scheduler.running:
-        scheduler.start()
+    direct = len(context.args) > 1 and context.args[1].lower() == "dm"
+    await schedule_job(
+        "reminder_job", context.bot, hour, minute, args=(direct,))
+    await schedule_job("transport_reminder", context.bot, 9, 0)
 
     response_message = (
         "🔔 Напоминания успешно установлены:\n\n"
         "• Проверка активности в организациях — "
-        f"ежедневно в {hour:02}:{minute:02}\n"
+        f"ежедневно в {hour:02}:{minute:02}"
+        f"{' (в личные сообщения)' if direct else ''}\n"
         "• Транспортные расходы — ежедневно в 09:00 "
         "(только за 7/4/2 дней до конца месяца)"
     )
@@ -1391,9 +1153,9 @@ async def send_daily_tip(bot):
             message += f"ℹ️ [Дополнительная информация]({tip.external_link})"
 
         group_chat_id = os.getenv("TELEGRAM_GROUP_CHAT_ID")
-        await bot.send_message(
-            chat_id=group_chat_id,
-            text=message,
+        outbox.enqueue(
+            group_chat_id,
+            message,
             parse_mode="Markdown",
             disable_web_page_preview=True
         )
@@ -1425,23 +1187,7 @@ async def start_dailytips(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await message.reply_text("❌ Неверный формат времени")
         return
 
-    try:
-        scheduler.remove_job("dailytips_job")
-    except JobLookupError:
-        pass
-
-    scheduler.add_job(
-        send_daily_tip,
-        trigger='cron',
-        hour=hour,
-        minute=minute,
-        args=[context.bot],
-        id="dailytips_job",
-        timezone=ZoneInfo("Europe/Moscow")
-    )
-
-    if not scheduler.running:
-        scheduler.start()
+    await schedule_job("dailytips_job", context.bot, hour, minute)
 
     await message.reply_text(
         f"✅ Ежедневные советы будут отправляться в {hour:02}:{minute:02}\n"
@@ -1456,12 +1202,11 @@ async def stop_dailytips(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message = update.effective_message
     if not message:
         return
-    try:
-        scheduler.remove_job("dailytips_job")
+    if await unschedule_job("dailytips_job"):
         await message.reply_text(
             "✅ Рассылка советов остановлена"
         )
-    except JobLookupError:
+    else:
         await message.reply_text(
             "⚠️ Активная рассылка не найдена"
         )
@@ -1515,10 +1260,7 @@ async def active_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not message:
         return
     try:
-        active_activities = await sync_to_async(list)(
-            UserActivity.objects.select_related("company")
-            .filter(leave_time__isnull=True)
-        )
+        active_activities = active_sessions.all()
 
         if not active_activities:
             await message.reply_text(
@@ -1532,7 +1274,7 @@ async def active_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
         tz = ZoneInfo("Europe/Moscow")
 
         for activity in active_activities:
-            company_name = activity.company.name
+            company_name = activity.company_name
             join_time = activity.join_time.astimezone(tz).strftime("%H:%M")
 
             username = (f"@{activity.username}"
@@ -1566,11 +1308,17 @@ async def active_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def send_currency_rates_to_group(bot):
     """
     Асинхронная функция для обновления и отправки курсов.
-    Использует логику из currency_utils.py.
+    Использует логику из currency_utils.py. Перед отчётом сворачивает
+    завершённые дни в CurrencyDaily: по ним считается изменение за неделю.
     """
     try:
         rates = await fetch_currency_rates()
         await save_currency_rates(rates)
+        try:
+            await sync_to_async(compact_currency_rates)()
+        except Exception as e:
+            logger.error(f"Ошибка при сворачивании курсов: {e}",
+                         exc_info=True)
         await send_currency_report(bot)
     except Exception as e:
         logger.error(f"Ошибка в цикле обновления курсов: {e}", exc_info=True)
@@ -1596,23 +1344,7 @@ async def start_currency(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await message.reply_text("❌ Неверный формат времени")
         return
 
-    try:
-        scheduler.remove_job("currency_job")
-    except JobLookupError:
-        pass
-
-    scheduler.add_job(
-        send_currency_rates_to_group,
-        trigger="cron",
-        hour=hour,
-        minute=minute,
-        args=[context.bot],
-        id="currency_job",
-        timezone=ZoneInfo("Europe/Moscow")
-    )
-
-    if not scheduler.running:
-        scheduler.start()
+    await schedule_job("currency_job", context.bot, hour, minute)
 
     await message.reply_text(
         f"💱 Задание для отправки курсов установлено на {hour:02}:{minute:02}\n"
@@ -1625,17 +1357,41 @@ async def stop_currency(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message = update.effective_message
     if not message:
         return
-    try:
-        scheduler.remove_job("currency_job")
+    if await unschedule_job("currency_job"):
         await message.reply_text(
             "✅ Рассылка курсов остановлена"
         )
-    except JobLookupError:
+    else:
         await message.reply_text(
             "⚠️ Активная рассылка не найдена"
         )
 
 
+async def currency_chart(update: Update,
+                         context: ContextTypes.DEFAULT_TYPE) -> None:
+    """График курса: /currency_chart <КОД> [week|month|year]."""
+    message = update.effective_message
+    if not message:
+        return
+    args = context.args or []
+    currency = args[0].upper() if args else None
+    period = (args[1].lower() if len(args) > 1
+              else BotCurrencyChartCfg.DEFAULT_PERIOD)
+    if currency not in CURRENCY_CONFIG or period not in PERIOD_DAYS:
+        await message.reply_text(
+            "❌ Использование: /currency_chart <КОД> [week|month|year]\n"
+            f"Коды: {', '.join(CURRENCY_CONFIG)}"
+        )
+        return
+    try:
+        if not await send_currency_chart(message, currency, period):
+            await message.reply_text(f"📭 Нет данных по {currency}")
+    except Exception as e:
+        logger.error(f"Ошибка при построении графика {currency}: {e}",
+                     exc_info=True)
+        await message.reply_text("🚨 Не удалось построить график")
+
+
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Отменяет диалог."""
     if update.effective_message:
@@ -1646,57 +1402,115 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     return ConversationHandler.END
 
 
+register_job("weather_job", send_weather_to_group)
+register_job("stats_job", send_daily_statistics_to_group)
+register_job("reminder_job", remind_to_leave)
+register_job("transport_reminder", check_and_send_transport_reminder)
+register_job("dailytips_job", send_daily_tip)
+register_job("currency_job", send_currency_rates_to_group)
+
+
+async def on_startup(application):
+    """post_init: запуск фоновых служб бота."""
+    outbox.start(application.bot)
+    await http_client.start()
+    weather_cache.warm()
+    await restore_jobs(application.bot)
+
+
+async def on_stop(application):
+    """
+    post_stop: досылаем очередь сообщений. После shutdown HTTP-клиент
+    бота уже закрыт, и отправить их было бы нельзя.
+    """
+    await outbox.stop()
+
+
+async def on_shutdown(application):
+    """post_shutdown: закрываем общую HTTP-сессию последней."""
+    await http_client.close()
+
+
+def register_handlers(application) -> None:
+    """Регистрирует обработчики команд бота."""
+    conv_handler = ConversationHandler(
+        entry_points=[
+            CommandHandler("join", join),
+        ],
+        states={
+            SELECT_CO: [MessageHandler(
+                filters.TEXT & ~filters.COMMAND, select_company)],
+            JOIN_CO: [MessageHandler(
+                filters.TEXT & ~filters.COMMAND, add_new_company)],
+        },
+        fallbacks=[CommandHandler("cancel", cancel)],
+    )
+
+    application.add_handler(conv_handler)
+    application.add_handler(CommandHandler("help", help))
+    application.add_handler(CommandHandler("site", site))
+    application.add_handler(
+        CommandHandler("get_chat_info", get_chat_info))
+    application.add_handler(CommandHandler("leave", leave))
+    application.add_handler(CallbackQueryHandler(
+        leave_button, pattern=rf"^{LEAVE_CALLBACK_PREFIX}\d+$"))
+    application.add_handler(CommandHandler("mew", mew))
+    application.add_handler(CommandHandler("weather", weather))
+    application.add_handler(
+        CommandHandler("currency_chart", currency_chart))
+    application.add_handler(
+        CommandHandler("start_weather", start_weather))
+    application.add_handler(CommandHandler("start_stats", start_stats))
+    application.add_handler(CommandHandler("profile", profile))
+    application.add_handler(CommandHandler("top", top))
+    application.add_handler(
+        CommandHandler("start_reminder", start_reminder))
+    application.add_handler(CommandHandler(
+        "stop_scheduler", stop_scheduler))
+    application.add_handler(CommandHandler("edit", edit))
+    application.add_handler(
+        CommandHandler("edit_start", edit_arrival_time))
+    application.add_handler(
+        CommandHandler("edit_end", edit_departure_time))
+    application.add_handler(CommandHandler(
+        "start_dailytips", start_dailytips))
+    application.add_handler(CommandHandler(
+        "stop_dailytips", stop_dailytips))
+    application.add_handler(CommandHandler("status", active_users))
+    application.add_handler(CommandHandler(
+        "start_currency", start_currency))
+    application.add_handler(CommandHandler(
+        "stop_currency", stop_currency))
+    application.add_handler(
+        MessageHandler(filters.COMMAND, handle_unknown_command)
+    )
+
+
+def configure_application():
+    """
+    Готовит Application к запуску: хуки жизненного цикла, кэши в памяти
+    и обработчики. Общая часть для polling (start_bot) и webhook (ASGI).
+    """
+    application = get_bot_application()
+    application.post_init = on_startup
+    application.post_stop = on_stop
+    application.post_shutdown = on_shutdown
+    active_sessions.load()
+    company_index.load()
+    season_leaderboard.load(get_active_season())
+    register_handlers(application)
+    return application
+
+
 class Command(BaseCommand):
     help = "Запуск бота Телеграмм"
 
     def handle(self, *args, **options):
-        application = get_bot_application()
-
-        conv_handler = ConversationHandler(
-            entry_points=[
-                CommandHandler("join", join),
-            ],
-            states={
-                SELECT_CO: [MessageHandler(
-                    filters.TEXT & ~filters.COMMAND, select_company)],
-                JOIN_CO: [MessageHandler(
-                    filters.TEXT & ~filters.COMMAND, add_new_company)],
-            },
-            fallbacks=[CommandHandler("cancel", cancel)],
-        )
-
-        application.add_handler(conv_handler)
-        application.add_handler(CommandHandler("help", help))
-        application.add_handler(CommandHandler("site", site))
-        application.add_handler(
-            CommandHandler("get_chat_info", get_chat_info))
-        application.add_handler(CommandHandler("leave", leave))
-        application.add_handler(CommandHandler("mew", mew))
-        application.add_handler(
-            CommandHandler("start_weather", start_weather))
-        application.add_handler(CommandHandler("start_stats", start_stats))
-        application.add_handler(CommandHandler("profile", profile))
-        application.add_handler(
-            CommandHandler("start_reminder", start_reminder))
-        application.add_handler(CommandHandler(
-            "stop_scheduler", stop_scheduler))
-        application.add_handler(CommandHandler("edit", edit))
-        application.add_handler(
-            CommandHandler("edit_start", edit_arrival_time))
-        application.add_handler(
-            CommandHandler("edit_end", edit_departure_time))
-        application.add_handler(CommandHandler(
-            "start_dailytips", start_dailytips))
-        application.add_handler(CommandHandler(
-            "stop_dailytips", stop_dailytips))
-        application.add_handler(CommandHandler("status", active_users))
-        application.add_handler(CommandHandler(
-            "start_currency", start_currency))
-        application.add_handler(CommandHandler(
-            "stop_currency", stop_currency))
-        application.add_handler(
-            MessageHandler(filters.COMMAND, handle_unknown_command)
-        )
+        if settings.TELEGRAM_WEBHOOK_URL:
+            raise CommandError(
+                "Задан TELEGRAM_WEBHOOK_URL: бот работает в режиме webhook "
+                "внутри ASGI-приложения (config.asgi), polling не нужен.")
+        application = configure_application()
         self.stdout.write(self.style.SUCCESS("Бот запускается... "
                                              "Нажмите Ctrl+C для остановки."))
         try:
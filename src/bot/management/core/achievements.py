@@ -0,0 +1,287 @@
+import logging
+import os
+import random
+from datetime import timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import (
+    Avg,
+    Count,
+    F,
+    Max,
+    Min,
+    OuterRef,
+    Q,
+    Subquery,
+    Sum,
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from bot.management.core.bot_constants import BotAchievementsCfg
+from bot.management.core.outbox import outbox
+from bot.management.core.utils import normalize_duration_to_seconds
+from bot.models import Achievement, UserAchievementCounter, UserActivity
+
+logger = logging.getLogger(__name__)
+
+ACHIEVEMENTS_MERGE_KEY = "achievements"
+
+
+def achievement_name(achievement: str) -> str:
+    """Отрезает эмодзи от достижения: «👥 Командный игрок» -> «...»."""
+    return achievement.split(" ", 1)[1] if " " in achievement else achievement
+
+
+def get_user_stats(user_id: int, activity: UserActivity) -> dict:
+    """
+    Собирает статистику пользователя, нужную для выдачи достижений.
+
+    Счётчики по истории пользователя считаются одним агрегатом
+    с условными Count, уникальные коллеги за день - вторым запросом.
+    """
+    today = timezone.localdate()
+    join_date = timezone.localdate(activity.join_time)
+    same_company = Q(company=activity.company)
+    same_day = Q(join_date=today)
+
+    user_stats = UserActivity.objects.filter(user_id=user_id).aggregate(
+        company_visits=Count("pk", filter=same_company),
+        same_company_today=Count("pk", filter=same_company & same_day),
+        today_trips=Count("pk", filter=same_day),
+        weekly_trips=Count("pk", filter=Q(
+            join_date__gte=today - timedelta(days=today.weekday()))),
+        avg_duration=Avg(F("leave_time") - F("join_time")),
+    )
+    user_stats["same_day_users"] = UserActivity.objects.filter(
+        company__name__iexact=activity.company.name,
+        join_date=join_date
+    ).values("user_id").distinct().count()
+    return user_stats
+
+
+def check_achievements(user_id: int, activity: UserActivity) -> list[str]:
+    """
+    Синхронно проверяет, какие достижения заработаны за активность.
+    Возвращает список достижений вместе с эмодзи, ничего не сохраняет.
+    """
+    join_time = timezone.localtime(activity.join_time)
+    leave_time = timezone.localtime(activity.leave_time)
+    duration = (leave_time - join_time).total_seconds()
+    new_achievements = []
+
+    user_stats = get_user_stats(user_id, activity)
+
+    if user_stats["company_visits"] == 1:
+        first_visit_achievements = [
+            "🏕️ Я здесь впервые, правда же?",
+            "🌱 Первый визит в компанию!",
+            "👣 Следы первого посещения",
+            "🎯 Дебют в компании состоялся!",
+            "🆕 Новенький в этих краях",
+            "🚩 Первая вылазка в данную локацию",
+            "📌 Точка отсчета моего пути здесь"
+        ]
+        new_achievements.append(random.choice(first_visit_achievements))
+
+    if user_stats["same_company_today"] > 1:
+        revisit_achievements = [
+            "🔄 Дежавю: Снова здесь!",
+            "♻️ Экономлю на пропуске",
+            "📌 Постоянный клиент дня",
+            "🏃 Реверс-раунд: Туда и обратно",
+            "🔄 Повторение - мать учения"
+        ]
+        new_achievements.append(random.choice(revisit_achievements))
+
+    if user_stats["same_day_users"] >= 2:
+        new_achievements.append("👥 Командный игрок")
+
+    if user_stats["today_trips"] > 3:
+        new_achievements.append("🔁 А можно мне ещё выезд?")
+
+    if user_stats["weekly_trips"] > 16:
+        new_achievements.append("🏆 Лучший сотрудник")
+
+    weekday = join_time.weekday()
+    if weekday in [5, 6]:
+        day_name = "субботу" if weekday == 5 else "воскресенье"
+        new_achievements.append(
+            f"📅 Я люблю свою работу, я приду сюда в {day_name}"
+        )
+    if 18 <= join_time.hour < 24:
+        night_achievements = [
+            "🌚 Ночная смена? Или просто забыл уйти?",
+            "🦇 Бэтмен бы позавидовал моему графику",
+            "☕ Кофеиновая капельница подключена",
+            "🌙 'Утро вечера мудренее' — а я ещё тут",
+            "🌃 Ночной досмотр",
+            "🌙 Сова компании",
+            "🦉 Полуночный админ",
+            "🌌 Лунатик"
+        ]
+        new_achievements.append(random.choice(night_achievements))
+
+    if 0 <= join_time.hour < 9:
+        morning_achievements = [
+            "⏰ Проснулся раньше будильника... ха-ха, шутка",
+            "💤 'Я бодр!' *спит*",
+            "🌚 Ночь. Улица. Фонарь. Сервер.",
+            "☕ Кофе? Ещё кофе! И лампочку в зубы...",
+            "📉 Мой мозг сейчас в beta-тестировании",
+            "☕ Кофеиновый марафонец",
+            "🌇 Первый луч и на работе"
+        ]
+        new_achievements.append(random.choice(morning_achievements))
+
+    duration_achievements = BotAchievementsCfg.DURATION_ACHIEVEMENTS
+
+    for (min_val, max_val), achievements in duration_achievements.items():
+        if min_val <= duration < max_val and achievements:
+            new_achievements.append(random.choice(achievements))
+            break
+
+    avg_seconds = normalize_duration_to_seconds(user_stats["avg_duration"])
+    if avg_seconds > 9000:
+        new_achievements.append("🐢 Поспешишь - людей насмешишь")
+
+    edit_achievements = {
+        (1, 2): None,
+        (2, 4): "🕰️ Читер: Часовщик II уровня",
+        (4, float('inf')): "🕰️ Читер: Часовщик III уровня"
+    }
+
+    if activity.edited:
+        new_achievements.append("🕵️♂️ Читер: Часовщик")
+        for (min_edit, max_edit), achievement in edit_achievements.items():
+            if min_edit <= activity.edit_count < max_edit and achievement:
+                new_achievements.append(achievement)
+
+    return new_achievements
+
+
+def save_achievements(user_id: int, username: str,
+                      achievements: list[str]) -> None:
+    """Сохраняет достижения: счётчики и журнал (Achievement.record)."""
+    Achievement.record(
+        user_id, username, [achievement_name(ach) for ach in achievements])
+
+
+class IncompleteAchievementLog(Exception):
+    """Журнал Achievement не покрывает счётчики достижений."""
+
+
+def achievement_log_gap() -> int:
+    """
+    Сколько выдач учтено в UserAchievementCounter, но отсутствует в
+    журнале Achievement: журнал чистили (prune_achievement_log) или
+    выключали (ACHIEVEMENT_AUDIT_LOG).
+    """
+    logged = (
+        Achievement.objects.filter(
+            user_id=OuterRef("user_id"),
+            achievement_name=OuterRef("achievement_name"),
+        )
+        .values("user_id", "achievement_name")
+        .annotate(total=Count("pk"))
+        .values("total")
+    )
+    return (
+        UserAchievementCounter.objects
+        .annotate(logged=Coalesce(Subquery(logged), 0))
+        .filter(count__gt=F("logged"))
+        .aggregate(gap=Sum(F("count") - F("logged")))["gap"]
+    ) or 0
+
+
+def achievement_log_problem() -> Optional[str]:
+    """Почему по журналу Achievement нельзя восстановить историю, или None."""
+    if not settings.ACHIEVEMENT_AUDIT_LOG:
+        return "Журнал достижений выключен (ACHIEVEMENT_AUDIT_LOG=False)"
+    gap = achievement_log_gap()
+    if gap:
+        return (f"В журнале достижений нет {gap} выдач, учтённых "
+                "в счётчиках (журнал чистили или выключали)")
+    return None
+
+
+def rebuild_achievement_counters(force: bool = False) -> int:
+    """
+    Пересобирает UserAchievementCounter по журналу Achievement одной
+    агрегацией по (user_id, achievement_name). Если журнал неполный
+    (см. achievement_log_problem), счётчики из недостающей части
+    потерялись бы, поэтому без force поднимается IncompleteAchievementLog.
+    """
+    if not force:
+        problem = achievement_log_problem()
+        if problem:
+            raise IncompleteAchievementLog(problem)
+    rows = (
+        Achievement.objects.values("user_id", "achievement_name")
+        .annotate(
+            username=Max("username"),
+            count=Count("pk"),
+            first_at=Min("achieved_at"),
+            last_at=Max("achieved_at"),
+        )
+        .order_by()
+    )
+    with transaction.atomic():
+        UserAchievementCounter.objects.all().delete()
+        created = UserAchievementCounter.objects.bulk_create(
+            [UserAchievementCounter(**row) for row in rows],
+            batch_size=1000,
+        )
+    return len(created)
+
+
+def prune_achievement_log(before, chunk_size: int = 5000) -> int:
+    """
+    Удаляет строки журнала Achievement старше before пачками по chunk_size.
+    Счётчики не трогает. Возвращает число удалённых строк.
+    """
+    deleted = 0
+    while True:
+        ids = list(
+            Achievement.objects.filter(achieved_at__lt=before)
+            .order_by("pk")
+            .values_list("pk", flat=True)[:chunk_size]
+        )
+        if not ids:
+            return deleted
+        deleted += Achievement.objects.filter(pk__in=ids).delete()[0]
+
+
+def format_achievements(achievements: list[str]) -> str:
+    """Форматирует достижения списком, схлопывая повторы в «xN»."""
+    if not achievements:
+        return "• Пока ничего 🐱"
+    achievements_count: dict[str, int] = {}
+    for ach in achievements:
+        achievements_count[ach] = achievements_count.get(ach, 0) + 1
+    return "\n".join(
+        f"• {ach} x{count}" if count > 1 else f"• {ach}"
+        for ach, count in achievements_count.items()
+    )
+
+
+def announce_achievements(username: str, achievements: list[str]) -> None:
+    """Ставит в очередь сообщение в группу о новых достижениях."""
+    group_chat_id = os.getenv("TELEGRAM_GROUP_CHAT_ID")
+    if not group_chat_id:
+        logger.warning("TELEGRAM_GROUP_CHAT_ID не установлен, "
+                       "уведомление о достижениях не отправлено.")
+        return
+    outbox.enqueue(
+        group_chat_id,
+        (
+            "🏆 *Новое достижение!*\n"
+            f"Сотрудник: @{username}\n"
+            f"Заслуги:\n{format_achievements(achievements)}\n"
+            "Поздравляем! 🎉"
+        ),
+        merge_key=ACHIEVEMENTS_MERGE_KEY,
+        parse_mode="Markdown"
+    )
@@ -29,6 +29,8 @@ class SiteCfg:
         "\n"
         "/status - показывает актуальный статус всех сотрудников:"
         " кто где находится и с какого времени.\n"
+        "/weather - Текущая погода и прогноз на сегодня\n"
+        "/currency\\_chart <КОД> [week|month|year] - График курса валюты\n"
         "\n"
         "*Планировщик:*\n"
         "/start\\_weather <ЧЧ:ММ> - Установить время отправки погоды\n"
@@ -42,6 +44,7 @@ class SiteCfg:
         "\n"
         "*Дополнительно:*\n"
         "/profile - Показать прогресс и профиль\n"
+        "/top [N] - Таблица лидеров сезона\n"
         "/mew - Получить фото кота\n"
         "/get\\_chat\\_info - Информация о чате"
     )
@@ -134,6 +137,7 @@ class BotAchievementsCfg:
 
 class BotRemidersCfg:
     TRANSPORT_REMINDER_DAYS = {7, 4, 2}
+    DM_CONCURRENCY = 5
 
     TRANSPORT_REMINDER_TEMPLATES = (
         (
@@ -216,6 +220,69 @@ class BotRemidersCfg:
     )
 
 
+class BotOutboxCfg:
+    # Лимиты Telegram: ~20 сообщений в минуту в группу,
+    # ~1 в секунду в личный чат и ~30 в секунду на бота в целом.
+    GROUP_RATE = 20 / 60
+    PRIVATE_RATE = 1.0
+    CHAT_BURST = 3
+    GLOBAL_RATE = 30.0
+    GLOBAL_BURST = 30
+    MERGE_WINDOW = 2.0
+    MAX_ATTEMPTS = 5
+    BACKOFF_BASE = 1.0
+    BACKOFF_MAX = 60.0
+    DRAIN_TIMEOUT = 10.0
+    MAX_MESSAGE_LENGTH = 4096
+    MERGE_SEPARATOR = "\n\n"
+
+
+class BotHttpCfg:
+    LIMIT = 50
+    LIMIT_PER_HOST = 8
+    DNS_CACHE_TTL = 300
+    KEEPALIVE_TIMEOUT = 60
+    TOTAL_TIMEOUT = 20
+    CONNECT_TIMEOUT = 5
+
+
+class BotWeatherCfg:
+    # Время жизни кэша по источникам, секунды.
+    CURRENT_TTL = 10 * 60
+    FORECAST_TTL = 30 * 60
+    MAG_TTL = 15 * 60
+    # Дольше этого устаревшие данные не отдаются, /weather ждёт загрузки.
+    MAX_STALE = 3 * 60 * 60
+
+
+class BotCurrencyChartCfg:
+    WIDTH = 800
+    HEIGHT = 400
+    PADDING = 40
+    DEFAULT_PERIOD = "month"
+    # Сколько отрисованных графиков держать в памяти.
+    CACHE_SIZE = 64
+
+
+class BotWebhookCfg:
+    PATH = "/telegram/webhook/"
+    SECRET_HEADER = b"x-telegram-bot-api-secret-token"
+    MAX_BODY_SIZE = 1024 * 1024
+
+
+class BotUpdatesCfg:
+    # Сколько обновлений может ждать своей очереди (в том числе за lock
+    # пользователя) на каждый одновременно обрабатываемый слот.
+    PENDING_PER_SLOT = 8
+
+
+class BotSchedulerCfg:
+    TIMEZONE = "Europe/Moscow"
+    # Запуск, опоздавший не больше чем на MISFIRE_GRACE_TIME секунд
+    # (в том числе пока бот был выключен), выполняется один раз.
+    MISFIRE_GRACE_TIME = 3 * 60 * 60
+
+
 class BotMessages:
     EDIT_MSG = (
         "⚠️ *Внимание: команда /edit больше не поддерживается!*\n\n"
@@ -242,4 +309,5 @@ class BotMessages:
         "start_stats", "start_reminder", "stop_scheduler",
         "edit", "edit_start", "edit_end", "start_dailytips",
         "stop_dailytips", "join", "cancel", "profile", "status",
-        "start_currency", "stop_currency"]
+        "start_currency", "stop_currency", "top", "weather",
+        "currency_chart"]
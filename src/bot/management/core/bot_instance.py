@@ -6,6 +6,8 @@ from telegram import Bot as SyncBot
 from telegram.ext import Application
 from telegram.request import HTTPXRequest
 
+from bot.management.core.update_processor import PerUserUpdateProcessor
+
 logger = logging.getLogger(__name__)
 
 _bot_application: Optional[Application] = None
@@ -44,6 +46,8 @@ def get_bot_application() -> Application:
             _bot_application = Application.builder()\
                 .token(settings.TELEGRAM_BOT_TOKEN)\
                 .request(request)\
+                .concurrent_updates(PerUserUpdateProcessor(
+                    settings.TELEGRAM_MAX_CONCURRENT_UPDATES))\
                 .build()
             logger.info("Экземпляр приложения успешно создан")
         except Exception as e:
@@ -86,6 +90,10 @@ async def shutdown_bot_application():
     try:
         logger.info("Завершение работы Telegram Application...")
         await _bot_application.stop()
+        # Порядок как в run_polling: post_stop, пока бот ещё может
+        # отправлять сообщения, затем shutdown закрывает его HTTP-клиент.
+        if _bot_application.post_stop:
+            await _bot_application.post_stop(_bot_application)
         await _bot_application.shutdown()
         _is_initialized = False
         logger.info("Telegram Application успешно остановлен")
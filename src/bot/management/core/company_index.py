@@ -0,0 +1,112 @@
+"""
+Триграммный индекс названий организаций для подсказок в /join.
+
+Названия нормализуются (нижний регистр, ё -> е, схлопнутые пробелы)
+и раскладываются на триграммы. Подсказки ранжируются по коэффициенту
+Дайса между множествами триграмм, поэтому находят опечатки, которые
+не являются подстрокой («Ромашкаа», «ромашка», «Ёлка»/«Елка»),
+и не требуют LIKE-сканирования таблицы.
+"""
+import logging
+import re
+import threading
+from collections import Counter, defaultdict
+
+from bot.models import Company
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_company_name(name: str) -> str:
+    """Нижний регистр, ё -> е и одиночные пробелы."""
+    name = name.lower().replace("ё", "е")
+    return _WHITESPACE_RE.sub(" ", name).strip()
+
+
+def trigrams(normalized: str) -> set[str]:
+    padded = f" {normalized} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class CompanyIndex:
+    """
+    Индекс id организации -> название и триграмма -> id организаций.
+
+    Загружается при старте бота и пополняется сигналами Company,
+    так что поиск подсказок не обращается к БД.
+    """
+
+    def __init__(self):
+        self._names: dict[int, str] = {}
+        self._sizes: dict[int, int] = {}
+        self._postings: dict[str, set[int]] = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def load(self) -> int:
+        """Синхронно перестраивает индекс по всем организациям."""
+        companies = list(Company.objects.values_list("id", "name"))
+        with self._lock:
+            self._names.clear()
+            self._sizes.clear()
+            self._postings.clear()
+            for company_id, name in companies:
+                self._add(company_id, name)
+        logger.info(f"Индекс организаций построен: {len(companies)}")
+        return len(companies)
+
+    def add(self, company: Company) -> None:
+        with self._lock:
+            self._remove(company.pk)
+            self._add(company.pk, company.name)
+
+    def remove(self, company_id: int) -> None:
+        with self._lock:
+            self._remove(company_id)
+
+    def suggest(self, query: str, limit: int = 2,
+                cutoff: float = 0.5) -> list[str]:
+        """
+        До `limit` названий, похожих на query, по убыванию сходства.
+        cutoff - минимальный коэффициент Дайса (0..1).
+        """
+        grams = trigrams(normalize_company_name(query))
+        if not grams:
+            return []
+        with self._lock:
+            shared = Counter()
+            for gram in grams:
+                shared.update(self._postings.get(gram, ()))
+            scored = []
+            for company_id, common in shared.items():
+                score = 2 * common / (len(grams) + self._sizes[company_id])
+                if score >= cutoff:
+                    scored.append((score, self._names[company_id]))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [name for _, name in scored[:limit]]
+
+    def _add(self, company_id: int, name: str) -> None:
+        grams = trigrams(normalize_company_name(name))
+        self._names[company_id] = name
+        self._sizes[company_id] = len(grams)
+        for gram in grams:
+            self._postings[gram].add(company_id)
+
+    def _remove(self, company_id: int) -> None:
+        name = self._names.pop(company_id, None)
+        if name is None:
+            return
+        self._sizes.pop(company_id, None)
+        for gram in trigrams(normalize_company_name(name)):
+            ids = self._postings.get(gram)
+            if ids is not None:
+                ids.discard(company_id)
+                if not ids:
+                    del self._postings[gram]
+
+
+company_index = CompanyIndex()
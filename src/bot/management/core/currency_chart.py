@@ -0,0 +1,175 @@
+"""
+Графики курсов валют для /currency_chart.
+
+PNG рисуется Pillow в пуле потоков, чтобы не блокировать цикл событий.
+Готовый график кэшируется по ключу (валюта, период, время последнего
+курса): пока новых курсов нет, повторный запрос не рисует картинку
+заново, а после первой отправки переиспользует file_id Telegram и не
+загружает файл повторно.
+"""
+import asyncio
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from decimal import Decimal
+from io import BytesIO
+from typing import Optional
+
+from PIL import Image, ImageDraw, ImageFont
+
+from bot.management.core.bot_constants import BotCurrencyChartCfg
+from bot.management.core.currency_utils import (
+    CURRENCY_CONFIG,
+    PERIOD_DAYS,
+    get_currency_series,
+)
+from bot.models import CurrencyLatest
+
+logger = logging.getLogger(__name__)
+
+PERIOD_NAMES = {
+    "week": "неделю",
+    "month": "месяц",
+    "year": "год",
+}
+
+BACKGROUND = (255, 255, 255)
+GRID = (225, 225, 225)
+TEXT = (60, 60, 60)
+UP = (46, 160, 67)
+DOWN = (218, 54, 51)
+
+
+@dataclass
+class ChartEntry:
+    png: bytes
+    caption: str
+    file_id: Optional[str] = None
+
+
+class ChartCache:
+    """LRU-кэш графиков на CACHE_SIZE записей."""
+
+    def __init__(self, size: int = BotCurrencyChartCfg.CACHE_SIZE):
+        self._size = size
+        self._entries: OrderedDict[tuple, ChartEntry] = OrderedDict()
+
+    def get(self, key: tuple) -> Optional[ChartEntry]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: tuple, entry: ChartEntry) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._size:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+chart_cache = ChartCache()
+
+
+def _format_rate(rate) -> str:
+    return f"{rate:,.4f}".replace(",", " ")
+
+
+def render_currency_chart(title: str, points) -> bytes:
+    """Рисует линейный график [(дата, курс), ...] и возвращает PNG."""
+    width, height = BotCurrencyChartCfg.WIDTH, BotCurrencyChartCfg.HEIGHT
+    pad = BotCurrencyChartCfg.PADDING
+    image = Image.new("RGB", (width, height), BACKGROUND)
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default()
+
+    rates = [float(rate) for _, rate in points]
+    low, high = min(rates), max(rates)
+    span = (high - low) or 1.0
+    left, right = pad * 2, width - pad
+    top, bottom = pad, height - pad
+    step = (right - left) / max(len(rates) - 1, 1)
+
+    for i in range(5):
+        y = top + (bottom - top) * i / 4
+        draw.line([(left, y), (right, y)], fill=GRID)
+    xy = [
+        (left + i * step, bottom - (rate - low) / span * (bottom - top))
+        for i, rate in enumerate(rates)
+    ]
+    color = UP if rates[-1] >= rates[0] else DOWN
+    if len(xy) > 1:
+        draw.line(xy, fill=color, width=3, joint="curve")
+    else:
+        x, y = xy[0]
+        draw.ellipse([(x - 3, y - 3), (x + 3, y + 3)], fill=color)
+
+    draw.text((left, pad / 4), title, fill=TEXT, font=font)
+    draw.text((pad / 4, top), f"{high:.4g}", fill=TEXT, font=font)
+    draw.text((pad / 4, bottom - 10), f"{low:.4g}", fill=TEXT, font=font)
+    draw.text((left, bottom + 8), points[0][0].isoformat(),
+              fill=TEXT, font=font)
+    draw.text((right - 60, bottom + 8), points[-1][0].isoformat(),
+              fill=TEXT, font=font)
+
+    buffer = BytesIO()
+    image.save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+
+def _caption(currency: str, period: str, points) -> str:
+    config = CURRENCY_CONFIG[currency]
+    first, last = points[0][1], points[-1][1]
+    change = last - first
+    percent = change / first * Decimal(100) if first else Decimal(0)
+    sign = "+" if change > 0 else ""
+    return (f"{config['emoji']} {config['display_name']} "
+            f"за {PERIOD_NAMES[period]}: {_format_rate(last)} "
+            f"({sign}{percent:.2f}%)")
+
+
+async def get_chart(currency: str, period: str) -> Optional[tuple]:
+    """
+    Возвращает (ключ, ChartEntry) или None, если данных нет.
+    Рисует график, только если его нет в кэше для текущего курса.
+    """
+    latest_date = await CurrencyLatest.objects.filter(
+        currency=currency).values_list("date", flat=True).afirst()
+    if latest_date is None:
+        return None
+    key = (currency, period, latest_date)
+    entry = chart_cache.get(key)
+    if entry is not None:
+        return key, entry
+
+    points = await get_currency_series(currency, PERIOD_DAYS[period])
+    if not points:
+        return None
+    title = (f"{CURRENCY_CONFIG[currency]['display_name']}, "
+             f"{PERIOD_DAYS[period]}d")
+    png = await asyncio.get_running_loop().run_in_executor(
+        None, render_currency_chart, title, points)
+    entry = ChartEntry(png=png, caption=_caption(currency, period, points))
+    chart_cache.put(key, entry)
+    return key, entry
+
+
+async def send_currency_chart(message, currency: str, period: str) -> bool:
+    """
+    Отвечает на message графиком. Возвращает False, если данных нет.
+    После первой отправки запоминает file_id и дальше шлёт только его.
+    """
+    chart = await get_chart(currency, period)
+    if chart is None:
+        return False
+    key, entry = chart
+    if entry.file_id is not None:
+        await message.reply_photo(entry.file_id, caption=entry.caption)
+        return True
+    sent = await message.reply_photo(entry.png, caption=entry.caption)
+    if sent and sent.photo:
+        entry.file_id = sent.photo[-1].file_id
+        logger.debug(f"График {key} загружен, file_id сохранён")
+    return True
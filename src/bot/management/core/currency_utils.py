@@ -2,15 +2,20 @@ import asyncio
 import json
 import logging
 import os
-from datetime import datetime
+from datetime import datetime, time, timedelta
 from decimal import Decimal, InvalidOperation
 from zoneinfo import ZoneInfo
 
 import aiohttp
 from asgiref.sync import sync_to_async
-from django.db.models import F
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
 
-from bot.models import CurrencyRate
+from bot.management.core.http import http_client
+from bot.management.core.outbox import outbox
+from bot.models import CurrencyDaily, CurrencyLatest, CurrencyRate
 
 logger = logging.getLogger(__name__)
 
@@ -127,6 +132,12 @@ CURRENCY_CONFIG = {
 
 ALL_TRACKED_CURRENCIES = list(CURRENCY_CONFIG.keys())
 
+PERIOD_DAYS = {
+    "week": 7,
+    "month": 30,
+    "year": 365,
+}
+
 
 async def _fetch_cbr_rates(session):
     """Приватная функция для получения данных от ЦБР."""
@@ -184,56 +195,183 @@ async def fetch_currency_rates():
     Возвращает словарь вида {"CURRENCY_CODE": Decimal(rate)}.
     """
     rates = {}
-    async with aiohttp.ClientSession() as session:
-        cbr_task = _fetch_cbr_rates(session)
-        coingecko_task = _fetch_coingecko_rates(session)
+    session = http_client.session()
+    cbr_task = _fetch_cbr_rates(session)
+    coingecko_task = _fetch_coingecko_rates(session)
 
-        cbr_valute, coingecko_data = await asyncio.gather(
-            cbr_task, coingecko_task
-        )
+    cbr_valute, coingecko_data = await asyncio.gather(
+        cbr_task, coingecko_task
+    )
 
-        if cbr_valute:
-            for code, conf in CURRENCY_CONFIG.items():
-                if conf["source"] == SOURCE_CBR and conf["api_id"] in cbr_valute: # noqa
-                    cbr_data = cbr_valute[conf["api_id"]]
+    if cbr_valute:
+        for code, conf in CURRENCY_CONFIG.items():
+            if conf["source"] == SOURCE_CBR and conf["api_id"] in cbr_valute: # noqa
+                cbr_data = cbr_valute[conf["api_id"]]
+                try:
+                    value = Decimal(str(cbr_data["Value"]))
+                    nominal = Decimal(str(cbr_data.get("Nominal", 1)))
+                    rates[code] = value / nominal
+                except (KeyError, TypeError, InvalidOperation) as e:
+                    logger.warning(
+                        f"Не удалось распарсить ЦБР для {code}: {e}, "
+                        f"данные: {cbr_data}"
+                    )
+
+    if coingecko_data:
+        for code, conf in CURRENCY_CONFIG.items():
+            if conf["source"] == SOURCE_COINGECKO:
+                api_id = conf["api_id"]
+                target = conf["target_currency"]
+                if (
+                    api_id in coingecko_data
+                    and target in coingecko_data[api_id]
+                ):
                     try:
-                        value = Decimal(str(cbr_data["Value"]))
-                        nominal = Decimal(str(cbr_data.get("Nominal", 1)))
-                        rates[code] = value / nominal
-                    except (KeyError, TypeError, InvalidOperation) as e:
+                        rate = Decimal(
+                            str(coingecko_data[api_id][target])
+                        )
+                        rates[code] = rate
+                    except (
+                        KeyError, TypeError, InvalidOperation
+                    ) as e:
                         logger.warning(
-                            f"Не удалось распарсить ЦБР для {code}: {e}, "
-                            f"данные: {cbr_data}"
+                            f"Err CoinGecko {code}: {e}, "
+                            f"data: {coingecko_data.get(api_id, {})}"
                         )
-
-        if coingecko_data:
-            for code, conf in CURRENCY_CONFIG.items():
-                if conf["source"] == SOURCE_COINGECKO:
-                    api_id = conf["api_id"]
-                    target = conf["target_currency"]
-                    if (
-                        api_id in coingecko_data
-                        and target in coingecko_data[api_id]
-                    ):
-                        try:
-                            rate = Decimal(
-                                str(coingecko_data[api_id][target])
-                            )
-                            rates[code] = rate
-                        except (
-                            KeyError, TypeError, InvalidOperation
-                        ) as e:
-                            logger.warning(
-                                f"Err CoinGecko {code}: {e}, "
-                                f"data: {coingecko_data.get(api_id, {})}"
-                            )
     return rates
 
 
 @sync_to_async
 def _bulk_create_currency_rates(currency_rate_objects):
-    """Вспомогательная функция для массового создания объектов."""
-    CurrencyRate.objects.bulk_create(currency_rate_objects)
+    """Сохраняет курсы и обновляет CurrencyLatest в одной транзакции."""
+    with transaction.atomic():
+        created = CurrencyRate.objects.bulk_create(currency_rate_objects)
+        update_currency_latest(created)
+
+
+def update_currency_latest(rates):
+    """
+    Сдвигает CurrencyLatest: текущий курс становится предыдущим,
+    новый - текущим. Вызывается внутри транзакции записи курсов.
+    """
+    latest = {
+        row.currency: row for row in
+        CurrencyLatest.objects.select_for_update().filter(
+            currency__in=[rate.currency for rate in rates])
+    }
+    to_create, to_update = [], []
+    for rate in rates:
+        row = latest.get(rate.currency)
+        if row is None:
+            to_create.append(CurrencyLatest(
+                currency=rate.currency, rate=rate.rate, date=rate.date))
+            continue
+        row.previous_rate, row.previous_date = row.rate, row.date
+        row.rate, row.date = rate.rate, rate.date
+        to_update.append(row)
+    CurrencyLatest.objects.bulk_create(to_create)
+    CurrencyLatest.objects.bulk_update(
+        to_update, ["rate", "date", "previous_rate", "previous_date"])
+
+
+def rebuild_currency_latest() -> int:
+    """
+    Заполняет CurrencyLatest по истории: ROW_NUMBER() в разрезе валюты
+    оставляет по две последние записи, так что читается O(число валют)
+    строк. Возвращает число валют.
+    """
+    ranked = (
+        CurrencyRate.objects.annotate(
+            position=Window(
+                RowNumber(),
+                partition_by=F("currency"),
+                order_by=F("date").desc(),
+            )
+        )
+        .filter(position__lte=2)
+        .order_by("currency", "position")
+    )
+    rows = {}
+    for rate in ranked:
+        row = rows.get(rate.currency)
+        if row is None:
+            rows[rate.currency] = CurrencyLatest(
+                currency=rate.currency, rate=rate.rate, date=rate.date)
+        else:
+            row.previous_rate, row.previous_date = rate.rate, rate.date
+    with transaction.atomic():
+        CurrencyLatest.objects.all().delete()
+        CurrencyLatest.objects.bulk_create(rows.values())
+    return len(rows)
+
+
+def _local_midnight(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _flush_currency_daily(bars) -> int:
+    CurrencyDaily.objects.bulk_create(
+        bars,
+        update_conflicts=True,
+        unique_fields=["currency", "date"],
+        update_fields=["open", "high", "low", "close", "samples"],
+    )
+    return len(bars)
+
+
+def compact_currency_rates(keep_days: int = 30,
+                           chunk_size: int = 5000) -> tuple[int, int]:
+    """
+    Сворачивает сырые курсы CurrencyRate в дневные бары CurrencyDaily.
+
+    Бары пересчитываются для всех завершённых дней, начиная с последнего
+    уже свёрнутого (он мог быть неполным), за один проход по индексу
+    (currency, date). Сырые записи старше keep_days дней после этого
+    удаляются пачками по chunk_size. Возвращает (записано баров,
+    удалено сырых записей).
+    """
+    today = timezone.localdate()
+    rates = CurrencyRate.objects.filter(date__lt=_local_midnight(today))
+    last_day = (CurrencyDaily.objects.order_by("-date")
+                .values_list("date", flat=True).first())
+    if last_day is not None:
+        rates = rates.filter(date__gte=_local_midnight(last_day))
+
+    written = 0
+    bars = []
+    bar = None
+    for currency, date, rate in rates.order_by(
+            "currency", "date").values_list(
+            "currency", "date", "rate").iterator(chunk_size=chunk_size):
+        day = timezone.localdate(date)
+        if bar is None or bar.currency != currency or bar.date != day:
+            if len(bars) >= chunk_size:
+                written += _flush_currency_daily(bars)
+                bars = []
+            bar = CurrencyDaily(currency=currency, date=day, open=rate,
+                                high=rate, low=rate, close=rate, samples=0)
+            bars.append(bar)
+        bar.high = max(bar.high, rate)
+        bar.low = min(bar.low, rate)
+        bar.close = rate
+        bar.samples += 1
+    if bars:
+        written += _flush_currency_daily(bars)
+
+    cutoff = _local_midnight(today - timedelta(days=keep_days))
+    deleted = 0
+    while True:
+        ids = list(
+            CurrencyRate.objects.filter(date__lt=cutoff)
+            .order_by("pk")
+            .values_list("pk", flat=True)[:chunk_size]
+        )
+        if not ids:
+            break
+        deleted += CurrencyRate.objects.filter(pk__in=ids).delete()[0]
+    logger.info(f"Свёрнуто дневных баров курсов: {written}, "
+                f"удалено сырых записей: {deleted}")
+    return written, deleted
 
 
 async def save_currency_rates(rates):
@@ -257,48 +395,50 @@ async def save_currency_rates(rates):
         logger.info("Нет курсов для сохранения.")
 
 
+async def _load_currency_latest():
+    return {
+        row.currency: row async for row in CurrencyLatest.objects.filter(
+            currency__in=ALL_TRACKED_CURRENCIES)
+    }
+
+
+def _change(current, previous):
+    """Абсолютное и процентное изменение курса."""
+    if previous == Decimal(0):
+        return Decimal(0), Decimal(0)
+    change = current - previous
+    return change, (change / previous) * Decimal(100)
+
+
 async def get_currency_changes():
     """
     Получает текущие курсы и их изменения.
     Возвращает: {"CODE": {"current": Dec, "change": Dec, "percent": Dec}}
     """
     changes = {}
-    latest_rates_query = CurrencyRate.objects.filter(
-        currency__in=ALL_TRACKED_CURRENCIES
-    ).order_by("currency", "-date")
-
-    all_latest_rates = [item async for item in latest_rates_query]
-
-    grouped_rates = {}
-    for rate_obj in all_latest_rates:
-        if rate_obj.currency not in grouped_rates:
-            grouped_rates[rate_obj.currency] = []
-        if len(grouped_rates[rate_obj.currency]) < 2:
-            grouped_rates[rate_obj.currency].append(rate_obj)
+    latest = await _load_currency_latest()
+    if not latest and await CurrencyRate.objects.aexists():
+        # Таблица ещё не заполнена (первый запуск после обновления).
+        await sync_to_async(rebuild_currency_latest)()
+        latest = await _load_currency_latest()
 
     for currency in ALL_TRACKED_CURRENCIES:
-        rates_for_curr = grouped_rates.get(currency, [])
-        if len(rates_for_curr) < 1:
+        row = latest.get(currency)
+        if row is None:
             logger.debug(
                 f"Недостаточно данных для \"{currency}\" "
                 f"для расчета изменений."
             )
             continue
 
-        current = rates_for_curr[0].rate
+        current = row.rate
         previous = (
-            rates_for_curr[1].rate
-            if len(rates_for_curr) > 1
+            row.previous_rate
+            if row.previous_rate is not None
             else current
         )
 
-        if previous == Decimal(0):
-            change = Decimal(0)
-            percent = Decimal(0)
-        else:
-            change = current - previous
-            percent = (change / previous) * Decimal(100)
-
+        change, percent = _change(current, previous)
         changes[currency] = {
             "current": current,
             "change": change,
@@ -307,6 +447,66 @@ async def get_currency_changes():
     return changes
 
 
+async def get_currency_period_changes(period: str):
+    """
+    Изменение курсов за неделю, месяц или год (ключ PERIOD_DAYS).
+    База - закрытие последнего дневного бара CurrencyDaily не позже
+    начала периода; бары старше ещё одного периода не учитываются.
+    Возвращает: {"CODE": {"current", "change", "percent", "since"}}
+    """
+    days = PERIOD_DAYS[period]
+    start = timezone.localdate() - timedelta(days=days)
+    latest = await _load_currency_latest()
+    base = {
+        bar.currency: bar async for bar in CurrencyDaily.objects.filter(
+            currency__in=list(latest),
+            date__lte=start,
+            date__gt=start - timedelta(days=days),
+        ).annotate(
+            position=Window(
+                RowNumber(),
+                partition_by=F("currency"),
+                order_by=F("date").desc(),
+            )
+        ).filter(position=1)
+    }
+    changes = {}
+    for currency in ALL_TRACKED_CURRENCIES:
+        row, bar = latest.get(currency), base.get(currency)
+        if row is None or bar is None:
+            continue
+        change, percent = _change(row.rate, bar.close)
+        changes[currency] = {
+            "current": row.rate,
+            "change": change,
+            "percent": percent,
+            "since": bar.date,
+        }
+    return changes
+
+
+async def get_currency_series(currency: str, days: int):
+    """
+    Ряд курса за последние days дней: закрытия дневных баров CurrencyDaily,
+    а за ещё не свёрнутые дни - сырые записи CurrencyRate.
+    Возвращает [(дата, курс), ...] по возрастанию даты.
+    """
+    start = timezone.localdate() - timedelta(days=days)
+    points = [
+        (bar.date, bar.close) async for bar in CurrencyDaily.objects.filter(
+            currency=currency, date__gt=start).order_by("date")
+    ]
+    raw_since = points[-1][0] if points else start
+    points += [
+        (timezone.localdate(date), rate)
+        async for date, rate in CurrencyRate.objects.filter(
+            currency=currency,
+            date__gte=_local_midnight(raw_since + timedelta(days=1)),
+        ).order_by("date").values_list("date", "rate")
+    ]
+    return points
+
+
 async def send_currency_report(bot):
     """Формирует и отправляет отчет в группу."""
     target_chat_id = os.getenv("TELEGRAM_GROUP_CHAT_ID")
@@ -315,6 +515,7 @@ async def send_currency_report(bot):
         return
 
     changes = await get_currency_changes()
+    weekly = await get_currency_period_changes("week")
 
     fiat_lines = []
     crypto_lines = []
@@ -347,6 +548,10 @@ async def send_currency_report(bot):
         )
         line_part2 = f"(`{sign}{change:,.2f}` / `{sign}{percent:,.2f}%`)"
         line = line_part1 + line_part2
+        week = weekly.get(currency_code)
+        if week:
+            week_sign = "+" if week["percent"] > 0 else ""
+            line += f" · за неделю `{week_sign}{week['percent']:,.2f}%`"
 
         if config["source"] == SOURCE_CBR:
             fiat_lines.append(line)
@@ -374,12 +579,5 @@ async def send_currency_report(bot):
 
     final_message = "\n".join(message_parts)
 
-    try:
-        await bot.send_message(
-            chat_id=target_chat_id,
-            text=final_message,
-            parse_mode="Markdown"
-        )
-        logger.info(f"Отчет отправлен в чат {target_chat_id}")
-    except Exception as e:
-        logger.error(f"Ошибка отправки отчета: {e}")
+    outbox.enqueue(target_chat_id, final_message, parse_mode="Markdown")
+    logger.info(f"Отчет поставлен в очередь для чата {target_chat_id}")
@@ -1,6 +1,18 @@
+from dataclasses import dataclass
+from datetime import datetime, time, timedelta
+from typing import Callable, Iterable, Optional
+
 from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.utils import timezone
 
-from bot.models import LevelTitle, SeasonRank
+from bot.management.core.leaderboard import season_leaderboard
+from bot.management.core.reference import (
+    LevelLadder,
+    get_active_season,
+    get_level_ladder,
+)
+from bot.models import Achievement, Season, SeasonRank, UserActivity
 
 ACHIEVEMENT_BONUSES = {
     "Первая кровь": 1,
@@ -12,16 +24,29 @@ ACHIEVEMENT_BONUSES = {
 }
 
 
-async def get_level_info(rank: SeasonRank) -> dict:
-    current_level_obj = await sync_to_async(
-        lambda: LevelTitle.objects.filter(min_experience__lte=rank.experience)
-                                  .order_by("-level")
-                                  .first()
-    )()
+def resolve_level_info(rank: SeasonRank) -> dict:
+    """
+    Рассчитывает звание и прогресс уровня для ранга по кэшированной
+    лестнице уровней (без запросов к БД, пока кэш не устарел).
+    """
+    return _level_info(rank, get_level_ladder())
+
+
+def resolve_level_info_many(ranks: Iterable[SeasonRank]) -> list[dict]:
+    """
+    То же, что resolve_level_info, для списка рангов: лестница берётся
+    один раз, так что на весь список не больше одного запроса
+    (и ни одного, если лестница уже в кэше).
+    """
+    ladder = get_level_ladder()
+    return [_level_info(rank, ladder) for rank in ranks]
+
+
+def _level_info(rank: SeasonRank, ladder: LevelLadder) -> dict:
+    current_level_obj = ladder.for_experience(rank.experience)
 
     if not current_level_obj:
-        current_level_obj = await sync_to_async(
-            lambda: LevelTitle.objects.order_by("level").first())()
+        current_level_obj = ladder.first()
 
     if not current_level_obj:
         return {
@@ -33,10 +58,7 @@ async def get_level_info(rank: SeasonRank) -> dict:
             "exp_in_level": 0,
             "exp_to_next": 0,
         }
-    next_level_obj = await sync_to_async(
-        lambda: LevelTitle.objects.filter(
-            level=current_level_obj.level + 1).first()
-    )()
+    next_level_obj = ladder.get(current_level_obj.level + 1)
 
     title = current_level_obj.title
     category = current_level_obj.get_category_display()  # type: ignore
@@ -68,6 +90,56 @@ async def get_level_info(rank: SeasonRank) -> dict:
     }
 
 
+async def get_level_info(rank: SeasonRank) -> dict:
+    return await sync_to_async(resolve_level_info)(rank)
+
+
+async def get_level_info_many(ranks: Iterable[SeasonRank]) -> list[dict]:
+    """Информация об уровнях для списка рангов за один переход в поток."""
+    return await sync_to_async(resolve_level_info_many)(list(ranks))
+
+
+def update_season_rank(user_id: int, exp_earned: int,
+                       time_spent: timedelta, username: str):
+    """
+    Начисляет опыт в ранг активного сезона и пересчитывает уровень.
+    Возвращает (rank, level_up, new_level).
+    """
+    season = get_active_season()
+    if not season:
+        return None, False, 0
+
+    rank, created = SeasonRank.objects.get_or_create(
+        user_id=user_id,
+        season=season,
+        defaults={
+            "username": username,
+            "experience": exp_earned,
+            "total_time": time_spent,
+            "visits_count": 1,
+        }
+    )
+
+    old_level = rank.level
+    if not created:
+        rank.experience += exp_earned
+        rank.total_time += time_spent
+        rank.visits_count += 1
+    else:
+        rank.username = username  # на всякий случай
+
+    correct = get_level_ladder().for_experience(rank.experience)
+
+    if correct and correct.level != rank.level:
+        rank.level = correct.level
+        rank.level_title = correct
+
+    level_up = rank.level > old_level
+    rank.save()
+    transaction.on_commit(lambda: season_leaderboard.update(rank))
+    return rank, level_up, rank.level
+
+
 def calculate_experience(activity,
                          achievements,
                          daily_visits_count: int) -> int:
@@ -111,3 +183,118 @@ def calculate_experience(activity,
             achievements_exp += ACHIEVEMENT_BONUSES[achievement]
     total_exp = base_exp + time_exp + achievements_exp
     return max(0, int(round(total_exp)))
+
+
+# «Первую кровь» выдаёт /join, и в calculate_experience она не попадает.
+REPLAYED_BONUSES = [
+    name for name in ACHIEVEMENT_BONUSES if name != "Первая кровь"]
+
+
+@dataclass
+class SeasonTotals:
+    username: Optional[str] = None
+    experience: int = 0
+    total_time: timedelta = timedelta()
+    visits_count: int = 0
+
+
+def iter_activity_history(date_from, date_to, chunk_size: int = 2000,
+                          achievement_names: Optional[list[str]] = None):
+    """
+    Потоково перебирает завершённые активности с join_date в
+    [date_from, date_to] и выдаёт (activity, achievements, day_visit).
+    achievements - только из achievement_names (по умолчанию
+    REPLAYED_BONUSES).
+
+    Активности и достижения читаются двумя курсорами iterator(chunk_size),
+    оба упорядочены по (user_id, времени), и сливаются за один проход.
+    Достижение относится к активности пользователя, после прибытия в
+    которую оно получено (до следующего прибытия). day_visit - номер
+    выезда пользователя за день: именно его LeaveService видел как
+    daily_visits_count в момент ухода.
+    """
+    tz = timezone.get_current_timezone()
+    start = datetime.combine(date_from, time.min, tzinfo=tz)
+    end = datetime.combine(date_to + timedelta(days=1), time.min, tzinfo=tz)
+    activities = (
+        UserActivity.objects.filter(
+            join_date__gte=date_from,
+            join_date__lte=date_to,
+            leave_time__isnull=False,
+        )
+        .order_by("user_id", "join_time", "pk")
+        .only("user_id", "username", "join_time", "leave_time", "join_date")
+        .iterator(chunk_size=chunk_size)
+    )
+    achievements = (
+        Achievement.objects.filter(
+            achieved_at__gte=start,
+            achieved_at__lt=end,
+            achievement_name__in=achievement_names or REPLAYED_BONUSES,
+        )
+        .order_by("user_id", "achieved_at")
+        .values_list("user_id", "achieved_at", "achievement_name")
+        .iterator(chunk_size=chunk_size)
+    )
+    pending_achievement = next(achievements, None)
+
+    current = next(activities, None)
+    day_key, day_visits = None, 0
+    while current is not None:
+        following = next(activities, None)
+        window_end = (
+            following.join_time
+            if following is not None and following.user_id == current.user_id
+            else None
+        )
+
+        earned = []
+        while pending_achievement is not None:
+            user_id, achieved_at, name = pending_achievement
+            if (user_id, achieved_at) < (current.user_id, current.join_time):
+                pending_achievement = next(achievements, None)
+                continue
+            if user_id != current.user_id or (
+                    window_end is not None and achieved_at >= window_end):
+                break
+            earned.append(name)
+            pending_achievement = next(achievements, None)
+
+        if day_key != (current.user_id, current.join_date):
+            day_key, day_visits = (current.user_id, current.join_date), 0
+        day_visits += 1
+
+        yield current, earned, day_visits
+        current = following
+
+
+def replay_season_experience(
+    season: Season,
+    chunk_size: int = 2000,
+    progress: Optional[Callable[[int], None]] = None,
+) -> dict[int, SeasonTotals]:
+    """
+    Пересчитывает опыт, время и число выездов сезона по истории
+    (см. iter_activity_history). Сезон - выезды с join_date от
+    start_date до end_date (или до сегодня, если конец не задан).
+    """
+    totals: dict[int, SeasonTotals] = {}
+    processed = 0
+    history = iter_activity_history(
+        season.start_date,
+        season.end_date or timezone.localdate(),
+        chunk_size=chunk_size,
+    )
+    for activity, earned, day_visits in history:
+        user_totals = totals.setdefault(activity.user_id, SeasonTotals())
+        user_totals.experience += calculate_experience(
+            activity, earned, day_visits)
+        user_totals.total_time += activity.leave_time - activity.join_time
+        user_totals.visits_count += 1
+        if activity.username:
+            user_totals.username = activity.username
+
+        processed += 1
+        if progress and processed % chunk_size == 0:
+            progress(processed)
+    return totals
@@ -0,0 +1,143 @@
+"""
+Общая aiohttp-сессия бота для погоды, курсов валют, /mew и т.п.
+
+Сессия живёт столько же, сколько Application: открывается в post_init,
+закрывается в post_shutdown. Соединения и DNS-ответы переиспользуются
+между запросами (keep-alive, ttl_dns_cache), число соединений ограничено
+на хост. Время ответа каждого хоста копится в счётчиках (http_client.stats).
+"""
+import asyncio
+import logging
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Optional
+
+import aiohttp
+
+from bot.management.core.bot_constants import BotHttpCfg
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class HostStats:
+    requests: int = 0
+    errors: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+
+    @property
+    def avg_seconds(self) -> float:
+        return self.total_seconds / self.requests if self.requests else 0.0
+
+    def add(self, elapsed: float, failed: bool) -> None:
+        self.requests += 1
+        self.errors += failed
+        self.total_seconds += elapsed
+        self.max_seconds = max(self.max_seconds, elapsed)
+
+
+class HttpClient:
+    def __init__(self):
+        self._session: Optional[aiohttp.ClientSession] = None
+        # Цикл, в котором открыта сессия (ClientSession.loop устарел).
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stats: dict[str, HostStats] = {}
+        self._closing: set[asyncio.Future] = set()
+
+    @property
+    def stats(self) -> dict[str, HostStats]:
+        return dict(self._stats)
+
+    async def start(self) -> None:
+        """Открывает сессию. Вызывается в post_init."""
+        if self._session is None or self._session.closed:
+            self._session = self._create_session()
+            logger.info("HTTP-сессия бота открыта")
+
+    async def close(self) -> None:
+        """Закрывает сессию и пишет в лог накопленную статистику хостов."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            logger.info("HTTP-сессия бота закрыта")
+        self._session = None
+        for host, stats in sorted(self._stats.items()):
+            logger.info(
+                f"{host}: запросов {stats.requests}, ошибок {stats.errors}, "
+                f"среднее {stats.avg_seconds * 1000:.0f} мс, "
+                f"максимум {stats.max_seconds * 1000:.0f} мс")
+
+    def session(self) -> aiohttp.ClientSession:
+        """
+        Общая сессия. Вне жизненного цикла бота (тесты, разовые команды)
+        открывается лениво при первом обращении.
+        """
+        loop = asyncio.get_running_loop()
+        if (self._session is not None and not self._session.closed
+                and self._loop is not loop):
+            self._close_foreign(self._session, self._loop, loop)
+            self._session = None
+        if self._session is None or self._session.closed:
+            self._session = self._create_session()
+        return self._session
+
+    def _close_foreign(self, session: aiohttp.ClientSession,
+                       owner: asyncio.AbstractEventLoop,
+                       loop: asyncio.AbstractEventLoop) -> None:
+        """
+        Закрывает сессию, открытую в другом event loop, перед заменой.
+        Работающий цикл (другой поток) закрывает её сам; у закрытого
+        цикла транспорты уже мертвы, и close() в текущем цикле только
+        помечает коннектор закрытым.
+        """
+        if owner.is_running():
+            future = asyncio.run_coroutine_threadsafe(session.close(), owner)
+        elif owner.is_closed():
+            future = loop.create_task(session.close())
+        else:
+            logger.warning("HTTP-сессия остановленного event loop "
+                           "брошена без закрытия")
+            session.detach()
+            return
+        self._closing.add(future)
+        future.add_done_callback(self._closing.discard)
+
+    def _create_session(self) -> aiohttp.ClientSession:
+        self._loop = asyncio.get_running_loop()
+        connector = aiohttp.TCPConnector(
+            limit=BotHttpCfg.LIMIT,
+            limit_per_host=BotHttpCfg.LIMIT_PER_HOST,
+            ttl_dns_cache=BotHttpCfg.DNS_CACHE_TTL,
+            keepalive_timeout=BotHttpCfg.KEEPALIVE_TIMEOUT,
+        )
+        trace = aiohttp.TraceConfig()
+        trace.on_request_start.append(self._on_request_start)
+        trace.on_request_end.append(self._on_request_end)
+        trace.on_request_exception.append(self._on_request_exception)
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(
+                total=BotHttpCfg.TOTAL_TIMEOUT,
+                connect=BotHttpCfg.CONNECT_TIMEOUT,
+            ),
+            trace_configs=[trace],
+        )
+
+    async def _on_request_start(self, session, ctx: SimpleNamespace,
+                                params) -> None:
+        ctx.started = asyncio.get_running_loop().time()
+
+    async def _on_request_end(self, session, ctx: SimpleNamespace,
+                              params) -> None:
+        self._record(params.url.host, ctx, params.response.status >= 500)
+
+    async def _on_request_exception(self, session, ctx: SimpleNamespace,
+                                    params) -> None:
+        self._record(params.url.host, ctx, True)
+
+    def _record(self, host: str, ctx: SimpleNamespace, failed: bool) -> None:
+        elapsed = asyncio.get_running_loop().time() - ctx.started
+        self._stats.setdefault(host, HostStats()).add(elapsed, failed)
+
+
+http_client = HttpClient()
@@ -0,0 +1,131 @@
+"""
+Таблица лидеров активного сезона в памяти.
+
+Ключи (-опыт, user_id) хранятся в отсортированном списке, поэтому место
+пользователя ищется через bisect без запросов к БД. Таблица загружается
+из SeasonRank при старте бота (или при смене сезона) и обновляется
+после каждого update_season_rank. TTL, как у справочников в reference.py,
+подхватывает правки из других процессов (админка, rebuild_season_ranks).
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left, insort
+from dataclasses import dataclass
+from typing import Optional
+
+from bot.models import Season, SeasonRank
+
+logger = logging.getLogger(__name__)
+
+LEADERBOARD_TTL = 300
+
+
+@dataclass(frozen=True)
+class LeaderboardEntry:
+    user_id: int
+    username: Optional[str]
+    experience: int
+    level: int
+    visits_count: int
+
+    @property
+    def key(self) -> tuple[int, int]:
+        return (-self.experience, self.user_id)
+
+
+def _entry(rank: SeasonRank) -> LeaderboardEntry:
+    return LeaderboardEntry(
+        user_id=rank.user_id,
+        username=rank.username,
+        experience=rank.experience,
+        level=rank.level,
+        visits_count=rank.visits_count,
+    )
+
+
+class SeasonLeaderboard:
+    def __init__(self):
+        self._season_id: Optional[int] = None
+        self._loaded_at = 0.0
+        self._keys: list[tuple[int, int]] = []
+        self._entries: dict[int, LeaderboardEntry] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    @property
+    def season_id(self) -> Optional[int]:
+        return self._season_id
+
+    def load(self, season: Optional[Season]) -> int:
+        """Синхронно перечитывает таблицу сезона из БД."""
+        entries = []
+        if season is not None:
+            entries = [_entry(rank) for rank in SeasonRank.objects.filter(
+                season=season).only(
+                    "user_id", "username", "experience",
+                    "level", "visits_count")]
+        with self._lock:
+            self._season_id = season.pk if season else None
+            self._entries = {e.user_id: e for e in entries}
+            self._keys = sorted(e.key for e in entries)
+            self._loaded_at = time.monotonic()
+        logger.info(f"Таблица лидеров загружена: {len(entries)} участников")
+        return len(entries)
+
+    def ensure(self, season: Optional[Season]) -> None:
+        """Перезагружает таблицу при смене сезона или по истечении TTL."""
+        with self._lock:
+            fresh = (
+                (season.pk if season else None) == self._season_id
+                and time.monotonic() - self._loaded_at < LEADERBOARD_TTL)
+        if not fresh:
+            self.load(season)
+
+    def update(self, rank: SeasonRank) -> None:
+        """Переставляет пользователя после изменения его ранга."""
+        with self._lock:
+            if rank.season_id != self._season_id:
+                return
+            old = self._entries.get(rank.user_id)
+            if old is not None:
+                index = bisect_left(self._keys, old.key)
+                if index < len(self._keys) and self._keys[index] == old.key:
+                    del self._keys[index]
+            entry = _entry(rank)
+            self._entries[rank.user_id] = entry
+            insort(self._keys, entry.key)
+
+    def position(self, user_id: int) -> Optional[int]:
+        """
+        Место пользователя (с 1). Одинаковый опыт - одинаковое место.
+        None, если пользователя нет в таблице.
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            return bisect_left(self._keys, (-entry.experience,)) + 1
+
+    def percentile(self, user_id: int) -> Optional[float]:
+        """Доля участников (в %) с опытом меньше, чем у пользователя."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            total = len(self._keys)
+            if entry is None:
+                return None
+            if total == 1:
+                return 100.0
+            below = total - bisect_left(
+                self._keys, (-entry.experience + 1,))
+            return below / (total - 1) * 100
+
+    def top(self, limit: int) -> list[LeaderboardEntry]:
+        with self._lock:
+            return [self._entries[user_id]
+                    for _, user_id in self._keys[:limit]]
+
+
+season_leaderboard = SeasonLeaderboard()
@@ -0,0 +1,248 @@
+"""
+Очередь исходящих сообщений бота.
+
+Хендлеры и задачи планировщика только ставят сообщения в очередь
+(outbox.enqueue), а отправкой занимаются фоновые задачи - по одной на чат.
+Каждый чат ограничен своим token bucket (лимиты групп и личек Telegram),
+поверх действует общий лимит бота. RetryAfter выдерживается,
+сетевые ошибки повторяются с экспоненциальной задержкой,
+а подряд идущие объявления с одинаковым merge_key склеиваются
+в одно сообщение, если пришли в пределах MERGE_WINDOW.
+"""
+import asyncio
+import logging
+import random
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Any, Optional
+
+from telegram.error import (
+    BadRequest,
+    Forbidden,
+    NetworkError,
+    RetryAfter,
+    TelegramError,
+)
+
+from bot.management.core.bot_constants import BotOutboxCfg
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Асинхронный token bucket: rate токенов в секунду, не более burst."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            while True:
+                now = loop.time()
+                if self._updated is not None:
+                    self._tokens = min(
+                        self.burst,
+                        self._tokens + (now - self._updated) * self.rate
+                    )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+@dataclass
+class OutboundMessage:
+    chat_id: Any
+    text: str
+    merge_key: Optional[str] = None
+    kwargs: dict = field(default_factory=dict)
+    enqueued_at: float = 0.0
+
+    def can_merge(self, other: "OutboundMessage") -> bool:
+        return (
+            self.merge_key is not None
+            and self.merge_key == other.merge_key
+            and self.kwargs == other.kwargs
+            and (len(self.text) + len(BotOutboxCfg.MERGE_SEPARATOR)
+                 + len(other.text)) <= BotOutboxCfg.MAX_MESSAGE_LENGTH
+        )
+
+
+class _ChatChannel:
+    def __init__(self, chat_id):
+        self.chat_id = chat_id
+        self.pending: deque[OutboundMessage] = deque()
+        self.wakeup = asyncio.Event()
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.bucket = TokenBucket(
+            (BotOutboxCfg.GROUP_RATE if _is_group(chat_id)
+             else BotOutboxCfg.PRIVATE_RATE),
+            BotOutboxCfg.CHAT_BURST,
+        )
+        self.task: Optional[asyncio.Task] = None
+
+
+def _is_group(chat_id) -> bool:
+    """Группы и каналы имеют отрицательный id или @username."""
+    return str(chat_id).startswith(("-", "@"))
+
+
+def retry_after_seconds(error: RetryAfter) -> float:
+    delay = error.retry_after
+    if isinstance(delay, timedelta):
+        return delay.total_seconds()
+    return float(delay)
+
+
+class OutboundQueue:
+    def __init__(self):
+        self._bot = None
+        self._channels: dict[str, _ChatChannel] = {}
+        self._global_bucket: Optional[TokenBucket] = None
+
+    @property
+    def running(self) -> bool:
+        return self._bot is not None
+
+    def start(self, bot) -> None:
+        """Привязывает очередь к боту. Вызывается в post_init."""
+        self._bot = bot
+        self._global_bucket = TokenBucket(
+            BotOutboxCfg.GLOBAL_RATE, BotOutboxCfg.GLOBAL_BURST)
+        logger.info("Очередь исходящих сообщений запущена")
+
+    async def stop(self, timeout: float = BotOutboxCfg.DRAIN_TIMEOUT) -> None:
+        """
+        Дожидается отправки очереди (не дольше timeout) и гасит задачи.
+        Вызывается в post_stop, пока HTTP-клиент бота ещё открыт.
+        """
+        channels = list(self._channels.values())
+        if channels:
+            try:
+                await asyncio.wait_for(
+                    asyncio.gather(*(c.idle.wait() for c in channels)),
+                    timeout,
+                )
+            except asyncio.TimeoutError:
+                left = sum(len(c.pending) for c in channels)
+                logger.warning(
+                    f"Очередь не успела опустеть, потеряно сообщений: {left}")
+        for channel in channels:
+            if channel.task:
+                channel.task.cancel()
+        await asyncio.gather(
+            *(c.task for c in channels if c.task), return_exceptions=True)
+        self._channels.clear()
+        self._bot = None
+        logger.info("Очередь исходящих сообщений остановлена")
+
+    def enqueue(self, chat_id, text: str, *, merge_key: Optional[str] = None,
+                **kwargs) -> None:
+        """
+        Ставит сообщение в очередь чата и сразу возвращает управление.
+        kwargs передаются в bot.send_message (parse_mode и т.п.).
+        """
+        if not self.running:
+            raise RuntimeError("Очередь исходящих сообщений не запущена")
+        if not chat_id:
+            logger.warning("Сообщение без chat_id не поставлено в очередь")
+            return
+        key = str(chat_id)
+        channel = self._channels.get(key)
+        if channel is None:
+            channel = self._channels[key] = _ChatChannel(chat_id)
+        if channel.task is None or channel.task.done():
+            channel.task = asyncio.create_task(
+                self._worker(channel), name=f"outbox-{key}")
+        channel.pending.append(OutboundMessage(
+            chat_id=chat_id,
+            text=text,
+            merge_key=merge_key,
+            kwargs=kwargs,
+            enqueued_at=asyncio.get_running_loop().time(),
+        ))
+        channel.idle.clear()
+        channel.wakeup.set()
+
+    async def _worker(self, channel: _ChatChannel) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            if not channel.pending:
+                channel.idle.set()
+                channel.wakeup.clear()
+                await channel.wakeup.wait()
+                continue
+            first = channel.pending[0]
+            if first.merge_key is not None:
+                delay = (first.enqueued_at + BotOutboxCfg.MERGE_WINDOW
+                         - loop.time())
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            message = channel.pending.popleft()
+            merged = 1
+            while channel.pending and message.can_merge(channel.pending[0]):
+                following = channel.pending.popleft()
+                message.text += BotOutboxCfg.MERGE_SEPARATOR + following.text
+                merged += 1
+            if merged > 1:
+                logger.debug(f"Объединено {merged} сообщений "
+                             f"для чата {channel.chat_id}")
+            try:
+                await channel.bucket.acquire()
+                await self._global_bucket.acquire()
+                await self._send(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(
+                    f"Сбой отправки в чат {channel.chat_id}: {e}",
+                    exc_info=True)
+
+    async def _send(self, message: OutboundMessage) -> None:
+        for attempt in range(1, BotOutboxCfg.MAX_ATTEMPTS + 1):
+            try:
+                await self._bot.send_message(
+                    chat_id=message.chat_id,
+                    text=message.text,
+                    **message.kwargs
+                )
+                return
+            except RetryAfter as e:
+                delay = retry_after_seconds(e)
+                logger.warning(
+                    f"Флуд-контроль для чата {message.chat_id}, "
+                    f"ждём {delay:.0f} с")
+            except (BadRequest, Forbidden) as e:
+                logger.error(
+                    f"Сообщение в чат {message.chat_id} отклонено: {e}")
+                text = str(e).lower()
+                if "chat not found" in text:
+                    logger.critical(
+                        "Бот не добавлен в группу или chat_id неверный!")
+                elif "bot was blocked" in text:
+                    logger.critical("Бот заблокирован в чате!")
+                return
+            except (NetworkError, TelegramError) as e:
+                delay = min(
+                    BotOutboxCfg.BACKOFF_MAX,
+                    BotOutboxCfg.BACKOFF_BASE * 2 ** (attempt - 1)
+                ) * random.uniform(0.8, 1.2)
+                logger.warning(
+                    f"Ошибка отправки в чат {message.chat_id} "
+                    f"(попытка {attempt}): {e}. Повтор через {delay:.1f} с")
+            if attempt < BotOutboxCfg.MAX_ATTEMPTS:
+                await asyncio.sleep(delay)
+        logger.error(
+            f"Сообщение в чат {message.chat_id} не отправлено после "
+            f"{BotOutboxCfg.MAX_ATTEMPTS} попыток")
+
+
+outbox = OutboundQueue()
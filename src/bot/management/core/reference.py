@@ -0,0 +1,118 @@
+"""
+Кэш справочных данных бота: лестница уровней LevelTitle и активный сезон.
+
+Таблицы маленькие и меняются редко, поэтому держим их в памяти процесса.
+Изменения в этом же процессе сбрасывают кэш сигналами (bot/signals.py),
+а TTL страхует от правок из других процессов (админка, manage_seasons).
+"""
+import logging
+import threading
+import time
+from bisect import bisect_right
+from typing import Optional
+
+from bot.models import LevelTitle, Season
+
+logger = logging.getLogger(__name__)
+
+LADDER_TTL = 300
+SEASON_TTL = 60
+
+
+class LevelLadder:
+    """
+    Отсортированные массивы порогов опыта и уровней для поиска через bisect.
+    Экземпляры LevelTitle внутри лестницы только для чтения.
+    """
+
+    def __init__(self, titles: list[LevelTitle]):
+        by_experience = sorted(
+            titles, key=lambda t: (t.min_experience, t.level))
+        self.min_experience = [t.min_experience for t in by_experience]
+        # Для каждого префикса - титул с максимальным уровнем, как в
+        # filter(min_experience__lte=exp).order_by("-level").first()
+        self._best_by_experience = []
+        best = None
+        for title in by_experience:
+            if best is None or title.level > best.level:
+                best = title
+            self._best_by_experience.append(best)
+
+        self.by_level = sorted(titles, key=lambda t: t.level)
+        self.levels = [t.level for t in self.by_level]
+        self.titles = [t.title for t in self.by_level]
+        self.categories = [t.category for t in self.by_level]
+        self._level_index = {t.level: i for i, t in enumerate(self.by_level)}
+
+    def __len__(self) -> int:
+        return len(self.by_level)
+
+    def first(self) -> Optional[LevelTitle]:
+        return self.by_level[0] if self.by_level else None
+
+    def for_experience(self, experience: int) -> Optional[LevelTitle]:
+        """Максимальный уровень, порог которого не выше опыта."""
+        index = bisect_right(self.min_experience, experience) - 1
+        if index < 0:
+            return None
+        return self._best_by_experience[index]
+
+    def get(self, level: int) -> Optional[LevelTitle]:
+        index = self._level_index.get(level)
+        return self.by_level[index] if index is not None else None
+
+    def at_most(self, level: int) -> Optional[LevelTitle]:
+        """Максимальный уровень не выше заданного."""
+        index = bisect_right(self.levels, level) - 1
+        return self.by_level[index] if index >= 0 else None
+
+
+_lock = threading.Lock()
+_ladder: Optional[LevelLadder] = None
+_ladder_loaded_at = 0.0
+_season: Optional[Season] = None
+_season_loaded_at = 0.0
+_season_loaded = False
+
+
+def get_level_ladder() -> LevelLadder:
+    """Возвращает лестницу уровней, при необходимости загружая её из БД."""
+    global _ladder, _ladder_loaded_at
+    with _lock:
+        if (_ladder is not None
+                and time.monotonic() - _ladder_loaded_at < LADDER_TTL):
+            return _ladder
+    ladder = LevelLadder(list(LevelTitle.objects.all()))
+    with _lock:
+        _ladder = ladder
+        _ladder_loaded_at = time.monotonic()
+    logger.debug(f"Лестница уровней загружена: {len(ladder)} уровней")
+    return ladder
+
+
+def get_active_season() -> Optional[Season]:
+    """Возвращает активный сезон (или None) из кэша."""
+    global _season, _season_loaded_at, _season_loaded
+    with _lock:
+        if (_season_loaded
+                and time.monotonic() - _season_loaded_at < SEASON_TTL):
+            return _season
+    season = Season.objects.filter(is_active=True).first()
+    with _lock:
+        _season = season
+        _season_loaded_at = time.monotonic()
+        _season_loaded = True
+    return season
+
+
+def invalidate_level_ladder() -> None:
+    global _ladder
+    with _lock:
+        _ladder = None
+
+
+def invalidate_active_season() -> None:
+    global _season, _season_loaded
+    with _lock:
+        _season = None
+        _season_loaded = False
@@ -0,0 +1,174 @@
+"""
+Планировщик ежедневных заданий бота с сохранением в БД.
+
+Команды /start_weather, /start_stats и т.п. вызывают schedule_job:
+задание записывается в ScheduledJob и добавляется в AsyncIOScheduler.
+При старте бота restore_jobs поднимает всё расписание из таблицы и один
+раз догоняет запуск, пропущенный за время простоя, если опоздание не больше
+MISFIRE_GRACE_TIME. Несколько пропущенных запусков схлопываются в один.
+"""
+import logging
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+from zoneinfo import ZoneInfo
+
+from apscheduler.jobstores.base import JobLookupError
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.cron import CronTrigger
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+
+from bot.management.core.bot_constants import BotSchedulerCfg
+from bot.models import ScheduledJob
+
+logger = logging.getLogger(__name__)
+
+CATCHUP_SUFFIX = ":catchup"
+SECOND = timedelta(seconds=1)
+
+scheduler = AsyncIOScheduler(
+    timezone=ZoneInfo(BotSchedulerCfg.TIMEZONE),
+    job_defaults={
+        "coalesce": True,
+        "misfire_grace_time": BotSchedulerCfg.MISFIRE_GRACE_TIME,
+        "max_instances": 1,
+    },
+)
+
+_registry: dict[str, Callable[..., Awaitable]] = {}
+
+
+def register_job(job_id: str, func: Callable[..., Awaitable]) -> None:
+    """Связывает id задания с корутиной func(bot, *args)."""
+    _registry[job_id] = func
+
+
+def _trigger(hour: int, minute: int) -> CronTrigger:
+    return CronTrigger(hour=hour, minute=minute,
+                       timezone=ZoneInfo(BotSchedulerCfg.TIMEZONE))
+
+
+def missed_fire_time(job: ScheduledJob,
+                     now: datetime) -> Optional[datetime]:
+    """
+    Время последнего пропущенного запуска, если его ещё можно догнать.
+    Точка отсчёта - последний запуск, а для ни разу не запускавшегося
+    задания - момент его установки.
+    """
+    since = job.last_run_at or job.updated_at
+    trigger = _trigger(job.hour, job.minute)
+    missed = None
+    fire_time = trigger.get_next_fire_time(None, since + SECOND)
+    while fire_time is not None and fire_time <= now:
+        missed = fire_time
+        fire_time = trigger.get_next_fire_time(fire_time, fire_time + SECOND)
+    if missed is None:
+        return None
+    if (now - missed).total_seconds() > BotSchedulerCfg.MISFIRE_GRACE_TIME:
+        logger.info(f"Пропущенный запуск {job.job_id} в {missed} "
+                    f"слишком старый, ждём следующего")
+        return None
+    return missed
+
+
+async def _run(job_id: str, bot, *args) -> None:
+    func = _registry.get(job_id)
+    if func is None:
+        logger.error(f"Задание {job_id} не зарегистрировано")
+        return
+    try:
+        await func(bot, *args)
+    finally:
+        await sync_to_async(ScheduledJob.objects.filter(
+            job_id=job_id).update)(last_run_at=timezone.now())
+
+
+def _add(job: ScheduledJob, bot) -> None:
+    _remove(job.job_id)
+    scheduler.add_job(
+        _run,
+        trigger=_trigger(job.hour, job.minute),
+        args=[job.job_id, bot, *job.args],
+        id=job.job_id,
+    )
+
+
+def _remove(job_id: str) -> bool:
+    removed = False
+    for scheduler_id in (job_id, job_id + CATCHUP_SUFFIX):
+        try:
+            scheduler.remove_job(scheduler_id)
+            removed = True
+        except JobLookupError:
+            pass
+    return removed
+
+
+def _ensure_running() -> None:
+    if not scheduler.running:
+        scheduler.start()
+
+
+async def schedule_job(job_id: str, bot, hour: int, minute: int,
+                       args: tuple = ()) -> None:
+    """Сохраняет задание в БД и ставит его в планировщик."""
+    if job_id not in _registry:
+        raise KeyError(f"Задание {job_id} не зарегистрировано")
+    job, _ = await sync_to_async(ScheduledJob.objects.update_or_create)(
+        job_id=job_id,
+        defaults={
+            "hour": hour,
+            "minute": minute,
+            "args": list(args),
+            "last_run_at": timezone.now(),
+        },
+    )
+    _add(job, bot)
+    _ensure_running()
+
+
+async def unschedule_job(job_id: str) -> bool:
+    """Удаляет задание из БД и планировщика. False, если его не было."""
+    deleted, _ = await sync_to_async(
+        ScheduledJob.objects.filter(job_id=job_id).delete)()
+    removed = _remove(job_id)
+    return bool(deleted) or removed
+
+
+async def clear_jobs() -> int:
+    """Удаляет все задания и останавливает планировщик."""
+    deleted, _ = await sync_to_async(ScheduledJob.objects.all().delete)()
+    if scheduler.running:
+        scheduler.remove_all_jobs()
+        scheduler.shutdown(wait=False)
+    return deleted
+
+
+async def restore_jobs(bot) -> int:
+    """
+    Восстанавливает расписание из БД (вызывается в post_init) и
+    запускает пропущенные за время простоя задания. Возвращает число
+    восстановленных заданий.
+    """
+    jobs = await sync_to_async(list)(ScheduledJob.objects.all())
+    now = timezone.now()
+    restored = 0
+    for job in jobs:
+        if job.job_id not in _registry:
+            logger.warning(f"Неизвестное задание {job.job_id} пропущено")
+            continue
+        _add(job, bot)
+        restored += 1
+        missed = missed_fire_time(job, now)
+        if missed is not None:
+            logger.info(f"Догоняем задание {job.job_id}, "
+                        f"пропущенное в {missed}")
+            scheduler.add_job(
+                _run,
+                args=[job.job_id, bot, *job.args],
+                id=job.job_id + CATCHUP_SUFFIX,
+            )
+    if restored:
+        _ensure_running()
+    logger.info(f"Восстановлено заданий планировщика: {restored}")
+    return restored
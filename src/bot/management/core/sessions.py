@@ -0,0 +1,151 @@
+import logging
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from bot.models import UserActivity
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ActiveSession:
+    activity_id: int
+    user_id: int
+    username: Optional[str]
+    company_id: int
+    company_name: str
+    join_time: datetime
+
+
+class ActiveSessionRegistry:
+    """
+    Реестр открытых сессий (кто сейчас находится в организациях).
+
+    Загружается из БД при старте бота и дальше поддерживается
+    хендлерами join/leave/edit, поэтому /status обходится без запросов
+    к базе. Проверка «уже прибыл?» (ais_active) сверяет попадание с БД,
+    поиск сессии для ухода (aget) - промах.
+    """
+
+    def __init__(self):
+        self._sessions: dict[int, ActiveSession] = {}
+        self._lock = threading.Lock()
+
+    def load(self) -> int:
+        """Синхронно перечитывает открытые сессии из БД."""
+        activities = (
+            UserActivity.objects.filter(leave_time__isnull=True)
+            .select_related("company")
+            .order_by("join_time")
+        )
+        sessions = {}
+        for activity in activities:
+            if activity.user_id in sessions:
+                logger.warning(
+                    f"У пользователя {activity.user_id} несколько "
+                    f"открытых сессий, используется последняя "
+                    f"(ID: {activity.pk})"
+                )
+            sessions[activity.user_id] = self._make_session(activity)
+        with self._lock:
+            self._sessions = sessions
+        logger.info(f"Загружено открытых сессий: {len(sessions)}")
+        return len(sessions)
+
+    def add(self, activity: UserActivity) -> ActiveSession:
+        session = self._make_session(activity)
+        with self._lock:
+            self._sessions[activity.user_id] = session
+        return session
+
+    def remove(self, user_id: int) -> Optional[ActiveSession]:
+        with self._lock:
+            return self._sessions.pop(user_id, None)
+
+    def update_join_time(self, user_id: int, join_time: datetime) -> None:
+        with self._lock:
+            session = self._sessions.get(user_id)
+            if session:
+                self._sessions[user_id] = ActiveSession(
+                    activity_id=session.activity_id,
+                    user_id=session.user_id,
+                    username=session.username,
+                    company_id=session.company_id,
+                    company_name=session.company_name,
+                    join_time=join_time,
+                )
+
+    def get(self, user_id: int) -> Optional[ActiveSession]:
+        return self._sessions.get(user_id)
+
+    def is_active(self, user_id: int) -> bool:
+        return user_id in self._sessions
+
+    async def ais_active(self, user_id: int) -> bool:
+        """
+        Есть ли у пользователя открытая сессия. Запись в реестре - только
+        подсказка: сессию могли закрыть мимо бота (админка, другой
+        процесс), поэтому попадание сверяется с БД, а устаревшая запись
+        удаляется. Промах не проверяется: сессию, открытую мимо реестра,
+        поймает JoinService по ограничению unique_open_activity_per_user.
+        """
+        if not self.is_active(user_id):
+            return False
+        activity = await (
+            UserActivity.objects.filter(
+                user_id=user_id, leave_time__isnull=True)
+            .select_related("company")
+            .order_by("-join_time")
+            .afirst()
+        )
+        if activity is None:
+            self.remove(user_id)
+            logger.info(f"Сессия пользователя {user_id} закрыта вне бота, "
+                        f"запись реестра удалена")
+            return False
+        self.add(activity)
+        return True
+
+    async def aget(self, user_id: int) -> Optional[ActiveSession]:
+        """
+        Открытая сессия пользователя. Промах сверяется с БД: сессию могли
+        открыть мимо этого процесса (другой воркер, админка), тогда она
+        возвращается в реестр.
+        """
+        session = self.get(user_id)
+        if session:
+            return session
+        activity = await (
+            UserActivity.objects.filter(
+                user_id=user_id, leave_time__isnull=True)
+            .select_related("company")
+            .order_by("-join_time")
+            .afirst()
+        )
+        if activity is None:
+            return None
+        logger.info(f"Сессия пользователя {user_id} открыта вне бота, "
+                    f"запись реестра восстановлена")
+        return self.add(activity)
+
+    def all(self) -> list[ActiveSession]:
+        """Возвращает открытые сессии в порядке прибытия."""
+        with self._lock:
+            sessions = list(self._sessions.values())
+        return sorted(sessions, key=lambda s: s.join_time)
+
+    @staticmethod
+    def _make_session(activity: UserActivity) -> ActiveSession:
+        return ActiveSession(
+            activity_id=activity.pk,
+            user_id=activity.user_id,
+            username=activity.username,
+            company_id=activity.company_id,  # type: ignore
+            company_name=activity.company.name,
+            join_time=activity.join_time,
+        )
+
+
+active_sessions = ActiveSessionRegistry()
@@ -2,16 +2,18 @@ import logging
 from datetime import timedelta
 
 from asgiref.sync import sync_to_async
-from django.db.models import DurationField, Sum
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DurationField, F, Max, Sum
 from django.utils import timezone
 
-from bot.management.core.experience import get_level_info
-from bot.management.core.utils import create_progress_bar
+from bot.management.core.experience import get_level_info_many
+from bot.management.core.reference import get_active_season
+from bot.management.core.utils import create_progress_bar, local_day_bounds
 from bot.models import (
-    Achievement,
+    ActivityRollup,
     DailyStatistics,
-    Season,
     SeasonRank,
+    UserAchievementCounter,
     UserActivity,
 )
 
@@ -35,7 +37,7 @@ async def has_any_trips_on_date(target_date):
     try:
         has_trips = await sync_to_async(
             lambda: UserActivity.objects.filter(
-                join_time__date=target_date
+                join_date=target_date
             ).exists()
         )()
         return has_trips
@@ -45,7 +47,7 @@ async def has_any_trips_on_date(target_date):
 
 
 async def get_daily_statistics():
-    today = timezone.now().date()
+    today = timezone.localdate()
     stats = await sync_to_async(
         DailyStatistics.objects.filter(date=today).aggregate)(
         total_trips=Sum("total_trips"),
@@ -58,18 +60,17 @@ async def get_daily_statistics():
 
 
 async def get_daily_statistics_message():
-    today = timezone.now().date()
+    today = timezone.localdate()
     stats = await get_daily_statistics()
     header = "📊 *Общая статистика за сегодня:*"
-    try:
-        season = await sync_to_async(Season.objects.get)(is_active=True)
+    season = await sync_to_async(get_active_season)()
+    if season:
         days_left = (season.end_date - today).days  # type: ignore
         season_info = (
             f"🏆 *Сезон: {season.name}*\n"
             f"⏳ До конца: *{days_left} дн.*"
         )
-    except Season.DoesNotExist:
-        season = None
+    else:
         season_info = "ℹ️ *Сезон не активен*"
     user_stats_qs = await sync_to_async(list)(
         DailyStatistics.objects.filter(date=today)
@@ -80,29 +81,35 @@ async def get_daily_statistics_message():
         return f"{header}\n\nСегодня выездов не было 😴"
     user_ids = [u["user_id"] for u in user_stats_qs]
     ranks_map = {}
+    level_infos = {}
     if season:
         ranks = await sync_to_async(list)(
             SeasonRank.objects.filter(
                 user_id__in=user_ids,
                 season=season
-            ).select_related("level_title")
+            )
         )
         ranks_map = {r.user_id: r for r in ranks}
+        level_infos = dict(zip(
+            ranks_map, await get_level_info_many(ranks_map.values())))
+    day_start, day_end = local_day_bounds(today)
     achievements = await sync_to_async(list)(
-        Achievement.objects.filter(achieved_at__date=today)
-        .values("username", "achievement_name")
+        UserAchievementCounter.objects.filter(
+            last_at__gte=day_start,
+            last_at__lt=day_end,
+            user_id__in=user_ids,
+        )
+        .order_by("last_at")
+        .values_list("user_id", "achievement_name")
     )
     achievements_map = {}
-    for ach in achievements:
-        uname = ach["username"]
-        if uname not in achievements_map:
-            achievements_map[uname] = []
-        if ach["achievement_name"] not in achievements_map[uname]:
-            achievements_map[uname].append(ach["achievement_name"])
+    for u_id, name in achievements:
+        achievements_map.setdefault(u_id, []).append(name)
     today_activities_exp = await sync_to_async(list)(
         UserActivity.objects.filter(
             user_id__in=user_ids,
-            leave_time__date=today
+            leave_time__gte=day_start,
+            leave_time__lt=day_end
         ).values_list('experience_gained', flat=True)
     )
     total_exp_earned_today = sum(filter(None, today_activities_exp))
@@ -124,7 +131,7 @@ async def get_daily_statistics_message():
             avg_sec = user["total_time"].total_seconds() / user["total_trips"]
             data_item["avg_time_str"] = format_duration(avg_sec)
         if rank:
-            level_info = await get_level_info(rank)
+            level_info = level_infos[u_id]
             progress_bar = create_progress_bar(level_info["progress"])
             data_item["level"] = rank.level
             data_item["exp"] = rank.experience
@@ -134,7 +141,7 @@ async def get_daily_statistics_message():
                 f"▸ Прогресс: {progress_bar} *{int(level_info['progress'])}%*\n" # noqa
                 f"▸ Опыт: *{level_info['current_exp']}/{level_info['next_level_exp']}*\n" # noqa
             )
-        user_achs = achievements_map.get(user["username"], [])[:3]
+        user_achs = achievements_map.get(u_id, [])[:3]
         if user_achs:
             data_item["achievements_str"] = ", ".join(user_achs)
 
@@ -176,41 +183,164 @@ async def get_daily_statistics_message():
     return message
 
 
-async def update_daily_statistics(user_id, username):
+def apply_daily_statistics_delta(user_id, username, date, duration,
+                                 trips=1):
     """
-    Обновляет статистику. Логику оставили прежней, она рабочая.
+    Добавляет к дневной статистике пользователя `trips` выездов и
+    `duration` времени одним UPDATE через F(). Если строки за день ещё нет,
+    создаёт её; гонку с параллельным созданием разрешает уникальный индекс
+    (user_id, date) и повторный UPDATE.
     """
-    today = timezone.now().date()
+    def increment():
+        return DailyStatistics.objects.filter(
+            user_id=user_id, date=date
+        ).update(
+            username=username,
+            total_trips=F("total_trips") + trips,
+            total_time=F("total_time") + duration,
+        )
+
+    if increment():
+        return
+    try:
+        with transaction.atomic():
+            DailyStatistics.objects.create(
+                user_id=user_id,
+                username=username,
+                date=date,
+                total_time=duration,
+                total_trips=trips,
+            )
+    except IntegrityError:
+        increment()
+
 
-    activities = await sync_to_async(list)(
+def rebuild_daily_statistics(date_from, date_to):
+    """
+    Пересобирает DailyStatistics за диапазон дат [date_from, date_to]
+    по завершённым активностям: одна агрегация по (user_id, join_date),
+    затем удаление старых строк и bulk_create в одной транзакции.
+    Возвращает количество созданных строк.
+    """
+    rows = (
         UserActivity.objects.filter(
-            user_id=user_id,
-            join_time__date=today,
-            leave_time__isnull=False
-        ).values("join_time", "leave_time")
+            join_date__gte=date_from,
+            join_date__lte=date_to,
+            leave_time__isnull=False,
+        )
+        .values("user_id", "join_date")
+        .annotate(
+            username=Max("username"),
+            trips=Count("id"),
+            total=Sum(F("leave_time") - F("join_time"),
+                      output_field=DurationField()),
+        )
+        .order_by()
     )
+    stats = [
+        DailyStatistics(
+            user_id=row["user_id"],
+            username=row["username"],
+            date=row["join_date"],
+            total_trips=row["trips"],
+            total_time=row["total"] or timedelta(),
+        )
+        for row in rows
+    ]
+    with transaction.atomic():
+        DailyStatistics.objects.filter(
+            date__gte=date_from, date__lte=date_to).delete()
+        DailyStatistics.objects.bulk_create(stats, batch_size=1000)
+    return len(stats)
+
 
-    total_time = timedelta()
-    valid_trips = 0
-    for activity in activities:
-        join_time = activity["join_time"]
-        leave_time = activity["leave_time"]
-
-        if join_time and leave_time:
-            total_time += leave_time - join_time
-            valid_trips += 1
-        else:
-            logger.warning(
-                f"Пустое время: user={user_id}, "
-                f"join={join_time}, leave={leave_time}"
+def apply_rollup_delta(activity, experience, trips=1):
+    """
+    Добавляет завершённую активность в сводку ActivityRollup за её
+    день (join_date) одним UPDATE через F(), создавая строку при
+    необходимости - так же, как apply_daily_statistics_delta.
+    """
+    date = activity.join_date or timezone.localdate(activity.join_time)
+    seconds = max(0, int(
+        (activity.leave_time - activity.join_time).total_seconds()))
+    lookup = {
+        "date": date,
+        "user_id": activity.user_id,
+        "company_id": activity.company_id,
+    }
+
+    def increment():
+        return ActivityRollup.objects.filter(**lookup).update(
+            username=activity.username,
+            trips=F("trips") + trips,
+            total_seconds=F("total_seconds") + seconds,
+            experience=F("experience") + experience,
+        )
+
+    if increment():
+        return
+    try:
+        with transaction.atomic():
+            ActivityRollup.objects.create(
+                username=activity.username,
+                trips=trips,
+                total_seconds=seconds,
+                experience=experience,
+                **lookup
             )
+    except IntegrityError:
+        increment()
 
-    await sync_to_async(DailyStatistics.objects.update_or_create)(
-        user_id=user_id,
-        date=today,
-        defaults={
-            "username": username,
-            "total_time": total_time,
-            "total_trips": valid_trips
-        }
+
+def rebuild_activity_rollups(date_from, date_to, chunk_size=2000,
+                             progress=None):
+    """
+    Пересобирает ActivityRollup за [date_from, date_to].
+
+    Активности читаются потоком через iterator(chunk_size) и
+    суммируются в памяти (ключей - дни x пользователи x организации,
+    это на порядки меньше числа выездов). Затем старые строки диапазона
+    удаляются и новые пишутся bulk_create пачками по chunk_size.
+    progress(processed) вызывается после каждой прочитанной пачки.
+    Возвращает (число активностей, число строк сводки).
+    """
+    activities = (
+        UserActivity.objects.filter(
+            join_date__gte=date_from,
+            join_date__lte=date_to,
+            leave_time__isnull=False,
+        )
+        .order_by()
+        .values_list("join_date", "user_id", "company_id", "username",
+                     "join_time", "leave_time", "experience_gained")
     )
+    rollups = {}
+    processed = 0
+    for (date, user_id, company_id, username,
+         join_time, leave_time, experience) in activities.iterator(
+            chunk_size=chunk_size):
+        key = (date, user_id, company_id)
+        rollup = rollups.get(key)
+        if rollup is None:
+            rollup = rollups[key] = ActivityRollup(
+                date=date,
+                user_id=user_id,
+                company_id=company_id,
+                username=username,
+            )
+        rollup.trips += 1
+        rollup.total_seconds += max(
+            0, int((leave_time - join_time).total_seconds()))
+        rollup.experience += experience or 0
+        if username:
+            rollup.username = username
+        processed += 1
+        if progress and processed % chunk_size == 0:
+            progress(processed)
+
+    with transaction.atomic():
+        ActivityRollup.objects.filter(
+            date__gte=date_from, date__lte=date_to).delete()
+        ActivityRollup.objects.bulk_create(
+            rollups.values(), batch_size=chunk_size)
+    return processed, len(rollups)
@@ -0,0 +1,85 @@
+"""
+Параллельная обработка обновлений Telegram с порядком внутри пользователя.
+
+Обновления разных пользователей обрабатываются одновременно (не больше
+max_running), поэтому медленный /mew или запрос погоды не задерживает
+чужой /join. Обновления одного пользователя (или чата, если пользователя
+нет) проходят строго по очереди через asyncio.Lock: join/leave/edit и
+шаги ConversationHandler не перемешиваются.
+
+Слот max_running занимается уже под lock пользователя, так что очередь
+одного пользователя не держит слоты, нужные остальным. Общее число
+ожидающих обновлений ограничено семафором BaseUpdateProcessor.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from bot.management.core.bot_constants import BotUpdatesCfg
+
+logger = logging.getLogger(__name__)
+
+
+class _KeyLock:
+    __slots__ = ("lock", "waiters")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.waiters = 0
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    def __init__(self, max_running: int,
+                 max_pending: Optional[int] = None):
+        if max_running < 1:
+            raise ValueError("max_running должно быть положительным")
+        super().__init__(
+            max_pending or max_running * BotUpdatesCfg.PENDING_PER_SLOT)
+        self.max_running = max_running
+        self._running = asyncio.BoundedSemaphore(max_running)
+        self._locks: dict[tuple, _KeyLock] = {}
+
+    @property
+    def active_keys(self) -> int:
+        """Число пользователей и чатов с обновлениями в работе."""
+        return len(self._locks)
+
+    @staticmethod
+    def update_key(update: object) -> Optional[tuple]:
+        if not isinstance(update, Update):
+            return None
+        if update.effective_user is not None:
+            return ("user", update.effective_user.id)
+        if update.effective_chat is not None:
+            return ("chat", update.effective_chat.id)
+        return None
+
+    async def do_process_update(self, update: object,
+                                coroutine: Awaitable[Any]) -> None:
+        key = self.update_key(update)
+        if key is None:
+            async with self._running:
+                await coroutine
+            return
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = _KeyLock()
+        entry.waiters += 1
+        try:
+            async with entry.lock, self._running:
+                await coroutine
+        finally:
+            entry.waiters -= 1
+            if not entry.waiters:
+                del self._locks[key]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        if self._locks:
+            logger.info(f"Остановка обработки обновлений, в работе "
+                        f"у {len(self._locks)} пользователей")
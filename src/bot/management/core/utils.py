@@ -1,4 +1,6 @@
-from datetime import timedelta
+from datetime import date, datetime, time, timedelta
+
+from django.utils import timezone
 
 
 def create_progress_bar(progress: float, length: int = 10) -> str:
@@ -69,3 +71,14 @@ def normalize_duration_to_seconds(value) -> float:
     if isinstance(value, (int, float)):
         return value / 1_000_000
     return 0.0
+
+
+def local_day_bounds(day: date) -> tuple[datetime, datetime]:
+    """
+    Возвращает границы суток [начало, начало следующих) по местному
+    времени. Фильтр по диапазону использует индекс, в отличие от __date.
+    """
+    tz = timezone.get_current_timezone()
+    start = datetime.combine(day, time.min, tzinfo=tz)
+    end = datetime.combine(day + timedelta(days=1), time.min, tzinfo=tz)
+    return start, end
@@ -2,16 +2,28 @@ import asyncio
 import logging
 import math
 import os
-from datetime import datetime
+import time
+from datetime import date, datetime
 from datetime import timezone as dt_timezone
-from typing import Any
+from typing import Any, Callable
 from zoneinfo import ZoneInfo
 
-import aiohttp
 import ephem
 
+from bot.management.core.bot_constants import BotWeatherCfg
+from bot.management.core.http import http_client
+
 logger = logging.getLogger(__name__)
 
+CITY = "Zelenograd"
+CITY_RU = "Зеленограде"
+LOCAL_TZ = ZoneInfo("Europe/Moscow")
+
+
+def _today() -> date:
+    """Местная дата: по ней parse_forecast отбирает прогноз на сегодня."""
+    return datetime.now(LOCAL_TZ).date()
+
 
 def get_kp_description(kp_index: int) -> str:
     """Возвращает описание Kp-индекса (магнитного поля)."""
@@ -216,8 +228,7 @@ def parse_forecast(data):
         return None
 
     try:
-        moscow_tz = ZoneInfo("Europe/Moscow")
-        current_date = datetime.now(moscow_tz).date()
+        current_date = _today()
         forecast: dict[str, Any] = {"morning": None,
                                     "day": None, "evening": None}
         if not data.get("list"):
@@ -227,7 +238,7 @@ def parse_forecast(data):
                 continue
             entry_time_utc = datetime.fromtimestamp(
                 entry["dt"], tz=dt_timezone.utc)
-            entry_time_moscow = entry_time_utc.astimezone(moscow_tz)
+            entry_time_moscow = entry_time_utc.astimezone(LOCAL_TZ)
             if entry_time_moscow.date() == current_date:
                 time_str = entry_time_moscow.strftime("%H:%M")
                 desc = entry["weather"][0]["description"]
@@ -325,30 +336,120 @@ def format_weather_message(city_ru, weather_data,
     return "\n".join(lines)
 
 
-async def get_weather():
+class WeatherCache:
+    """
+    Кэш разобранных погодных данных с TTL на каждый источник.
+
+    Свежее значение (моложе ttl) отдаётся сразу. Устаревшее, но моложе
+    max_stale, тоже отдаётся сразу, а обновление запускается в фоне
+    (stale-while-revalidate). Параллельные промахи ждут одну общую
+    загрузку, поэтому повторные /weather не дёргают внешние API.
+    Значения, загруженные до местной полуночи, не отдаются вовсе:
+    прогноз «на сегодня» отбирается при разборе и к утру устаревает.
+    """
+
+    def __init__(self, loaders: dict[str, tuple[Callable, float]],
+                 max_stale: float):
+        self._loaders = loaders
+        self._max_stale = max_stale
+        self._values: dict[str, Any] = {}
+        self._fetched_at: dict[str, float] = {}
+        self._fetched_on: dict[str, date] = {}
+        self._tasks: dict[str, asyncio.Task] = {}
+
+    def clear(self) -> None:
+        self._values.clear()
+        self._fetched_at.clear()
+        self._fetched_on.clear()
+
+    async def get(self, source: str, fresh: bool = False):
+        """fresh=True всегда ждёт загрузки (плановые рассылки)."""
+        if fresh:
+            return await self._refresh(source)
+        _, ttl = self._loaders[source]
+        value = self._current(source)
+        if value is not None:
+            age = time.monotonic() - self._fetched_at[source]
+            if age < ttl:
+                return value
+            if age < self._max_stale:
+                self._refresh(source)
+                return value
+        return await self._refresh(source)
+
+    def warm(self) -> list[asyncio.Task]:
+        """Запускает фоновую загрузку всех источников (при старте бота)."""
+        return [self._refresh(source) for source in self._loaders]
+
+    def _refresh(self, source: str) -> asyncio.Task:
+        task = self._tasks.get(source)
+        if task is None or task.done():
+            task = self._tasks[source] = asyncio.create_task(
+                self._load(source), name=f"weather-{source}")
+        return task
+
+    async def _load(self, source: str):
+        loader, _ = self._loaders[source]
+        try:
+            value = await loader()
+        except Exception as e:
+            logger.error(f"Ошибка обновления погоды ({source}): {e}")
+            value = None
+        if value is None:
+            # Сбой источника: оставляем прежнее значение, если оно есть.
+            return self._current(source)
+        self._values[source] = value
+        self._fetched_at[source] = time.monotonic()
+        self._fetched_on[source] = _today()
+        return value
+
+    def _current(self, source: str):
+        """Сохранённое значение, если оно загружено сегодня."""
+        if self._fetched_on.get(source) != _today():
+            return None
+        return self._values.get(source)
+
+
+async def _load_current():
+    return parse_current_weather(await fetch_owm_weather(
+        http_client.session(), CITY, os.getenv("OPENWEATHER_API_KEY")))
+
+
+async def _load_forecast():
+    return parse_forecast(await fetch_owm_forecast(
+        http_client.session(), CITY, os.getenv("OPENWEATHER_API_KEY")))
+
+
+async def _load_mag():
+    return parse_mag_data(await fetch_mag_data(http_client.session()))
+
+
+weather_cache = WeatherCache(
+    {
+        "current": (_load_current, BotWeatherCfg.CURRENT_TTL),
+        "forecast": (_load_forecast, BotWeatherCfg.FORECAST_TTL),
+        "mag": (_load_mag, BotWeatherCfg.MAG_TTL),
+    },
+    max_stale=BotWeatherCfg.MAX_STALE,
+)
+
+
+async def get_weather(fresh: bool = False):
     """
-    Асинхронно получает, парсит и форматирует
-    все погодные данные параллельно.
+    Собирает сообщение о погоде из кэша (см. WeatherCache):
+    внешние API запрашиваются только для устаревших источников,
+    а при fresh=True - для всех.
     """
-    api_key = os.getenv("OPENWEATHER_API_KEY")
-    city = "Zelenograd"
-    city_ru = "Зеленограде"
-
-    async with aiohttp.ClientSession() as session:
-        results = await asyncio.gather(
-            fetch_owm_weather(session, city, api_key),
-            fetch_owm_forecast(session, city, api_key),
-            fetch_mag_data(session),
-        )
-        owm_weather_raw, owm_forecast_raw, mag_raw = results
-        weather_data = parse_current_weather(owm_weather_raw)
-        forecast_data = parse_forecast(owm_forecast_raw)
-        mag_data = parse_mag_data(mag_raw)
-        moon_data = get_moon_phase_local()
-        return format_weather_message(
-            city_ru,
-            weather_data,
-            forecast_data,
-            mag_data,
-            moon_data
-        )
+    weather_data, forecast_data, mag_data = await asyncio.gather(
+        weather_cache.get("current", fresh),
+        weather_cache.get("forecast", fresh),
+        weather_cache.get("mag", fresh),
+    )
+    moon_data = get_moon_phase_local()
+    return format_weather_message(
+        CITY_RU,
+        weather_data,
+        forecast_data,
+        mag_data,
+        moon_data
+    )
@@ -1,23 +1,30 @@
 import hashlib
 import itertools
+from collections import Counter
 from datetime import timedelta
 
 from asgiref.sync import sync_to_async
 from dateutil.relativedelta import relativedelta
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.validators import MinLengthValidator
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
 from django.utils import timezone
 from django_ckeditor_5.fields import CKEditor5Field
 
 from core.constants import (
     MAX_LEN,
     AchievementCfg,
+    ActivityRollupCfg,
     CompanyCfg,
     DailyStatisticsCfg,
     DailytTipsCfg,
     QuoteCfg,
+    ScheduledJobCfg,
     TagCfg,
+    UserAchievementCounterCfg,
     UserActivityCfg,
     UserRankCfg,
 )
@@ -65,10 +72,27 @@ class UserActivity(models.Model):
         verbose_name="Опыт, полученный за активность",
         default=0
     )
+    join_date = models.DateField(
+        verbose_name=UserActivityCfg.JOIN_DATE_V,
+        blank=True,
+        null=True,
+        editable=False)
 
     def __str__(self) -> str:
         return f"{self.username} в {self.company.name}"
 
+    def save(self, *args, **kwargs):
+        """
+        join_date хранит дату прибытия по Москве, чтобы фильтры
+        «за день» шли по индексу, а не через приведение join_time.
+        """
+        if self.join_time:
+            self.join_date = timezone.localdate(self.join_time)
+            update_fields = kwargs.get("update_fields")
+            if update_fields is not None and "join_time" in update_fields:
+                kwargs["update_fields"] = {*update_fields, "join_date"}
+        super().save(*args, **kwargs)
+
     @property
     def get_spent_time(self):
         if self.leave_time:
@@ -84,6 +108,8 @@ class UserActivity(models.Model):
     class Meta:
         verbose_name = UserActivityCfg.SPENT_TIME_V
         verbose_name_plural = UserActivityCfg.SPENT_TIME_PLURAL_V
+        indexes = UserActivityCfg.INDEXES
+        constraints = UserActivityCfg.CONSTRAINTS
 
 
 class LevelTitle(models.Model):
@@ -213,14 +239,10 @@ class SeasonRank(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.level_title_id:  # type: ignore
-            try:
-                title = LevelTitle.objects.filter(
-                    level__lte=self.level
-                ).order_by("-level").first()
-                if title:
-                    self.level_title = title
-            except LevelTitle.DoesNotExist:
-                pass
+            from bot.management.core.reference import get_level_ladder
+            title = get_level_ladder().at_most(self.level)
+            if title:
+                self.level_title = title
         super().save(*args, **kwargs)
 
 
@@ -378,6 +400,31 @@ class Achievement(models.Model):
     def __str__(self):
         return f"{self.user_id} - {self.achievement_name}"
 
+    @classmethod
+    def record(cls, user_id: int, username: str, names: list[str],
+               achieved_at=None) -> None:
+        """
+        Выдаёт достижения: увеличивает UserAchievementCounter и, если
+        включён ACHIEVEMENT_AUDIT_LOG, пишет строки журнала - всё
+        в одной транзакции. Повторы в names считаются по отдельности.
+        """
+        if not names:
+            return
+        achieved_at = achieved_at or timezone.now()
+        with transaction.atomic():
+            for name, count in Counter(names).items():
+                UserAchievementCounter.increment(
+                    user_id, username, name, count, achieved_at)
+            if settings.ACHIEVEMENT_AUDIT_LOG:
+                cls.objects.bulk_create([
+                    cls(
+                        user_id=user_id,
+                        username=username,
+                        achievement_name=name,
+                        achieved_at=achieved_at,
+                    ) for name in names
+                ])
+
     @classmethod
     async def create_achievement(cls, user_id: int, username: str, name: str):
         """
@@ -391,11 +438,72 @@ class Achievement(models.Model):
         Returns:
             None
         """
-        await sync_to_async(cls.objects.create)(
-            user_id=user_id,
-            username=username,
-            achievement_name=name
-        )
+        await sync_to_async(cls.record)(user_id, username, [name])
+
+
+class UserAchievementCounter(models.Model):
+    """
+    Сколько раз пользователь получил достижение, первый и последний раз.
+    Обновляется в той же транзакции, что и выдача (Achievement.record);
+    журнал Achievement при этом необязателен.
+    """
+    user_id = models.IntegerField(
+        verbose_name=UserAchievementCounterCfg.USER_ID_V)
+    username = models.CharField(
+        verbose_name=UserAchievementCounterCfg.USERNAME_V,
+        max_length=MAX_LEN)
+    achievement_name = models.CharField(
+        verbose_name=UserAchievementCounterCfg.ACHIEVEMENT_NAME_V,
+        max_length=MAX_LEN)
+    count = models.PositiveIntegerField(
+        verbose_name=UserAchievementCounterCfg.COUNT_V,
+        default=0)
+    first_at = models.DateTimeField(
+        verbose_name=UserAchievementCounterCfg.FIRST_AT_V,
+        default=timezone.now)
+    last_at = models.DateTimeField(
+        verbose_name=UserAchievementCounterCfg.LAST_AT_V,
+        default=timezone.now)
+
+    class Meta:
+        verbose_name = UserAchievementCounterCfg.META_NAME
+        verbose_name_plural = UserAchievementCounterCfg.META_PL_NAME
+        constraints = UserAchievementCounterCfg.CONSTRAINTS
+        indexes = UserAchievementCounterCfg.INDEXES
+
+    def __str__(self):
+        return f"{self.user_id} - {self.achievement_name} x{self.count}"
+
+    @classmethod
+    def increment(cls, user_id: int, username: str, name: str,
+                  count: int, achieved_at) -> None:
+        """
+        Upsert счётчика: UPDATE через F(), а если строки ещё нет - INSERT.
+        Гонку двух INSERT разрешает уникальный индекс (user_id, name).
+        """
+        def update():
+            return cls.objects.filter(
+                user_id=user_id, achievement_name=name
+            ).update(
+                username=username,
+                count=F("count") + count,
+                last_at=Greatest(F("last_at"), Value(achieved_at)),
+            )
+
+        if update():
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(
+                    user_id=user_id,
+                    username=username,
+                    achievement_name=name,
+                    count=count,
+                    first_at=achieved_at,
+                    last_at=achieved_at,
+                )
+        except IntegrityError:
+            update()
 
 
 class DailyStatistics(models.Model):
@@ -418,11 +526,51 @@ class DailyStatistics(models.Model):
     class Meta:
         verbose_name = DailyStatisticsCfg.META_NAME
         verbose_name_plural = DailyStatisticsCfg.META_PL_NAME
+        constraints = DailyStatisticsCfg.CONSTRAINTS
 
     def __str__(self):
         return f"{self.username} - {self.date}"
 
 
+class ActivityRollup(models.Model):
+    """
+    Сводка завершённых выездов за день по пользователю и организации.
+    Поддерживается при уходе (LeaveService) и пересобирается командой
+    rebuild_activity_rollups.
+    """
+    date = models.DateField(
+        verbose_name=ActivityRollupCfg.DATE_V)
+    user_id = models.IntegerField(
+        verbose_name=ActivityRollupCfg.USER_ID_V)
+    username = models.CharField(
+        verbose_name=ActivityRollupCfg.USERNAME_V,
+        max_length=MAX_LEN,
+        blank=True,
+        null=True)
+    company = models.ForeignKey(
+        Company,
+        verbose_name=ActivityRollupCfg.COMPANY_V,
+        on_delete=models.CASCADE)
+    trips = models.PositiveIntegerField(
+        verbose_name=ActivityRollupCfg.TRIPS_V,
+        default=0)
+    total_seconds = models.PositiveBigIntegerField(
+        verbose_name=ActivityRollupCfg.TOTAL_SECONDS_V,
+        default=0)
+    experience = models.IntegerField(
+        verbose_name=ActivityRollupCfg.EXPERIENCE_V,
+        default=0)
+
+    class Meta:
+        verbose_name = ActivityRollupCfg.META_NAME
+        verbose_name_plural = ActivityRollupCfg.META_PL_NAME
+        constraints = ActivityRollupCfg.CONSTRAINTS
+        indexes = ActivityRollupCfg.INDEXES
+
+    def __str__(self):
+        return f"{self.date} - {self.user_id} - {self.company_id}"
+
+
 class Quote(models.Model):
     text = models.TextField(
         verbose_name=QuoteCfg.TEXT_V)
@@ -495,6 +643,78 @@ class CurrencyRate(models.Model):
         )
 
 
+class CurrencyLatest(models.Model):
+    """
+    Последний и предыдущий курс по каждой валюте. Обновляется в той же
+    транзакции, что и запись CurrencyRate, поэтому отчёт о курсах читает
+    по строке на валюту, а не всю историю.
+    """
+    currency = models.CharField(
+        max_length=15,
+        choices=CurrencyRate.CURRENCY_CHOICES,
+        unique=True,
+        verbose_name="Валюта")
+    rate = models.DecimalField(max_digits=20,
+                               decimal_places=10,
+                               verbose_name="Курс")
+    date = models.DateTimeField(verbose_name="Дата и время")
+    previous_rate = models.DecimalField(max_digits=20,
+                                        decimal_places=10,
+                                        blank=True,
+                                        null=True,
+                                        verbose_name="Предыдущий курс")
+    previous_date = models.DateTimeField(blank=True,
+                                         null=True,
+                                         verbose_name="Дата предыдущего курса")
+
+    class Meta:
+        verbose_name = "Последний курс валюты"
+        verbose_name_plural = "Последние курсы валют"
+
+    def __str__(self):
+        return f"{self.currency}: {self.rate} ({self.date})"
+
+
+class CurrencyDaily(models.Model):
+    """
+    Дневной бар (OHLC) по валюте. Собирается из CurrencyRate командой
+    compact_currency_rates, после чего старые сырые записи удаляются.
+    """
+    currency = models.CharField(
+        max_length=15,
+        choices=CurrencyRate.CURRENCY_CHOICES,
+        verbose_name="Валюта")
+    date = models.DateField(verbose_name="Дата")
+    open = models.DecimalField(max_digits=20,
+                               decimal_places=10,
+                               verbose_name="Открытие")
+    high = models.DecimalField(max_digits=20,
+                               decimal_places=10,
+                               verbose_name="Максимум")
+    low = models.DecimalField(max_digits=20,
+                              decimal_places=10,
+                              verbose_name="Минимум")
+    close = models.DecimalField(max_digits=20,
+                                decimal_places=10,
+                                verbose_name="Закрытие")
+    samples = models.PositiveIntegerField(default=0,
+                                          verbose_name="Замеров")
+
+    class Meta:
+        verbose_name = "Курс валюты за день"
+        verbose_name_plural = "Курсы валют по дням"
+        ordering = ("-date",)
+        constraints = [
+            models.UniqueConstraint(
+                fields=["currency", "date"],
+                name="unique_currency_daily_currency_date",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.currency} {self.date}: {self.close}"
+
+
 class DailytTipView(models.Model):
     tip = models.ForeignKey("DailytTips",
                             on_delete=models.CASCADE,
@@ -535,6 +755,40 @@ class DailytTipView(models.Model):
         )
 
 
+class ScheduledJob(models.Model):
+    """
+    Ежедневное задание бота (/start_weather, /start_stats и т.п.).
+    Планировщик живёт в памяти, поэтому при старте бота задания
+    восстанавливаются из этой таблицы (restore_jobs).
+    """
+    job_id = models.CharField(
+        verbose_name=ScheduledJobCfg.JOB_ID_V,
+        max_length=ScheduledJobCfg.MAX_LEN_JOB_ID,
+        unique=True)
+    hour = models.PositiveSmallIntegerField(
+        verbose_name=ScheduledJobCfg.HOUR_V)
+    minute = models.PositiveSmallIntegerField(
+        verbose_name=ScheduledJobCfg.MINUTE_V)
+    args = models.JSONField(
+        verbose_name=ScheduledJobCfg.ARGS_V,
+        default=list,
+        blank=True)
+    last_run_at = models.DateTimeField(
+        verbose_name=ScheduledJobCfg.LAST_RUN_AT_V,
+        blank=True,
+        null=True)
+    updated_at = models.DateTimeField(
+        verbose_name=ScheduledJobCfg.UPDATED_AT_V,
+        auto_now=True)
+
+    class Meta:
+        verbose_name = ScheduledJobCfg.META_NAME
+        verbose_name_plural = ScheduledJobCfg.META_PL_NAME
+
+    def __str__(self):
+        return f"{self.job_id} ({self.hour:02}:{self.minute:02})"
+
+
 class SiteStatistics(models.Model):
     """
     Модель для хранения глобальной статистики сайта.
@@ -3,6 +3,21 @@ from import_export import fields, resources
 from .models import UserActivity
 
 
+def format_time_difference(delta) -> str:
+    """Длительность в виде «1 д. 2 ч. 3 мин.», «2 ч. 3 мин.» или «3 мин.»"""
+    total_seconds = delta.total_seconds()
+
+    days = int(total_seconds // (3600 * 24))
+    hours = int((total_seconds % (3600 * 24)) // 3600)
+    minutes = int((total_seconds % 3600) // 60)
+
+    if days > 0:
+        return f"{days} д. {hours} ч. {minutes} мин."
+    if hours > 0:
+        return f"{hours} ч. {minutes} мин."
+    return f"{minutes} мин."
+
+
 class UserActivityResource(resources.ModelResource):
     id = fields.Field(
         attribute="id", column_name="№")
@@ -47,17 +62,5 @@ class UserActivityResource(resources.ModelResource):
     def dehydrate_time_difference(self, obj):
         """Возвращает дельту потраченного времени"""
         if obj.join_time and obj.leave_time:
-            delta = obj.leave_time - obj.join_time
-            total_seconds = delta.total_seconds()
-
-            days = int(total_seconds // (3600 * 24))
-            hours = int((total_seconds % (3600 * 24)) // 3600)
-            minutes = int((total_seconds % 3600) // 60)
-
-            if days > 0:
-                return f"{days} д. {hours} ч. {minutes} мин."
-            if hours > 0:
-                return f"{hours} ч. {minutes} мин."
-            return f"{minutes} мин."
-
+            return format_time_difference(obj.leave_time - obj.join_time)
         return "Ещё не покинул"
@@ -1,12 +1,38 @@
 import logging
 import random
+from dataclasses import dataclass, field
+from datetime import datetime
 from typing import Optional
 
+from asgiref.sync import sync_to_async
 from django.core.cache import cache
+from django.db import IntegrityError, transaction
 from django.db.models import F
 from django.http import HttpRequest
+from django.utils import timezone
 
-from bot.models import DailytTips, SiteStatistics
+from bot.management.core.achievements import (
+    achievement_name,
+    check_achievements,
+    save_achievements,
+)
+from bot.management.core.experience import (
+    calculate_experience,
+    resolve_level_info,
+    update_season_rank,
+)
+from bot.management.core.statistics import (
+    apply_daily_statistics_delta,
+    apply_rollup_delta,
+)
+from bot.models import (
+    Achievement,
+    Company,
+    DailytTips,
+    SeasonRank,
+    SiteStatistics,
+    UserActivity,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -90,3 +116,172 @@ class GamificationService:
         request.session.modified = True
 
         return DailytTips.objects.get(id=chosen_id)
+
+
+FIRST_BLOOD = "🩸 Первая кровь"
+
+
+class ActiveSessionExists(Exception):
+    """У пользователя уже есть открытая сессия."""
+
+    def __init__(self, activity: UserActivity):
+        super().__init__("Пользователь ещё не покинул организацию")
+        self.activity = activity
+
+
+@dataclass
+class JoinResult:
+    activity: UserActivity
+    company_created: bool
+    first_of_day: bool
+
+
+class JoinService:
+    """
+    Прибытие в организацию одной транзакцией.
+
+    Вместо проверки «уже прибыл?» отдельным запросом полагается на
+    UniqueConstraint по user_id среди открытых сессий: вторая сессия
+    (например, от двойного нажатия) отклоняется самой базой.
+    """
+
+    @staticmethod
+    def join(user_id: int, username: Optional[str],
+             company_name: str) -> JoinResult:
+        """
+        Находит или создаёт организацию и открывает сессию в ней.
+        Первому прибывшему за день выдаёт «Первую кровь».
+        Бросает ActiveSessionExists, если сессия уже открыта.
+        """
+        try:
+            with transaction.atomic():
+                company, created = Company.objects.get_or_create(
+                    name=company_name)
+                activity = UserActivity.objects.create(
+                    user_id=user_id,
+                    username=username,
+                    company=company
+                )
+                first_of_day = not UserActivity.objects.filter(
+                    join_date=activity.join_date
+                ).exclude(pk=activity.pk).exists()
+                if first_of_day:
+                    Achievement.record(
+                        user_id,
+                        username or f"User_{user_id}",
+                        [FIRST_BLOOD],
+                    )
+        except IntegrityError:
+            existing = UserActivity.objects.select_related("company").filter(
+                user_id=user_id, leave_time__isnull=True
+            ).first()
+            if existing is None:
+                raise
+            raise ActiveSessionExists(existing)
+        return JoinResult(
+            activity=activity,
+            company_created=created,
+            first_of_day=first_of_day,
+        )
+
+    @classmethod
+    async def ajoin(cls, user_id: int, username: Optional[str],
+                    company_name: str) -> JoinResult:
+        return await sync_to_async(cls.join)(user_id, username, company_name)
+
+
+@dataclass
+class LeaveResult:
+    activity: UserActivity
+    exp_earned: int
+    achievements: list[str] = field(default_factory=list)
+    rank: Optional[SeasonRank] = None
+    level_up: bool = False
+    new_level: int = 0
+    level_info: Optional[dict] = None
+
+
+class LeaveService:
+    """
+    Закрытие сессии: достижения, опыт, сезонный ранг и дневная
+    статистика в одной транзакции и за один переход в поток.
+    """
+
+    @staticmethod
+    def close_session(user_id: int, username: str, activity_id: int,
+                      leave_time: Optional[datetime] = None) -> LeaveResult:
+        """
+        Закрывает открытую активность `activity_id` и начисляет за неё опыт
+        (UserActivity.DoesNotExist, если её уже закрыли).
+
+        leave_time передаёт /edit_end: время убытия сохраняется с пометкой
+        о правке в той же транзакции, что и опыт, статистика и сводка.
+        Без него время убытия ставится текущим.
+        """
+        with transaction.atomic():
+            activity = (
+                UserActivity.objects.select_related("company")
+                .select_for_update(of=("self",))
+                .get(pk=activity_id, user_id=user_id,
+                     leave_time__isnull=True)
+            )
+            if leave_time is None:
+                activity.leave_time = timezone.now()
+            else:
+                activity.leave_time = leave_time
+                activity.edited = True
+                activity.edit_count += 1
+
+            try:
+                with transaction.atomic():
+                    achievements = check_achievements(user_id, activity)
+                    save_achievements(user_id, username, achievements)
+            except Exception as e:
+                logger.error(
+                    f"Ошибка при проверке достижений для {username}: {e}",
+                    exc_info=True
+                )
+                achievements = []
+
+            daily_visits_count = UserActivity.objects.filter(
+                user_id=user_id,
+                join_date=timezone.localdate(),
+            ).count()
+            exp_earned = calculate_experience(
+                activity,
+                [achievement_name(ach) for ach in achievements],
+                daily_visits_count
+            )
+            activity.experience_gained = exp_earned
+            time_spent = activity.leave_time - activity.join_time
+            rank, level_up, new_level = update_season_rank(
+                user_id, exp_earned, time_spent, username)
+            activity.save()
+            apply_daily_statistics_delta(
+                user_id,
+                username,
+                activity.join_date or timezone.localdate(activity.join_time),
+                time_spent,
+            )
+            apply_rollup_delta(activity, exp_earned)
+
+            level_info = None
+            if level_up and rank:
+                level_info = resolve_level_info(rank)
+
+        return LeaveResult(
+            activity=activity,
+            exp_earned=exp_earned,
+            achievements=achievements,
+            rank=rank,
+            level_up=level_up,
+            new_level=new_level,
+            level_info=level_info,
+        )
+
+    @classmethod
+    async def aclose_session(
+            cls, user_id: int, username: str, activity_id: int,
+            leave_time: Optional[datetime] = None) -> LeaveResult:
+        return await sync_to_async(cls.close_session)(
+            user_id, username, activity_id, leave_time)
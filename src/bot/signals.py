@@ -0,0 +1,34 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from bot.management.core.company_index import company_index
+from bot.management.core.reference import (
+    invalidate_active_season,
+    invalidate_level_ladder,
+)
+from bot.models import Company, LevelTitle, Season
+
+
+@receiver([post_save, post_delete], sender=LevelTitle)
+def reset_level_ladder(sender, **kwargs):
+    invalidate_level_ladder()
+
+
+@receiver([post_save, post_delete], sender=Season)
+def reset_active_season(sender, **kwargs):
+    invalidate_active_season()
+
+
+@receiver(post_save, sender=Company)
+def index_company(sender, instance, **kwargs):
+    # После коммита: при откате JoinService в индексе не останется
+    # организации, которой нет в БД.
+    transaction.on_commit(lambda: company_index.add(instance))
+
+
+@receiver(post_delete, sender=Company)
+def unindex_company(sender, instance, **kwargs):
+    # pk обнуляется после delete(), поэтому фиксируется сейчас.
+    company_id = instance.pk
+    transaction.on_commit(lambda: company_index.remove(company_id))
@@ -0,0 +1,1150 @@
+import asyncio
+import json
+import tempfile
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
+
+import httpx
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from asgiref.sync import async_to_sync, sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from openpyxl import load_workbook
+from telegram import Bot, Update, User
+from telegram.error import Forbidden, RetryAfter
+from telegram.ext import ApplicationBuilder, ExtBot, MessageHandler, filters
+
+from bot.exports import (
+    EXPORT_HEADERS,
+    export_activity_xlsx,
+    stream_activity_csv,
+)
+from bot.management.core import bot_instance, currency_chart
+from bot.management.core.achievements import (
+    IncompleteAchievementLog,
+    check_achievements,
+    prune_achievement_log,
+    rebuild_achievement_counters,
+    save_achievements,
+)
+from bot.management.core.bot_constants import BotOutboxCfg
+from bot.management.core.company_index import CompanyIndex
+from bot.management.core.currency_utils import (
+    compact_currency_rates,
+    get_currency_changes,
+    get_currency_period_changes,
+    save_currency_rates,
+)
+from bot.management.core.experience import (
+    ACHIEVEMENT_BONUSES,
+    calculate_experience,
+    resolve_level_info,
+    resolve_level_info_many,
+    update_season_rank,
+)
+from bot.management.core.http import HttpClient
+from bot.management.core.leaderboard import LEADERBOARD_TTL, SeasonLeaderboard
+from bot.management.core.outbox import OutboundQueue
+from bot.management.core.reference import (
+    get_level_ladder,
+    invalidate_active_season,
+    invalidate_level_ladder,
+)
+from bot.management.core.scheduler import (
+    CATCHUP_SUFFIX,
+    clear_jobs,
+    missed_fire_time,
+    register_job,
+    restore_jobs,
+    schedule_job,
+    scheduler,
+)
+from bot.management.core.sessions import ActiveSessionRegistry
+from bot.management.core.statistics import (
+    get_daily_statistics_message,
+    rebuild_activity_rollups,
+    rebuild_daily_statistics,
+)
+from bot.management.core.update_processor import PerUserUpdateProcessor
+from bot.management.core.weather import WeatherCache
+from bot.management.core.xp_vectorized import (
+    XPCurve,
+    calculate_experience_vectorized,
+)
+from bot.models import (
+    Achievement,
+    ActivityRollup,
+    Company,
+    CurrencyDaily,
+    CurrencyLatest,
+    CurrencyRate,
+    DailyStatistics,
+    LevelTitle,
+    ScheduledJob,
+    Season,
+    SeasonRank,
+    UserAchievementCounter,
+    UserActivity,
+)
+from bot.services import ActiveSessionExists, JoinService, LeaveService
+from bot.webhook import TelegramWebhook, make_fake_update, stop_webhook_bot
+
+
+class CheckAchievementsQueriesTest(TestCase):
+    """Проверка достижений не должна зависеть от объёма истории."""
+
+    def setUp(self):
+        self.company = Company.objects.create(name="Ромашка")
+        self.other_company = Company.objects.create(name="Лютик")
+
+    def _create_history(self, size):
+        now = timezone.now()
+        UserActivity.objects.bulk_create([
+            UserActivity(
+                user_id=1,
+                username="cat",
+                company=(self.company if i % 2 else self.other_company),
+                join_time=now - timedelta(days=i + 1, hours=2),
+                leave_time=now - timedelta(days=i + 1),
+            ) for i in range(size)
+        ])
+
+    def _create_current_activity(self):
+        return UserActivity.objects.select_related("company").get(
+            pk=UserActivity.objects.create(
+                user_id=1,
+                username="cat",
+                company=self.company,
+                join_time=timezone.now() - timedelta(minutes=30),
+                leave_time=timezone.now(),
+            ).pk
+        )
+
+    def test_query_count_does_not_grow_with_history(self):
+        for size in (0, 10, 500):
+            with self.subTest(history=size):
+                UserActivity.objects.all().delete()
+                self._create_history(size)
+                activity = self._create_current_activity()
+                with self.assertNumQueries(2):
+                    check_achievements(1, activity)
+
+    def test_team_player_counts_distinct_users(self):
+        activity = self._create_current_activity()
+        self.assertNotIn("👥 Командный игрок",
+                         check_achievements(1, activity))
+        UserActivity.objects.create(
+            user_id=2,
+            username="dog",
+            company=self.company,
+            join_time=activity.join_time,
+        )
+        self.assertIn("👥 Командный игрок", check_achievements(1, activity))
+
+
+class LevelLadderTest(TestCase):
+    def setUp(self):
+        call_command("load_level_titles", stdout=StringIO())
+        invalidate_level_ladder()
+
+    def test_matches_database_lookup(self):
+        ladder = get_level_ladder()
+        for experience in (0, 1, 29, 30, 31, 299, 300, 1790, 10 ** 6):
+            expected = LevelTitle.objects.filter(
+                min_experience__lte=experience
+            ).order_by("-level").first()
+            with self.subTest(experience=experience):
+                self.assertEqual(ladder.for_experience(experience), expected)
+
+    def test_level_info_without_queries(self):
+        get_level_ladder()
+        rank = SeasonRank(experience=45, level=2)
+        with self.assertNumQueries(0):
+            info = resolve_level_info(rank)
+        self.assertEqual(info["effective_level"], 2)
+        self.assertEqual(info["next_level_exp"], 60)
+
+    def test_level_info_many_single_query(self):
+        invalidate_level_ladder()
+        ranks = [SeasonRank(experience=exp, level=1)
+                 for exp in range(0, 5000, 50)]
+        with self.assertNumQueries(1):
+            infos = resolve_level_info_many(ranks)
+        self.assertEqual(infos, [resolve_level_info(r) for r in ranks])
+
+    def test_cache_invalidated_on_save(self):
+        get_level_ladder()
+        title = LevelTitle.objects.get(level=2)
+        title.title = "Новое звание"
+        title.save()
+        self.assertEqual(get_level_ladder().get(2).title, "Новое звание")
+
+
+class DailyStatisticsDeltaTest(TestCase):
+    def setUp(self):
+        invalidate_level_ladder()
+        invalidate_active_season()
+        self.company = Company.objects.create(name="Ромашка")
+
+    def _leave_after(self, seconds):
+        activity = UserActivity.objects.create(
+            user_id=1,
+            username="cat",
+            company=self.company,
+            join_time=timezone.now() - timedelta(seconds=seconds),
+        )
+        return LeaveService.close_session(1, "cat", activity.pk)
+
+    def test_leave_applies_delta_matching_rebuild(self):
+        spent = [
+            result.activity.leave_time - result.activity.join_time
+            for result in (self._leave_after(30), self._leave_after(45))
+        ]
+        stats = DailyStatistics.objects.get(user_id=1)
+        self.assertEqual(stats.total_trips, 2)
+        self.assertEqual(stats.total_time, spent[0] + spent[1])
+
+        today = timezone.localdate()
+        self.assertEqual(rebuild_daily_statistics(today, today), 1)
+        rebuilt = DailyStatistics.objects.get(user_id=1)
+        self.assertEqual(rebuilt.total_trips, stats.total_trips)
+        self.assertEqual(rebuilt.total_time, stats.total_time)
+
+    def test_leave_updates_rollup_matching_rebuild(self):
+        results = [self._leave_after(30), self._leave_after(45)]
+        rollup = ActivityRollup.objects.get(user_id=1)
+        self.assertEqual(rollup.trips, 2)
+        self.assertEqual(
+            rollup.experience, sum(r.exp_earned for r in results))
+
+        today = timezone.localdate()
+        self.assertEqual(
+            rebuild_activity_rollups(today, today, chunk_size=1), (2, 1))
+        rebuilt = ActivityRollup.objects.get(user_id=1)
+        self.assertEqual(
+            (rebuilt.trips, rebuilt.total_seconds, rebuilt.experience),
+            (rollup.trips, rollup.total_seconds, rollup.experience),
+        )
+
+
+class LeaveServiceTest(TestCase):
+    def setUp(self):
+        call_command("load_level_titles", stdout=StringIO())
+        invalidate_level_ladder()
+        invalidate_active_season()
+        Season.objects.create(name="Весна")
+        self.activity = JoinService.join(1, "cat", "Ромашка").activity
+        self.leave_time = self.activity.join_time + timedelta(hours=1)
+
+    def test_edited_leave_time_is_written_with_xp_and_statistics(self):
+        result = LeaveService.close_session(
+            1, "cat", self.activity.pk, leave_time=self.leave_time)
+
+        activity = UserActivity.objects.get(pk=self.activity.pk)
+        self.assertEqual(activity.leave_time, self.leave_time)
+        self.assertTrue(activity.edited)
+        self.assertEqual(activity.experience_gained, result.exp_earned)
+        self.assertEqual(DailyStatistics.objects.get(user_id=1).total_time,
+                         timedelta(hours=1))
+        self.assertEqual(ActivityRollup.objects.get(user_id=1).experience,
+                         result.exp_earned)
+        rank = SeasonRank.objects.get(user_id=1)
+        self.assertEqual((rank.experience, rank.visits_count),
+                         (result.exp_earned, 1))
+        with self.assertRaises(UserActivity.DoesNotExist):
+            LeaveService.close_session(1, "cat", self.activity.pk)
+
+    def test_failure_rolls_back_leave_time_and_statistics(self):
+        with mock.patch("bot.services.apply_rollup_delta",
+                        side_effect=RuntimeError("сбой")):
+            with self.assertRaises(RuntimeError):
+                LeaveService.close_session(
+                    1, "cat", self.activity.pk, leave_time=self.leave_time)
+
+        activity = UserActivity.objects.get(pk=self.activity.pk)
+        self.assertIsNone(activity.leave_time)
+        self.assertFalse(activity.edited)
+        self.assertEqual(activity.experience_gained, 0)
+        self.assertFalse(DailyStatistics.objects.exists())
+        self.assertFalse(ActivityRollup.objects.exists())
+        self.assertFalse(SeasonRank.objects.exists())
+
+
+class FakeBot:
+    def __init__(self, failures=()):
+        self.sent = []
+        self.failures = list(failures)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.failures:
+            raise self.failures.pop(0)
+        self.sent.append((chat_id, text, kwargs))
+
+
+@mock.patch.multiple(BotOutboxCfg, MERGE_WINDOW=0.05, BACKOFF_BASE=0.01,
+                     GROUP_RATE=1000, PRIVATE_RATE=1000)
+class OutboundQueueTest(SimpleTestCase):
+    async def test_merges_announcements_within_window(self):
+        bot = FakeBot()
+        queue = OutboundQueue()
+        queue.start(bot)
+        queue.enqueue(-1, "первое", merge_key="ach", parse_mode="Markdown")
+        queue.enqueue(-1, "второе", merge_key="ach", parse_mode="Markdown")
+        queue.enqueue(-1, "погода", parse_mode="HTML")
+        queue.enqueue(-2, "другой чат", merge_key="ach")
+        await queue.stop()
+        self.assertEqual(
+            [(text, kwargs) for chat, text, kwargs in bot.sent if chat == -1],
+            [("первое\n\nвторое", {"parse_mode": "Markdown"}),
+             ("погода", {"parse_mode": "HTML"})],
+        )
+        self.assertIn((-2, "другой чат", {}), bot.sent)
+
+    async def test_honours_retry_after(self):
+        bot = FakeBot(failures=[RetryAfter(0)])
+        queue = OutboundQueue()
+        queue.start(bot)
+        queue.enqueue(-1, "текст")
+        await queue.stop()
+        self.assertEqual(bot.sent, [(-1, "текст", {})])
+
+
+class CompanyIndexTest(TestCase):
+    def setUp(self):
+        for name in ("Ромашка", "Ёлочка", "Лютик и  Ко", "Рога и копыта"):
+            Company.objects.create(name=name)
+        self.index = CompanyIndex()
+        self.index.load()
+
+    def test_suggests_typos_and_normalized_names(self):
+        for query, expected in (
+            ("Ромашкаа", "Ромашка"),
+            ("ромашка", "Ромашка"),
+            ("Елочка", "Ёлочка"),
+            ("лютик и ко", "Лютик и  Ко"),
+        ):
+            with self.subTest(query=query):
+                with self.assertNumQueries(0):
+                    suggestions = self.index.suggest(query)
+                self.assertEqual(suggestions[0], expected)
+
+    def test_unrelated_name_has_no_suggestions(self):
+        self.assertEqual(self.index.suggest("Сервер"), [])
+
+    def test_updated_on_create_and_rename(self):
+        company = Company.objects.create(name="Василёк")
+        self.index.add(company)
+        self.assertEqual(self.index.suggest("василек"), ["Василёк"])
+        company.name = "Одуванчик"
+        self.index.add(company)
+        self.assertEqual(self.index.suggest("василек"), [])
+
+    def test_signals_update_index_after_commit(self):
+        with mock.patch("bot.signals.company_index", self.index):
+            with self.captureOnCommitCallbacks(execute=True):
+                company = Company.objects.create(name="Василёк")
+                self.assertEqual(self.index.suggest("василек"), [])
+            self.assertEqual(self.index.suggest("василек"), ["Василёк"])
+
+            with self.captureOnCommitCallbacks() as callbacks:
+                company.delete()
+            self.assertEqual(self.index.suggest("василек"), ["Василёк"])
+            for callback in callbacks:
+                callback()
+            self.assertEqual(self.index.suggest("василек"), [])
+
+    def test_rolled_back_company_is_not_indexed(self):
+        with mock.patch("bot.signals.company_index", self.index):
+            with self.captureOnCommitCallbacks(execute=True):
+                with self.assertRaises(ActiveSessionExists):
+                    JoinService.join(1, "cat", "Ромашка")
+                    JoinService.join(1, "cat", "Лютик")
+        self.assertEqual(self.index.suggest("Лютик"), ["Лютик и  Ко"])
+
+
+class JoinServiceTest(TestCase):
+    def test_second_open_session_is_rejected_by_constraint(self):
+        first = JoinService.join(1, "cat", "Ромашка")
+        self.assertTrue(first.company_created)
+        with self.assertRaises(ActiveSessionExists) as raised:
+            JoinService.join(1, "cat", "Лютик")
+        self.assertEqual(raised.exception.activity.pk, first.activity.pk)
+        self.assertEqual(
+            UserActivity.objects.filter(user_id=1).count(), 1)
+        self.assertFalse(Company.objects.filter(name="Лютик").exists())
+
+    def test_first_of_day_gets_first_blood_once(self):
+        self.assertTrue(JoinService.join(1, "cat", "Ромашка").first_of_day)
+        self.assertFalse(JoinService.join(2, "dog", "Ромашка").first_of_day)
+        self.assertEqual(
+            list(Achievement.objects.values_list("user_id", flat=True)), [1])
+
+
+class ActiveSessionRegistryTest(TestCase):
+    def test_hit_is_confirmed_against_database(self):
+        activity = JoinService.join(1, "cat", "Ромашка").activity
+        registry = ActiveSessionRegistry()
+        registry.load()
+        self.assertTrue(async_to_sync(registry.ais_active)(1))
+
+        # Админ закрыл сессию мимо бота (mark_as_left).
+        UserActivity.objects.filter(pk=activity.pk).update(
+            leave_time=timezone.now())
+        self.assertFalse(async_to_sync(registry.ais_active)(1))
+        self.assertIsNone(registry.get(1))
+        with self.assertNumQueries(0):
+            self.assertFalse(async_to_sync(registry.ais_active)(1))
+
+    def test_leave_recovers_session_missing_from_registry(self):
+        from bot.management.commands import start_bot
+
+        activity = JoinService.join(1, "cat", "Ромашка").activity
+        message = mock.Mock(reply_text=mock.AsyncMock())
+        update = mock.Mock(effective_user=mock.Mock(id=1, username="cat"),
+                           effective_message=message)
+        # Сессию открыл другой процесс: в реестре этого её нет.
+        with mock.patch.object(start_bot, "active_sessions",
+                               ActiveSessionRegistry()) as registry, \
+                mock.patch.object(start_bot, "announce_achievements"):
+            async_to_sync(start_bot.leave)(update, None)
+            self.assertIsNone(registry.get(1))
+
+        activity.refresh_from_db()
+        self.assertIsNotNone(activity.leave_time)
+        self.assertIn("Вы покинули организацию Ромашка",
+                      message.reply_text.call_args.args[0])
+
+
+class RemindToLeaveTest(TestCase):
+    def setUp(self):
+        company = Company.objects.create(name="Ромашка")
+        for user_id in (1, 2, 3):
+            UserActivity.objects.create(
+                user_id=user_id, username=f"user{user_id}", company=company)
+
+    @mock.patch.dict("os.environ", {"TELEGRAM_GROUP_CHAT_ID": "-100"})
+    async def test_direct_mode_falls_back_to_group_for_failed_dms(self):
+        from bot.management.commands import start_bot
+
+        class DirectBot(FakeBot):
+            async def send_message(self, chat_id, text, **kwargs):
+                if chat_id == 2:
+                    raise Forbidden("bot was blocked by the user")
+                await super().send_message(chat_id, text, **kwargs)
+
+        bot = DirectBot()
+        # Ленивая загрузка company из async-кода упала бы с
+        # SynchronousOnlyOperation, так что тест проверяет и select_related.
+        with mock.patch.object(start_bot.outbox, "enqueue") as enqueue:
+            await start_bot.remind_to_leave(bot, direct=True)
+
+        self.assertEqual(sorted(chat for chat, *_ in bot.sent), [1, 3])
+        keyboard = bot.sent[0][2]["reply_markup"].inline_keyboard
+        self.assertTrue(
+            keyboard[0][0].callback_data.startswith(
+                start_bot.LEAVE_CALLBACK_PREFIX))
+        group_text = enqueue.call_args.args[1]
+        self.assertIn("@user2 (Ромашка)", group_text)
+        self.assertNotIn("@user1", group_text)
+
+
+class SeasonLeaderboardTest(TestCase):
+    def setUp(self):
+        call_command("load_level_titles", stdout=StringIO())
+        invalidate_level_ladder()
+        invalidate_active_season()
+        self.season = Season.objects.create(name="Весна")
+        for user_id, experience in ((1, 100), (2, 300), (3, 100), (4, 50)):
+            SeasonRank.objects.create(
+                user_id=user_id, username=f"user{user_id}",
+                season=self.season, experience=experience)
+        self.board = SeasonLeaderboard()
+        self.board.load(self.season)
+
+    def test_positions_and_percentiles_without_queries(self):
+        with self.assertNumQueries(0):
+            positions = [self.board.position(u) for u in (2, 1, 3, 4)]
+            top = [e.user_id for e in self.board.top(2)]
+            percentile = self.board.percentile(1)
+        self.assertEqual(positions, [1, 2, 2, 4])
+        self.assertEqual(top, [2, 1])
+        self.assertAlmostEqual(percentile, 100 / 3)
+        self.assertIsNone(self.board.position(99))
+
+    def test_update_moves_user(self):
+        with mock.patch(
+            "bot.management.core.experience.season_leaderboard", self.board
+        ), self.captureOnCommitCallbacks(execute=True):
+            update_season_rank(4, 500, timedelta(minutes=30), "user4")
+        self.assertEqual(self.board.position(4), 1)
+        self.assertEqual(self.board.position(2), 2)
+        self.assertEqual(len(self.board), 4)
+
+    def test_ensure_reloads_after_ttl(self):
+        # Правка из другого процесса: сигналов и update() не было.
+        clock = "bot.management.core.leaderboard.time.monotonic"
+        with mock.patch(clock, return_value=1000):
+            self.board.load(self.season)
+            SeasonRank.objects.filter(user_id=4).update(experience=500)
+        with mock.patch(clock, return_value=1001):
+            with self.assertNumQueries(0):
+                self.board.ensure(self.season)
+        self.assertEqual(self.board.position(4), 4)
+        with mock.patch(clock, return_value=1000 + LEADERBOARD_TTL):
+            self.board.ensure(self.season)
+        self.assertEqual(self.board.position(4), 1)
+
+
+class RebuildSeasonRanksTest(TestCase):
+    def setUp(self):
+        call_command("load_level_titles", stdout=StringIO())
+        invalidate_level_ladder()
+        invalidate_active_season()
+        self.season = Season.objects.create(name="Весна")
+        self.company = Company.objects.create(name="Ромашка")
+
+    def _visit(self, user_id):
+        activity = UserActivity.objects.create(
+            user_id=user_id, username=f"user{user_id}", company=self.company)
+        LeaveService.close_session(user_id, f"user{user_id}", activity.pk)
+
+    def _ranks(self):
+        return list(SeasonRank.objects.order_by("user_id").values_list(
+            "user_id", "experience", "level", "total_time", "visits_count"))
+
+    def test_replay_matches_incremental_ranks(self):
+        for user_id in (1, 1, 2, 1):
+            self._visit(user_id)
+        expected = self._ranks()
+        SeasonRank.objects.update(experience=0, level=1, visits_count=0)
+
+        out = StringIO()
+        call_command("rebuild_season_ranks", dry_run=True, stdout=out)
+        self.assertIn("Пробный запуск: изменится 2", out.getvalue())
+        self.assertNotEqual(self._ranks(), expected)
+
+        call_command("rebuild_season_ranks", chunk_size=1, stdout=StringIO())
+        self.assertEqual(self._ranks(), expected)
+
+    @override_settings(ACHIEVEMENT_AUDIT_LOG=True)
+    def test_refuses_pruned_achievement_log(self):
+        for user_id in (1, 1, 2):
+            self._visit(user_id)
+        Achievement.objects.all().delete()
+        expected = self._ranks()
+
+        with self.assertRaisesMessage(CommandError, "--force"):
+            call_command("rebuild_season_ranks", stdout=StringIO())
+        self.assertEqual(self._ranks(), expected)
+
+        call_command("rebuild_season_ranks", force=True, stdout=StringIO())
+        self.assertNotEqual(self._ranks(), expected)
+
+
+class VectorizedExperienceTest(SimpleTestCase):
+    def test_matches_scalar_formula(self):
+        start = timezone.now()
+        minutes_grid = [-5, 0, 0.5, 13, 39.99, 40, 40.01, 57.3, 79.99, 80,
+                        80.01, 100, 119.99, 120, 120.01, 240, 600, 720.99,
+                        721, 800]
+        bonus_grid = [[], ["Читер: Часовщик"], list(ACHIEVEMENT_BONUSES)]
+        minutes, visits, bonuses, expected = [], [], [], []
+        for m in minutes_grid:
+            activity = UserActivity(
+                join_time=start, leave_time=start + timedelta(minutes=m))
+            for visit in (1, 2, 3, 5, 10):
+                for earned in bonus_grid:
+                    minutes.append(m)
+                    visits.append(visit)
+                    bonuses.append(
+                        sum(ACHIEVEMENT_BONUSES[name] for name in earned))
+                    expected.append(
+                        calculate_experience(activity, earned, visit))
+
+        result = calculate_experience_vectorized(minutes, visits, bonuses)
+        self.assertEqual(result.tolist(), expected)
+
+    def test_overrides_change_curve_and_bonuses(self):
+        curve = XPCurve().with_overrides(
+            {"base_exp": 0}, {"Читер: Часовщик": 100})
+        self.assertEqual(curve.bonuses["Читер: Часовщик"], 100)
+        self.assertEqual(
+            calculate_experience_vectorized([0], [1], [0], curve).tolist(),
+            [0])
+
+
+class SimulateXPTest(TestCase):
+    def setUp(self):
+        call_command("load_level_titles", stdout=StringIO())
+        invalidate_level_ladder()
+        invalidate_active_season()
+        self.season = Season.objects.create(name="Весна")
+        self.company = Company.objects.create(name="Ромашка")
+
+    def test_baseline_matches_incremental_experience(self):
+        for user_id in (1, 1, 2):
+            activity = UserActivity.objects.create(
+                user_id=user_id, username="cat", company=self.company)
+            LeaveService.close_session(user_id, "cat", activity.pk)
+        total = sum(SeasonRank.objects.values_list("experience", flat=True))
+
+        out = StringIO()
+        call_command("simulate_xp", season=self.season.pk, stdout=out)
+        self.assertIn("Выездов: 3, пользователей: 2", out.getvalue())
+        self.assertIn(f"Опыт: всего {total},", out.getvalue())
+
+    def test_variant_bonus_for_unreplayed_achievement(self):
+        activity = UserActivity.objects.create(
+            user_id=1, username="cat", company=self.company)
+        save_achievements(1, "cat", ["🌃 Ночной досмотр"])
+        LeaveService.close_session(1, "cat", activity.pk)
+        total = SeasonRank.objects.get(user_id=1).experience
+
+        with tempfile.NamedTemporaryFile(
+                "w", suffix=".json", encoding="utf-8") as variants:
+            json.dump([{"name": "night",
+                        "bonuses": {"Ночной досмотр": 7}}], variants)
+            variants.flush()
+            out = StringIO()
+            # Без --season и дат берётся активный сезон.
+            call_command("simulate_xp", variants=variants.name, stdout=out)
+        night = out.getvalue().split("Вариант: night")[1]
+        self.assertIn(f"Опыт: всего {total + 7},", night)
+
+    def test_unreplayed_bonus_is_rejected(self):
+        with tempfile.NamedTemporaryFile(
+                "w", suffix=".json", encoding="utf-8") as variants:
+            json.dump([{"bonuses": {"Первая кровь": 3}}], variants)
+            variants.flush()
+            with self.assertRaises(CommandError):
+                call_command("simulate_xp", variants=variants.name,
+                             stdout=StringIO())
+
+
+class UserAchievementCounterTest(TestCase):
+    def _counters(self):
+        return list(UserAchievementCounter.objects.order_by(
+            "user_id", "achievement_name").values_list(
+                "user_id", "achievement_name", "count"))
+
+    def test_record_upserts_counters_and_log(self):
+        save_achievements(1, "cat", ["👥 Командный игрок", "🌃 Ночной досмотр"])
+        save_achievements(1, "cat", ["👥 Командный игрок"] * 2)
+        save_achievements(2, "dog", ["👥 Командный игрок"])
+
+        self.assertEqual(self._counters(), [
+            (1, "Командный игрок", 3),
+            (1, "Ночной досмотр", 1),
+            (2, "Командный игрок", 1),
+        ])
+        self.assertEqual(Achievement.objects.count(), 5)
+
+        expected = self._counters()
+        self.assertEqual(rebuild_achievement_counters(), 3)
+        self.assertEqual(self._counters(), expected)
+
+    @override_settings(ACHIEVEMENT_AUDIT_LOG=False)
+    def test_audit_log_is_optional(self):
+        save_achievements(1, "cat", ["👥 Командный игрок"])
+        self.assertEqual(self._counters(), [(1, "Командный игрок", 1)])
+        self.assertFalse(Achievement.objects.exists())
+        with self.assertRaises(IncompleteAchievementLog):
+            rebuild_achievement_counters()
+
+    def test_prune_keeps_counters(self):
+        save_achievements(1, "cat", ["👥 Командный игрок"])
+        Achievement.objects.update(
+            achieved_at=timezone.now() - timedelta(days=30))
+        save_achievements(1, "cat", ["👥 Командный игрок"])
+
+        deleted = prune_achievement_log(
+            timezone.now() - timedelta(days=1), chunk_size=1)
+        self.assertEqual(deleted, 1)
+        self.assertEqual(Achievement.objects.count(), 1)
+        self.assertEqual(self._counters(), [(1, "Командный игрок", 2)])
+
+        with self.assertRaises(CommandError):
+            call_command("rebuild_achievement_counters", stdout=StringIO())
+        self.assertEqual(self._counters(), [(1, "Командный игрок", 2)])
+        Season.objects.create(name="Весна")
+        out = StringIO()
+        call_command("rebuild_season_ranks", dry_run=True, stdout=out)
+        self.assertIn("В журнале достижений нет 1 выдач", out.getvalue())
+
+        self.assertEqual(rebuild_achievement_counters(force=True), 1)
+        self.assertEqual(self._counters(), [(1, "Командный игрок", 1)])
+
+    async def test_daily_message_reads_todays_counters(self):
+        await sync_to_async(DailyStatistics.objects.create)(
+            user_id=1, username="cat", date=timezone.localdate(),
+            total_time=timedelta(hours=1), total_trips=1)
+        await sync_to_async(save_achievements)(
+            1, "cat", ["👥 Командный игрок", "🌃 Ночной досмотр"])
+
+        text = await get_daily_statistics_message()
+        self.assertIn("Достижения: Командный игрок, Ночной досмотр", text)
+
+
+class ActivityExportTest(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        for i, name in enumerate(("Ромашка", "Лютик", "Василёк")):
+            UserActivity.objects.create(
+                user_id=i, username=f"user{i}",
+                company=Company.objects.create(name=name),
+                join_time=now - timedelta(days=1, hours=i + 1),
+                leave_time=now - timedelta(days=1) if i else None,
+            )
+
+    def test_csv_streams_rows_in_one_query(self):
+        response = stream_activity_csv(UserActivity.objects.all())
+        self.assertTrue(response.is_async)
+
+        async def consume():
+            # Как ASGIHandler: через __aiter__, без буферизации в список.
+            return [part async for part in response]
+
+        with self.assertNumQueries(1), \
+                mock.patch("bot.exports.EXPORT_CHUNK_SIZE", 1):
+            parts = async_to_sync(consume)()
+        # BOM, заголовок и по куску на каждую строку выгрузки.
+        self.assertEqual(len(parts), 5)
+        content = b"".join(parts).decode("utf-8")
+        lines = content.lstrip("\ufeff").splitlines()
+        self.assertEqual(lines[0], ";".join(EXPORT_HEADERS))
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[3].endswith(";Ещё не покинул;Ещё не покинул"))
+        self.assertTrue(lines[2].endswith(";2 ч. 0 мин."))
+
+    def test_xlsx_matches_csv_rows(self):
+        response = export_activity_xlsx(UserActivity.objects.all())
+        content = b"".join(response.streaming_content)
+        response.close()
+        sheet = load_workbook(BytesIO(content), read_only=True).active
+        rows = list(sheet.iter_rows(values_only=True))
+        self.assertEqual(rows[0], EXPORT_HEADERS)
+        self.assertEqual([row[3] for row in rows[1:]],
+                         ["Василёк", "Лютик", "Ромашка"])
+
+
+class ScheduledJobTest(TestCase):
+    def setUp(self):
+        self.runs = []
+
+        async def job(bot, *args):
+            self.runs.append((bot, args))
+
+        register_job("test_job", job)
+
+    def _job(self, hour, minute, last_run_at):
+        return ScheduledJob(job_id="test_job", hour=hour, minute=minute,
+                            last_run_at=last_run_at)
+
+    def test_missed_run_within_grace_is_caught_up_once(self):
+        tz = timezone.get_current_timezone()
+        now = timezone.datetime(2026, 3, 10, 10, 0, tzinfo=tz)
+        last_run = now - timedelta(days=3)
+
+        missed = missed_fire_time(self._job(9, 0, last_run), now)
+        self.assertEqual(missed, now - timedelta(hours=1))
+        self.assertIsNone(missed_fire_time(self._job(11, 0, now), now))
+        self.assertIsNone(missed_fire_time(self._job(5, 0, last_run), now))
+
+    async def test_restore_adds_jobs_and_catch_up(self):
+        await schedule_job("test_job", "bot", 23, 59, args=(True,))
+        job = await ScheduledJob.objects.aget(job_id="test_job")
+        self.assertEqual((job.hour, job.minute, job.args), (23, 59, [True]))
+        await clear_jobs()
+        self.assertFalse(await ScheduledJob.objects.aexists())
+
+        fired = timezone.localtime() - timedelta(minutes=5)
+        await ScheduledJob.objects.acreate(
+            job_id="test_job", hour=fired.hour, minute=fired.minute,
+            args=[True], last_run_at=fired - timedelta(days=1))
+        await ScheduledJob.objects.acreate(
+            job_id="unknown_job", hour=9, minute=0)
+
+        try:
+            self.assertEqual(await restore_jobs("bot"), 1)
+            self.assertIsNotNone(scheduler.get_job("test_job"))
+            catchup = scheduler.get_job("test_job" + CATCHUP_SUFFIX)
+            self.assertIsNotNone(catchup)
+            self.assertEqual(catchup.args, ("test_job", "bot", True))
+            for _ in range(100):
+                job = await ScheduledJob.objects.aget(job_id="test_job")
+                if job.last_run_at > fired:
+                    break
+                await asyncio.sleep(0.01)
+            self.assertEqual(self.runs, [("bot", (True,))])
+            self.assertGreater(job.last_run_at, fired)
+        finally:
+            await clear_jobs()
+
+
+class HttpClientTest(SimpleTestCase):
+    async def test_session_is_shared_and_latency_counted(self):
+        async def handler(request):
+            status = 500 if request.path == "/fail" else 200
+            return web.json_response({"ok": True}, status=status)
+
+        app = web.Application()
+        app.router.add_get("/{path}", handler)
+        client = HttpClient()
+        async with TestServer(app, host="127.0.0.1") as server:
+            await client.start()
+            session = client.session()
+            for path in ("/ok", "/ok", "/fail"):
+                async with client.session().get(server.make_url(path)):
+                    pass
+            self.assertIs(client.session(), session)
+            await client.close()
+
+        stats = client.stats["127.0.0.1"]
+        self.assertEqual((stats.requests, stats.errors), (3, 1))
+        self.assertGreater(stats.max_seconds, 0)
+        self.assertTrue(session.closed)
+
+    def test_session_from_another_loop_is_closed(self):
+        client = HttpClient()
+
+        async def open_session():
+            session = client.session()
+            await asyncio.sleep(0)
+            return session
+
+        # Как после async_to_sync: цикл первой сессии уже закрыт.
+        old = asyncio.run(open_session())
+        self.assertFalse(old.closed)
+        new = asyncio.run(open_session())
+        self.assertIsNot(new, old)
+        self.assertTrue(old.closed)
+        asyncio.run(client.close())
+        self.assertTrue(new.closed)
+
+
+class WeatherCacheTest(SimpleTestCase):
+    async def test_stale_while_revalidate(self):
+        calls = []
+
+        async def loader():
+            calls.append(1)
+            await asyncio.sleep(0)
+            return None if len(calls) == 3 else len(calls)
+
+        cache = WeatherCache({"current": (loader, 60)}, max_stale=600)
+        clock = "bot.management.core.weather.time.monotonic"
+        with mock.patch(clock, return_value=1000):
+            self.assertEqual(await asyncio.gather(
+                cache.get("current"), cache.get("current")), [1, 1])
+            self.assertEqual(await cache.get("current"), 1)
+        self.assertEqual(len(calls), 1)
+
+        with mock.patch(clock, return_value=1100):
+            self.assertEqual(await cache.get("current"), 1)
+            await asyncio.gather(*cache.warm())
+            self.assertEqual(await cache.get("current"), 2)
+
+        with mock.patch(clock, return_value=2000):
+            # Источник сбоит - остаётся последнее удачное значение.
+            self.assertEqual(await cache.get("current"), 2)
+        self.assertEqual(len(calls), 3)
+
+    async def test_fresh_and_new_day_skip_cache(self):
+        calls = []
+
+        async def loader():
+            calls.append(1)
+            return len(calls)
+
+        cache = WeatherCache({"forecast": (loader, 600)}, max_stale=3600)
+        today = "bot.management.core.weather._today"
+        with mock.patch(today, return_value=datetime(2026, 1, 1).date()):
+            self.assertEqual(await cache.get("forecast"), 1)
+            self.assertEqual(await cache.get("forecast"), 1)
+            self.assertEqual(await cache.get("forecast", fresh=True), 2)
+        # После полуночи вчерашний прогноз не отдаётся даже как устаревший.
+        with mock.patch(today, return_value=datetime(2026, 1, 2).date()):
+            self.assertEqual(await cache.get("forecast"), 3)
+
+
+class CurrencyLatestTest(TestCase):
+    def test_changes_read_one_row_per_currency(self):
+        for usd in ("90", "91", "93"):
+            async_to_sync(save_currency_rates)(
+                {"USD": Decimal(usd), "EUR": Decimal("100")})
+
+        with self.assertNumQueries(1):
+            changes = async_to_sync(get_currency_changes)()
+        self.assertEqual(changes["USD"]["current"], Decimal("93"))
+        self.assertEqual(changes["USD"]["change"], Decimal("2"))
+        self.assertEqual(changes["EUR"]["change"], Decimal("0"))
+
+        now = timezone.now()
+        for i, pk in enumerate(CurrencyRate.objects.order_by(
+                "pk").values_list("pk", flat=True)):
+            CurrencyRate.objects.filter(pk=pk).update(
+                date=now + timedelta(minutes=i))
+        CurrencyLatest.objects.all().delete()
+        self.assertEqual(async_to_sync(get_currency_changes)(), changes)
+
+
+class CurrencyDailyTest(TestCase):
+    def _rate(self, currency, rate, days_ago, hour):
+        date = timezone.make_aware(datetime.combine(
+            timezone.localdate() - timedelta(days=days_ago), time(hour)))
+        row = CurrencyRate.objects.create(currency=currency,
+                                          rate=Decimal(rate))
+        CurrencyRate.objects.filter(pk=row.pk).update(date=date)
+
+    def test_compaction_builds_ohlc_and_prunes_raw_rows(self):
+        for rate, hour in (("92", 9), ("95", 12), ("89", 15), ("90", 18)):
+            self._rate("USD", rate, 40, hour)
+        self._rate("USD", "100", 8, 10)
+        self._rate("USD", "101", 0, 10)
+
+        written, deleted = compact_currency_rates(keep_days=30,
+                                                  chunk_size=2)
+        self.assertEqual((written, deleted), (2, 4))
+        old = CurrencyDaily.objects.get(
+            currency="USD",
+            date=timezone.localdate() - timedelta(days=40))
+        self.assertEqual(
+            (old.open, old.high, old.low, old.close, old.samples),
+            (Decimal("92"), Decimal("95"), Decimal("89"),
+             Decimal("90"), 4))
+        self.assertEqual(CurrencyRate.objects.count(), 2)
+
+        # Повторный запуск пересчитывает только последний день.
+        self.assertEqual(compact_currency_rates(keep_days=30), (1, 0))
+        self.assertEqual(CurrencyDaily.objects.count(), 2)
+
+    def test_period_changes_read_daily_bars(self):
+        self._rate("USD", "80", 9, 12)
+        compact_currency_rates(keep_days=1)
+        async_to_sync(save_currency_rates)({"USD": Decimal("100")})
+
+        with self.assertNumQueries(2):
+            week = async_to_sync(get_currency_period_changes)("week")
+        self.assertEqual(week["USD"]["change"], Decimal("20"))
+        self.assertEqual(week["USD"]["percent"], Decimal("25"))
+        self.assertEqual(async_to_sync(get_currency_period_changes)("year"),
+                         {})
+
+    @mock.patch.dict("os.environ", {"TELEGRAM_GROUP_CHAT_ID": "-100"})
+    def test_currency_job_compacts_and_reports_weekly_change(self):
+        from bot.management.commands import start_bot
+
+        self._rate("USD", "80", 9, 12)
+        fetch = mock.AsyncMock(return_value={"USD": Decimal("100")})
+        with mock.patch.object(start_bot, "fetch_currency_rates", fetch), \
+                mock.patch("bot.management.core.currency_utils.outbox") as out:
+            async_to_sync(start_bot.send_currency_rates_to_group)(None)
+
+        self.assertTrue(CurrencyDaily.objects.filter(currency="USD").exists())
+        text = out.enqueue.call_args.args[1]
+        self.assertIn("за неделю `+25.00%`", text)
+
+
+class CurrencyChartTest(TestCase):
+    def setUp(self):
+        currency_chart.chart_cache.clear()
+        self.message = mock.Mock()
+        self.message.reply_photo = mock.AsyncMock(return_value=mock.Mock(
+            photo=[mock.Mock(file_id="small"), mock.Mock(file_id="big")]))
+
+    def _send(self):
+        return async_to_sync(currency_chart.send_currency_chart)(
+            self.message, "USD", "week")
+
+    def test_chart_is_rendered_once_and_reused_by_file_id(self):
+        self.assertFalse(self._send())
+        for usd in ("90", "92", "91"):
+            async_to_sync(save_currency_rates)({"USD": Decimal(usd)})
+
+        render = mock.Mock(wraps=currency_chart.render_currency_chart)
+        with mock.patch.object(currency_chart, "render_currency_chart",
+                               render):
+            self.assertTrue(self._send())
+            png = self.message.reply_photo.call_args.args[0]
+            self.assertTrue(png.startswith(b"\x89PNG"))
+            self.assertIn("+1.11%",
+                          self.message.reply_photo.call_args.kwargs[
+                              "caption"])
+
+            self._send()
+            self.assertEqual(self.message.reply_photo.call_args.args[0],
+                             "big")
+            self.assertEqual(render.call_count, 1)
+
+            # Новый курс - новый ключ кэша, график перерисовывается.
+            async_to_sync(save_currency_rates)({"USD": Decimal("95")})
+            self._send()
+            self.assertIsInstance(
+                self.message.reply_photo.call_args.args[0], bytes)
+            self.assertEqual(render.call_count, 2)
+
+
+class ShutdownDrainTest(SimpleTestCase):
+    async def test_outbox_is_drained_before_bot_shutdown(self):
+        from bot.management.commands import start_bot
+
+        sent = []
+
+        async def request(client, method, url, **kwargs):
+            # Ответы Bot API вместо сети; закрытый HTTPXRequest упадёт
+            # раньше, в do_request.
+            if url.endswith("/getMe"):
+                result = {"id": 1, "is_bot": True, "first_name": "Cat",
+                          "username": "cat_bot"}
+            else:
+                sent.append(kwargs["data"]["text"])
+                result = {"message_id": len(sent), "date": 0,
+                          "chat": {"id": -100, "type": "group"},
+                          "text": kwargs["data"]["text"]}
+            return httpx.Response(200, json={"ok": True, "result": result})
+
+        application = (ApplicationBuilder().token("123:ABC").updater(None)
+                       .build())
+        application.post_stop = start_bot.on_stop
+        application.post_shutdown = start_bot.on_shutdown
+        with mock.patch("httpx.AsyncClient.request", request), \
+                mock.patch.multiple(bot_instance,
+                                    _bot_application=application,
+                                    _is_initialized=False):
+            await bot_instance.initialize_bot_application()
+            start_bot.outbox.start(application.bot)
+            # merge_key держит сообщение в очереди MERGE_WINDOW, так что
+            # к остановке бота оно ещё не отправлено.
+            with mock.patch.object(BotOutboxCfg, "MERGE_WINDOW", 0.2):
+                start_bot.outbox.enqueue(-100, "Бот выключается",
+                                         merge_key="bye")
+                await stop_webhook_bot(application)
+
+        self.assertEqual(sent, ["Бот выключается"])
+        self.assertFalse(start_bot.outbox.running)
+
+
+class TelegramWebhookTest(SimpleTestCase):
+    def setUp(self):
+        self.queue = asyncio.Queue()
+        self.django_scopes = []
+
+        async def django_app(scope, receive, send):
+            self.django_scopes.append(scope)
+            await send({"type": "http.response.start", "status": 200,
+                        "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+
+        async def startup():
+            return mock.Mock(bot=Bot("123:ABC"), update_queue=self.queue)
+
+        self.shutdown = mock.AsyncMock()
+        self.app = TelegramWebhook(django_app, "s3cret", startup=startup,
+                                   shutdown=self.shutdown)
+
+    async def _lifespan(self, event):
+        communicator = ApplicationCommunicator(
+            self.app, {"type": "lifespan"})
+        await communicator.send_input({"type": f"lifespan.{event}"})
+        return await communicator.receive_output()
+
+    async def _post(self, path, body, secret=b"s3cret", method="POST"):
+        communicator = ApplicationCommunicator(self.app, {
+            "type": "http", "method": method, "path": path,
+            "headers": [(b"x-telegram-bot-api-secret-token", secret)],
+        })
+        await communicator.send_input({"type": "http.request",
+                                       "body": body})
+        response = await communicator.receive_output()
+        await communicator.receive_output()
+        return response["status"]
+
+    async def test_fake_updates_reach_update_queue(self):
+        payload = json.dumps(make_fake_update("/join Ромашка", user_id=7))
+        # До lifespan.startup бот ещё не поднят.
+        self.assertEqual(await self._post("/telegram/webhook/",
+                                          payload.encode()), 503)
+        self.assertEqual(await self._lifespan("startup"),
+                         {"type": "lifespan.startup.complete"})
+
+        self.assertEqual(await self._post(
+            "/telegram/webhook/", payload.encode(), secret=b"wrong"), 403)
+        self.assertEqual(await self._post(
+            "/telegram/webhook/", b"", method="GET"), 405)
+        self.assertEqual(await self._post(
+            "/telegram/webhook/", b"not json"), 400)
+        self.assertTrue(self.queue.empty())
+
+        self.assertEqual(await self._post(
+            "/telegram/webhook/", payload.encode()), 200)
+        update = self.queue.get_nowait()
+        self.assertEqual(update.effective_user.id, 7)
+        self.assertEqual(update.effective_message.text, "/join Ромашка")
+
+        self.assertEqual(await self._post("/catbot/", b""), 200)
+        self.assertEqual(self.django_scopes[0]["path"], "/catbot/")
+
+        await self._lifespan("shutdown")
+        self.shutdown.assert_awaited_once()
+
+
+class PerUserUpdateProcessorTest(SimpleTestCase):
+    """Нагрузочный прогон: синтетические обновления через Application."""
+
+    USERS = 10
+    UPDATES_PER_USER = 5
+    CAP = 4
+
+    async def test_users_run_in_parallel_but_in_order(self):
+        processor = PerUserUpdateProcessor(self.CAP)
+        application = (ApplicationBuilder().token("123:ABC").updater(None)
+                       .concurrent_updates(processor).build())
+        running, peak, seen = 0, 0, {}
+
+        async def handler(update, context):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            seen.setdefault(update.effective_user.id, []).append(
+                int(update.effective_message.text.split()[1]))
+            running -= 1
+
+        application.add_handler(MessageHandler(filters.TEXT, handler))
+        updates = [
+            Update.de_json(make_fake_update(
+                f"/join {i}", update_id=i * self.USERS + user,
+                user_id=user, chat_id=user), application.bot)
+            for i in range(self.UPDATES_PER_USER)
+            for user in range(self.USERS)
+        ]
+
+        async def processed():
+            while sum(map(len, seen.values())) < len(updates):
+                await asyncio.sleep(0.005)
+
+        async def get_me(bot, *args, **kwargs):
+            bot._bot_user = User(1, "Cat", True, username="cat_bot")
+            return bot._bot_user
+
+        with mock.patch.object(ExtBot, "get_me", get_me):
+            async with application:
+                await application.start()
+                for update in updates:
+                    application.update_queue.put_nowait(update)
+                try:
+                    await asyncio.wait_for(processed(), timeout=10)
+                finally:
+                    await application.stop()
+
+        self.assertEqual(peak, self.CAP)
+        self.assertEqual(seen, {
+            user: list(range(self.UPDATES_PER_USER))
+            for user in range(self.USERS)
+        })
+        self.assertEqual(processor.active_keys, 0)
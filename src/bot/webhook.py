@@ -0,0 +1,180 @@
+"""
+Режим webhook: Telegram присылает обновления в то же ASGI-приложение,
+что обслуживает сайт (config.asgi), отдельный процесс start_bot не нужен.
+
+TelegramWebhook оборачивает Django: POST на BotWebhookCfg.PATH с верным
+секретом (заголовок X-Telegram-Bot-Api-Secret-Token) превращается в
+Update и кладётся в application.update_queue, остальные запросы уходят
+в Django. Бот запускается и останавливается по событиям lifespan, поэтому
+uvicorn должен работать с одним воркером: иначе каждый воркер поднимет
+свой планировщик и очередь сообщений.
+"""
+import hmac
+import json
+import logging
+from typing import Awaitable, Callable, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from telegram import Update
+
+from bot.management.core.bot_constants import BotWebhookCfg
+from bot.management.core.bot_instance import (
+    initialize_bot_application,
+    shutdown_bot_application,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def make_fake_update(text: str, update_id: int = 1, user_id: int = 1,
+                     chat_id: int = 1, username: str = "tester") -> dict:
+    """Минимальное обновление с текстовым сообщением для локальных проверок."""
+    entities = []
+    if text.startswith("/"):
+        entities.append({"type": "bot_command", "offset": 0,
+                         "length": len(text.split()[0])})
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False,
+                     "first_name": username, "username": username},
+            "text": text,
+            "entities": entities,
+        },
+    }
+
+
+async def start_webhook_bot():
+    """Поднимает бота в процессе ASGI и регистрирует webhook в Telegram."""
+    from bot.management.commands.start_bot import configure_application
+
+    if not settings.TELEGRAM_WEBHOOK_SECRET:
+        raise ImproperlyConfigured(
+            "Для режима webhook нужен TELEGRAM_WEBHOOK_SECRET")
+    application = await sync_to_async(configure_application)()
+    await initialize_bot_application()
+    await application.post_init(application)
+    url = settings.TELEGRAM_WEBHOOK_URL.rstrip("/") + BotWebhookCfg.PATH
+    await application.bot.set_webhook(
+        url=url,
+        secret_token=settings.TELEGRAM_WEBHOOK_SECRET,
+        allowed_updates=Update.ALL_TYPES,
+    )
+    logger.info(f"Бот запущен в режиме webhook: {url}")
+    return application
+
+
+async def stop_webhook_bot(application) -> None:
+    """
+    Останавливает бота. Очередь сообщений досылается в post_stop (внутри
+    shutdown_bot_application), HTTP-сессия закрывается в post_shutdown.
+    Webhook в Telegram не снимается.
+    """
+    await shutdown_bot_application()
+    await application.post_shutdown(application)
+    logger.info("Бот в режиме webhook остановлен")
+
+
+class TelegramWebhook:
+    """ASGI-обёртка: принимает обновления Telegram, остальное - в app."""
+
+    def __init__(self, app, secret_token: str,
+                 startup: Callable[[], Awaitable],
+                 shutdown: Callable[..., Awaitable],
+                 path: str = BotWebhookCfg.PATH):
+        self.app = app
+        self.path = path
+        self._secret = secret_token.encode()
+        self._startup = startup
+        self._shutdown = shutdown
+        self.application = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http" and scope["path"] == self.path:
+            await self._handle_update(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
+
+    async def _lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    self.application = await self._startup()
+                except Exception as e:
+                    logger.error(f"Не удалось запустить бота: {e}",
+                                 exc_info=True)
+                    await send({"type": "lifespan.startup.failed",
+                                "message": str(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self.application is not None:
+                    await self._shutdown(self.application)
+                    self.application = None
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _handle_update(self, scope, receive, send) -> None:
+        if scope["method"] != "POST":
+            await _respond(send, 405)
+            return
+        token = dict(scope["headers"]).get(BotWebhookCfg.SECRET_HEADER, b"")
+        if not hmac.compare_digest(token, self._secret):
+            logger.warning("Webhook: неверный секретный токен")
+            await _respond(send, 403)
+            return
+        if self.application is None:
+            await _respond(send, 503)
+            return
+        body = await _read_body(receive)
+        if body is None:
+            await _respond(send, 413)
+            return
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            logger.warning(f"Webhook: некорректное обновление: {e}")
+            await _respond(send, 400)
+            return
+        await self.application.update_queue.put(update)
+        await _respond(send, 200)
+
+
+async def _read_body(receive) -> Optional[bytes]:
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if len(body) > BotWebhookCfg.MAX_BODY_SIZE:
+            return None
+        if not message.get("more_body"):
+            return body
+
+
+async def _respond(send, status: int) -> None:
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"text/plain; charset=utf-8")],
+    })
+    await send({"type": "http.response.body", "body": b""})
+
+
+def wrap_asgi(app):
+    """Подключает webhook к ASGI-приложению, если он настроен."""
+    if not settings.TELEGRAM_WEBHOOK_URL:
+        return app
+    return TelegramWebhook(
+        app,
+        secret_token=settings.TELEGRAM_WEBHOOK_SECRET,
+        startup=start_webhook_bot,
+        shutdown=stop_webhook_bot,
+    )
@@ -5,3 +5,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
 
 application = get_asgi_application()
+
+# Импорт после настройки Django: модуль бота обращается к моделям.
+from bot.webhook import wrap_asgi  # noqa: E402
+
+application = wrap_asgi(application)
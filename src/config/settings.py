@@ -11,6 +11,9 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = os.getenv("SECRET_KEY")
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TELEGRAM_PROXY_URL = os.getenv("TELEGRAM_PROXY_URL", None)
+# Режим webhook: публичный адрес сайта, без него бот работает через polling.
+TELEGRAM_WEBHOOK_URL = os.getenv("TELEGRAM_WEBHOOK_URL", "")
+TELEGRAM_WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET", "")
 VOTE_SALT = os.getenv("VOTE_SALT")
 
 DEBUG = os.getenv("DEBUG") == "True"
@@ -277,6 +280,16 @@ CKEDITOR_5_CONFIGS = {
 
 YANDEX_METRIKA_COUNTER_ID = os.getenv("YANDEX_METRIKA_COUNTER_ID")
 
+# Журнал выдачи достижений (bot.Achievement). Профиль и статистика читают
+# UserAchievementCounter; журнал нужен для аудита и пересчёта сезонов
+# (rebuild_season_ranks, simulate_xp) и чистится prune_achievement_log.
+ACHIEVEMENT_AUDIT_LOG = os.getenv("ACHIEVEMENT_AUDIT_LOG", "True") == "True"
+
+# Сколько обновлений Telegram бот обрабатывает одновременно. Обновления
+# одного пользователя всё равно идут строго по очереди.
+TELEGRAM_MAX_CONCURRENT_UPDATES = int(
+    os.getenv("TELEGRAM_MAX_CONCURRENT_UPDATES", "16"))
+
 if not DEBUG:
     SESSION_COOKIE_SECURE = True
     CSRF_COOKIE_SECURE = True
@@ -1,6 +1,6 @@
 """Константы и конфигурации моделей приложения Cat-Time-Bot."""
 
-from django.db.models import Index
+from django.db.models import Index, Q, UniqueConstraint
 
 VERSION = "0.6.6 alpha"
 SITE_HEADER = f"Cat-Time-Bot {VERSION}"
@@ -28,6 +28,21 @@ class UserActivityCfg:
     EDITED_DEFAULT = False
     EDIT_COUNT_DEFAULT = 0
     EDIT_COUNT_V = "Счетчик правок"
+    JOIN_DATE_V = "Дата прибытия (МСК)"
+    INDEXES = [
+        Index(fields=["user_id", "leave_time"]),
+        Index(fields=["user_id", "join_date"]),
+        Index(fields=["company", "join_date"]),
+        Index(fields=["join_date"]),
+        Index(fields=["leave_time"]),
+    ]
+    CONSTRAINTS = [
+        UniqueConstraint(
+            fields=["user_id"],
+            condition=Q(leave_time__isnull=True),
+            name="unique_open_activity_per_user",
+        ),
+    ]
 
 
 class UserRankCfg:
@@ -71,6 +86,24 @@ class AchievementCfg:
     META_PL_NAME = "Достижения"
 
 
+class UserAchievementCounterCfg:
+    USER_ID_V = "Telegram ID"
+    USERNAME_V = "Имя пользователя Telegram"
+    ACHIEVEMENT_NAME_V = "Название достижения"
+    COUNT_V = "Сколько раз получено"
+    FIRST_AT_V = "Впервые получено"
+    LAST_AT_V = "Последний раз получено"
+    META_NAME = "Счётчик достижения"
+    META_PL_NAME = "Счётчики достижений"
+    CONSTRAINTS = [
+        UniqueConstraint(
+            fields=["user_id", "achievement_name"],
+            name="unique_achievement_counter_user_name",
+        ),
+    ]
+    INDEXES = [Index(fields=["last_at"])]
+
+
 class DailyStatisticsCfg:
     USER_ID_V = "Telegram ID"
     USERNAME_V = "Имя пользователя Telegram"
@@ -79,6 +112,43 @@ class DailyStatisticsCfg:
     TOTAL_TRIPS_V = "Общее количество выездов"
     META_NAME = "Дневная статистика"
     META_PL_NAME = "Дневная статистика"
+    CONSTRAINTS = [
+        UniqueConstraint(
+            fields=["user_id", "date"],
+            name="unique_daily_statistics_user_date",
+        ),
+    ]
+
+
+class ActivityRollupCfg:
+    DATE_V = "Дата"
+    USER_ID_V = "Telegram ID"
+    USERNAME_V = "Имя пользователя Telegram"
+    COMPANY_V = "Организация"
+    TRIPS_V = "Выездов"
+    TOTAL_SECONDS_V = "Время в организации, сек."
+    EXPERIENCE_V = "Получено опыта"
+    META_NAME = "Сводка выездов за день"
+    META_PL_NAME = "Сводки выездов по дням"
+    CONSTRAINTS = [
+        UniqueConstraint(
+            fields=["date", "user_id", "company"],
+            name="unique_activity_rollup_date_user_company",
+        ),
+    ]
+    INDEXES = [Index(fields=["user_id", "date"])]
+
+
+class ScheduledJobCfg:
+    JOB_ID_V = "Задание"
+    HOUR_V = "Час"
+    MINUTE_V = "Минута"
+    ARGS_V = "Аргументы"
+    LAST_RUN_AT_V = "Последний запуск"
+    UPDATED_AT_V = "Изменено"
+    META_NAME = "Задание планировщика"
+    META_PL_NAME = "Задания планировщика"
+    MAX_LEN_JOB_ID = 64
 
 
 class QuoteCfg:
@@ -5,8 +5,17 @@ from typing import Any, Dict, List
 
 import requests
 from django.http import HttpRequest
+from requests.adapters import HTTPAdapter
 from ua_parser import user_agent_parser
 
+IPWHOIS_URL = "https://ipwhois.app/json/{ip}?lang=ru"
+
+# Общая сессия на процесс: соединение с ipwhois.app (TCP + TLS)
+# переиспользуется между запросами вместо нового на каждый вызов.
+_http_session = requests.Session()
+_http_session.mount(
+    "https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
 
 def get_client_ip(request: HttpRequest) -> str:
     """Получает IP-адрес клиента с учетом прокси."""
@@ -161,8 +170,8 @@ def get_ip_info(host_input):
     if not ip_address:
         return None, f"Не удалось найти IP для '{host_input}'. Проверьте правильность адреса." # noqa
     try:
-        url = f"https://ipwhois.app/json/{ip_address}?lang=ru"
-        response = requests.get(url, timeout=5)
+        url = IPWHOIS_URL.format(ip=ip_address)
+        response = _http_session.get(url, timeout=5)
         response.raise_for_status()
         data = response.json()
         if not data.get('success', True):